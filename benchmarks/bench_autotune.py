@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015-2016 Mark Spicer
+# Made available under the MIT license.
+"""Auto-tunes the PID controller of a simulated SR700 with
+freshroastsr700.autotune(), on a clock.VirtualClock, then scores the
+gains found against the default ones on the profile of
+examples/pid_tune_aid.py with tuning.sweep().
+
+Usage: python benchmarks/bench_autotune.py [target_temp] [rule]
+"""
+
+import sys
+import time
+
+import freshroastsr700
+from freshroastsr700 import autotune
+from freshroastsr700 import backend
+from freshroastsr700 import clock
+from freshroastsr700 import simulator
+from freshroastsr700 import tuning
+
+
+def main():
+    target_temp = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    rule = sys.argv[2] if len(sys.argv) > 2 else 'ziegler_nichols'
+    virtual = clock.VirtualClock()
+    sim = simulator.Simulator()
+    device = sim.add(clock=virtual.monotonic)
+    roaster = freshroastsr700.freshroastsr700(
+        backend=backend.THREAD, port=device.port, thermostat=True,
+        clock=virtual)
+    roaster.connect()
+    roaster.apply(fan_speed=5)
+    start = time.perf_counter()
+    clock_start = virtual.monotonic()
+    roaster.autotune(target_temp=target_temp, rule=rule)
+    while roaster.autotune_state == autotune.AT_RUNNING:
+        time.sleep(0.01)
+    elapsed = time.perf_counter() - start
+    clock_elapsed = virtual.monotonic() - clock_start
+    result = roaster.autotune_result
+    roaster.terminate()
+    sim.close()
+    if result is None:
+        print('autotune failed after %.1f s' % clock_elapsed)
+        return
+    print('autotune: %.1f s in %.2f s real, Ku %.3f, Tu %.1f s, '
+          'amplitude %.1f degF' % (
+              clock_elapsed, elapsed, result.ultimate_gain,
+              result.ultimate_period, result.amplitude))
+    table = tuning.sweep(simulator.ThermalModel(),
+                         [0.06, result.kp], [0.0075, result.ki],
+                         [0.01, result.kd])
+    for row in sorted(table, key=lambda row: row['kp'] != result.kp):
+        print('kp %.4f ki %.5f kd %.4f: overshoot %.0f degF, settling '
+              '%.1f s, IAE %.0f degF.s' % tuple(row)[:6])
+
+
+if __name__ == '__main__':
+    main()
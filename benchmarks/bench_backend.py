@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015-2016 Mark Spicer
+# Made available under the MIT license.
+"""Compares the construction time and memory use of freshroastsr700 objects
+on the process and thread backends.
+
+Memory is the resident set size of this process plus that of every child
+process, read from /proc, so this benchmark only runs on Linux.
+
+Usage: python benchmarks/bench_backend.py [number_of_roasters]
+"""
+
+import os
+import sys
+import time
+import multiprocessing as mp
+
+import freshroastsr700
+from freshroastsr700 import backend
+
+
+def rss_kb(pid):
+    with open('/proc/%d/status' % pid) as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+
+def total_rss_kb():
+    pids = [os.getpid()] + [child.pid for child in mp.active_children()]
+    return sum(rss_kb(pid) for pid in pids)
+
+
+def measure(name, number_of_roasters):
+    rss_before = total_rss_kb()
+    start = time.perf_counter()
+    roasters = [freshroastsr700.freshroastsr700(backend=name)
+                for _ in range(number_of_roasters)]
+    # engines are only started on connect, which needs hardware
+    for roaster in roasters:
+        roaster._start_comm()
+    elapsed = time.perf_counter() - start
+    rss_after = total_rss_kb()
+    for roaster in roasters:
+        roaster.terminate()
+    print('%-8s %8.2f ms/roaster %8.0f kB/roaster' % (
+        name, elapsed * 1e3 / number_of_roasters,
+        (rss_after - rss_before) / float(number_of_roasters)))
+
+
+def main(number_of_roasters=10):
+    measure(backend.PROCESS, number_of_roasters)
+    measure(backend.THREAD, number_of_roasters)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015-2016 Mark Spicer
+# Made available under the MIT license.
+"""Runs a whole thermostat roast (held at 430degF, then cooled) against
+a simulated SR700, on a clock.VirtualClock and on a clock.ScaledClock,
+and reports how much faster than real time each ran, and where the
+roast ended.
+
+Usage: python benchmarks/bench_clock.py [roast_seconds] [scale]
+"""
+
+import sys
+import time
+import threading
+
+import freshroastsr700
+from freshroastsr700 import backend
+from freshroastsr700 import clock
+from freshroastsr700 import simulator
+
+
+def measure(name, roast_clock, roast_seconds):
+    sim = simulator.Simulator()
+    device = sim.add(clock=roast_clock.monotonic)
+    done = threading.Event()
+    roaster = freshroastsr700.freshroastsr700(
+        backend=backend.THREAD, port=device.port, thermostat=True,
+        state_transition_func=done.set, clock=roast_clock)
+    roaster.connect()
+    start = time.perf_counter()
+    clock_start = roast_clock.monotonic()
+    roaster.apply(state='roasting', fan_speed=1, target_temp=430,
+                  time_remaining=roast_seconds)
+    done.wait()
+    top = roaster.current_temp
+    done.clear()
+    roaster.apply(state='cooling', fan_speed=9, time_remaining=180)
+    done.wait()
+    elapsed = time.perf_counter() - start
+    clock_elapsed = roast_clock.monotonic() - clock_start
+    stats = roaster.stats()
+    roaster.terminate()
+    sim.close()
+    print('%-8s %7.1f s in %6.2f s real (x%5.0f) %5d packets, '
+          'top %d degF, cooled to %d degF, %d overruns' % (
+              name, clock_elapsed, elapsed, clock_elapsed / elapsed,
+              device.packets, top, roaster.current_temp,
+              stats['overruns']))
+
+
+def main():
+    roast_seconds = int(sys.argv[1]) if len(sys.argv) > 1 else 540
+    scale = float(sys.argv[2]) if len(sys.argv) > 2 else 50.0
+    measure('virtual', clock.VirtualClock(), roast_seconds)
+    measure('scaled', clock.ScaledClock(scale), roast_seconds)
+
+
+if __name__ == '__main__':
+    main()
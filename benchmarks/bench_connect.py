@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015-2016 Mark Spicer
+# Made available under the MIT license.
+"""Measures how long connect() takes to return, and the time from the
+connect() call to the first packet decoded, against a simulated roaster
+that answers every packet right away, on both backends.
+
+Then measures the handshake, against a simulated roaster that takes as
+long as a real one to send its recipe at 9600 baud: how long connect()
+takes with the recipe readback, and with fast_connect.
+
+Usage: python benchmarks/bench_connect.py [number_of_connects]
+"""
+
+import sys
+import time
+import functools
+import threading
+
+import freshroastsr700
+from freshroastsr700 import backend
+
+
+PACKET = b'\xAA\xAA\x61\x74\x00\x04\x02\x09\x32\x03\x01\x60\xAA\xFA'
+READBACK = (
+    b'\xAA\xAA\x61\x74\xA0\x00\x00\x09\x3B\x02\x00\x00\xAA\xFA'
+    b'\xAA\xAA\x61\x74\xAA\x00\x00\x09\x03\x03\x00\x00\xAA\xFA'
+    b'\xAA\xAA\x61\x74\xAA\x00\x00\x09\x01\x02\x00\x00\xAA\xFA'
+    b'\xAA\xAA\x61\x74\xAF\x00\x00\x09\x1C\x00\x00\x00\xAA\xFA')
+# seconds a byte takes on the wire at 9600 baud, 8 data bits, 1.5 stop bits
+BYTE_TIME = 10.5 / 9600
+
+
+class FakeSerial(object):
+    def __init__(self):
+        self._pending = b''
+        self._lock = threading.Lock()
+
+    @property
+    def in_waiting(self):
+        return len(self._pending)
+
+    def read(self, size):
+        with self._lock:
+            data, self._pending = (
+                self._pending[:size], self._pending[size:])
+        return data
+
+    def write(self, data):
+        with self._lock:
+            self._pending += PACKET
+
+    def close(self):
+        pass
+
+
+class SlowSerial(FakeSerial):
+    # answers the initialization packet with a recipe, and every packet
+    # only once it would have been transmitted
+    def __init__(self):
+        super(SlowSerial, self).__init__()
+        self._replies = []
+
+    def write(self, data):
+        reply = READBACK if bytes(data[:2]) == b'\xAA\x55' else PACKET
+        ready = time.monotonic() + (len(data) + len(reply)) * BYTE_TIME
+        with self._lock:
+            self._replies.append((ready, reply))
+
+    @property
+    def in_waiting(self):
+        now = time.monotonic()
+        with self._lock:
+            while self._replies and self._replies[0][0] <= now:
+                self._pending += self._replies.pop(0)[1]
+        return len(self._pending)
+
+
+def fake_connect(roaster):
+    def connect():
+        roaster._ser = FakeSerial()
+    return connect
+
+
+def measure(name, number_of_connects):
+    roaster = freshroastsr700.freshroastsr700(backend=name)
+    roaster._connect = fake_connect(roaster)
+    # the engine is started by the first connect, start it beforehand so
+    # only the connection itself is measured
+    roaster._start_comm()
+    time.sleep(0.5)
+    connect_times = []
+    for _ in range(number_of_connects):
+        count = roaster.stats()['connect_to_first_packet']['count']
+        start = time.perf_counter()
+        roaster.connect()
+        connect_times.append(time.perf_counter() - start)
+        while roaster.stats()['connect_to_first_packet']['count'] == count:
+            time.sleep(0.001)
+        roaster.disconnect()
+        while roaster.connected:
+            time.sleep(0.001)
+        # let the engine go back to sleep
+        time.sleep(0.05)
+    first_packet = roaster.stats()['connect_to_first_packet']
+    roaster.terminate()
+    print('%-8s connect() %7.2f ms   to first packet %7.2f ms '
+          '(max %7.2f ms)' % (
+              name, sum(connect_times) * 1e3 / len(connect_times),
+              first_packet['mean'] * 1e3, first_packet['max'] * 1e3))
+
+
+def measure_handshake(fast_connect, number_of_connects):
+    roaster = freshroastsr700.freshroastsr700(
+        backend=backend.THREAD, fast_connect=fast_connect)
+    # the real _connect(), on a simulated port
+    roaster._open_port = lambda port: SlowSerial()
+    roaster._connect = functools.partial(roaster._connect, 'sim')
+    roaster._start_comm()
+    connect_times = []
+    for _ in range(number_of_connects):
+        start = time.perf_counter()
+        roaster.connect()
+        connect_times.append(time.perf_counter() - start)
+        roaster.disconnect()
+        while roaster.connected:
+            time.sleep(0.001)
+    ready = roaster.stats()['connect_to_ready']
+    roaster.terminate()
+    print('%-12s connect() %7.2f ms   to ready %7.2f ms' % (
+        'fast' if fast_connect else 'readback',
+        sum(connect_times) * 1e3 / len(connect_times),
+        ready['mean'] * 1e3))
+
+
+def main():
+    number_of_connects = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    for name in (backend.PROCESS, backend.THREAD):
+        measure(name, number_of_connects)
+    for fast_connect in (False, True):
+        measure_handshake(fast_connect, number_of_connects)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015-2016 Mark Spicer
+# Made available under the MIT license.
+"""Measures the cost of looking for the roaster on this computer: a full
+pyserial enumeration (comports_lookup(), what auto_connect() used to do
+every quarter of a second), a sysfs scan (discovery.scan()), and a lookup
+in a discovery.DeviceIndex, which is all a hotplug monitor does between
+hotplug events.
+
+Usage: python benchmarks/bench_discovery.py [number_of_lookups]
+"""
+
+import re
+import sys
+import time
+
+from freshroastsr700 import discovery
+from freshroastsr700 import exceptions
+
+
+def comports_lookup(vidpid):
+    """The lookup auto_connect() used to make: a pyserial enumeration of
+    the serial ports, searched for a device with the given VID:PID."""
+    from serial.tools import list_ports
+    for port in list_ports.comports():
+        if re.search(vidpid, port[2], flags=re.IGNORECASE):
+            return port[0]
+    raise exceptions.RoasterLookupError
+
+
+def scan_lookup(vidpid):
+    """A single sysfs scan, searched for a device with the given
+    VID:PID."""
+    return discovery.DeviceIndex(discovery.scan()).find(vidpid)
+
+
+def measure(name, func, number_of_lookups):
+    start = time.perf_counter()
+    for _ in range(number_of_lookups):
+        try:
+            func()
+        except exceptions.RoasterLookupError:
+            pass
+    elapsed = time.perf_counter() - start
+    print('%-12s %10.1f us/lookup' % (
+        name, elapsed * 1e6 / number_of_lookups))
+
+
+def main():
+    number_of_lookups = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    index = discovery.DeviceIndex(discovery.scan())
+    print('%d USB serial devices' % len(index.devices()))
+    measure('comports', lambda: comports_lookup(discovery.SR700_VIDPID),
+            number_of_lookups)
+    measure('sysfs scan', lambda: scan_lookup(discovery.SR700_VIDPID),
+            number_of_lookups)
+    measure('index', lambda: index.find(discovery.SR700_VIDPID),
+            number_of_lookups)
+
+
+if __name__ == '__main__':
+    main()
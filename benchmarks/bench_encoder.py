@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015-2016 Mark Spicer
+# Made available under the MIT license.
+"""Compares the packet concatenation freshroastsr700._generate_packet used to
+do with protocol.PacketEncoder.
+
+The sequence of packets mimics a roast: time_remaining changes once per
+second (every fourth packet) and the heat setting toggles every other
+packet, as the software heater does at mid-level output.
+
+Then compares whole packet cycles of a roaster, from the shared state to
+the packet: a fresh state snapshot and bytes copy of current_state per
+packet, as _generate_packet used to take, with _generate_packet itself.
+tracemalloc gives the memory allocated by each cycle, as the peak over
+what was allocated when the cycle started, less that of an empty cycle.
+Both still allocate the odd int and float (the sequence number of the
+state, the time), which a cycle cannot do without.
+
+Usage: python benchmarks/bench_encoder.py [number_of_packets]
+"""
+
+import sys
+import time
+import struct
+import tracemalloc
+
+import freshroastsr700
+from freshroastsr700 import backend
+from freshroastsr700 import protocol
+from freshroastsr700 import state
+from freshroastsr700 import utils
+
+
+def legacy_packet(header, temp_unit, flags, state, fan_speed,
+                  time_remaining, heat_setting):
+    roaster_time = utils.seconds_to_float(time_remaining)
+    return (
+        header +
+        temp_unit +
+        flags +
+        state +
+        struct.pack(">B", fan_speed) +
+        struct.pack(">B", int(round(roaster_time * 10.0))) +
+        struct.pack(">B", heat_setting) +
+        b'\x00\x00' +
+        protocol.FOOTER)
+
+
+def run_legacy(fields):
+    for current_state, fan_speed, time_remaining, heat_setting in fields:
+        legacy_packet(protocol.HEADER, b'\x61\x74', b'\x63', current_state,
+                      fan_speed, time_remaining, heat_setting)
+
+
+def run_encoder(fields):
+    encoder = protocol.PacketEncoder()
+    for current_state, fan_speed, time_remaining, heat_setting in fields:
+        encoder.encode(protocol.HEADER, current_state, fan_speed,
+                       time_remaining, heat_setting)
+
+
+def legacy_cycle(roaster):
+    snapshot = roaster._state.snapshot()
+    return roaster._encoder.encode(
+        protocol.HEADER,
+        bytes(snapshot.current_state),
+        snapshot.fan_speed,
+        freshroastsr700._seconds(
+            state.time_remaining_ms(snapshot, roaster._state.clock())),
+        snapshot.heat_setting)
+
+
+def buffer_cycle(roaster):
+    return roaster._generate_packet()
+
+
+def empty_cycle(roaster):
+    pass
+
+
+def peak_allocations(cycle, roaster, settings):
+    """Returns the bytes allocated by cycle(roaster), summed over as many
+    cycles as there are heat settings in settings."""
+    allocated = 0
+    tracemalloc.start()
+    for heat_setting in settings:
+        roaster._state.block.heat_setting = heat_setting
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        cycle(roaster)
+        allocated += tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    return allocated
+
+
+def measure_cycle(name, cycle, number_of_packets):
+    roaster = freshroastsr700.freshroastsr700(backend=backend.THREAD)
+    roaster.apply(state='roasting', fan_speed=9, time_remaining=600)
+    # the shared state changes between cycles as in main()
+    settings = [3 * (i % 2) for i in range(number_of_packets)]
+
+    start = time.perf_counter()
+    for heat_setting in settings:
+        roaster._state.block.heat_setting = heat_setting
+        cycle(roaster)
+    elapsed = time.perf_counter() - start
+
+    allocated = (peak_allocations(cycle, roaster, settings) -
+                 peak_allocations(empty_cycle, roaster, settings))
+
+    print('%-8s %8.0f ns/cycle %8.1f bytes/cycle' % (
+        name, elapsed * 1e9 / number_of_packets,
+        allocated / float(number_of_packets)))
+
+
+def measure(name, func, fields):
+    start = time.perf_counter()
+    func(fields)
+    elapsed = time.perf_counter() - start
+
+    calls = [0]
+
+    def profile(frame, event, arg):
+        if event in ('call', 'c_call'):
+            calls[0] += 1
+
+    sys.setprofile(profile)
+    func(fields)
+    sys.setprofile(None)
+    # do not count the driving loop
+    calls[0] -= 1
+
+    print('%-8s %8.0f ns/packet %6.2f calls/packet' % (
+        name, elapsed * 1e9 / len(fields), calls[0] / float(len(fields))))
+
+
+def main(number_of_packets=100000):
+    fields = [(b'\x04\x02', 9, 600 - (i // 4) % 600, 3 * (i % 2))
+              for i in range(number_of_packets)]
+    measure('legacy', run_legacy, fields)
+    measure('encoder', run_encoder, fields)
+    measure_cycle('snapshot', legacy_cycle, number_of_packets)
+    measure_cycle('buffer', buffer_cycle, number_of_packets)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015-2016 Mark Spicer
+# Made available under the MIT license.
+"""Runs a number of roasters, connected to simulated hardware that answers
+every packet, on the thread backend (a comm thread each) and on a
+fleet.RoasterFleet, and compares threads, memory, CPU time and cycle
+jitter.
+
+Usage: python benchmarks/bench_fleet.py [number_of_roasters] [seconds]
+"""
+
+import sys
+import time
+import resource
+import threading
+
+import freshroastsr700
+from freshroastsr700 import backend
+from freshroastsr700 import fleet
+
+
+PACKET = b'\xAA\xAA\x61\x74\x00\x04\x02\x09\x32\x03\x01\x60\xAA\xFA'
+
+
+class FakeSerial(object):
+    def __init__(self):
+        self._pending = b''
+        self._lock = threading.Lock()
+
+    @property
+    def in_waiting(self):
+        return len(self._pending)
+
+    def read(self, size):
+        with self._lock:
+            data, self._pending = (
+                self._pending[:size], self._pending[size:])
+        return data
+
+    def write(self, data):
+        with self._lock:
+            self._pending += PACKET
+
+    def close(self):
+        pass
+
+
+def fake_connect(roaster):
+    def connect(port=None):
+        roaster._ser = FakeSerial()
+    return connect
+
+
+def rss_kb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+
+def cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def measure(name, make_roasters, seconds):
+    threads_before = threading.active_count()
+    rss_before = rss_kb()
+    roasters, connect, terminate = make_roasters()
+    for roaster in roasters:
+        roaster._connect = fake_connect(roaster)
+    connect()
+    cpu_start = cpu_seconds()
+    time.sleep(seconds)
+    cpu_used = cpu_seconds() - cpu_start
+    threads = threading.active_count() - threads_before
+    rss = rss_kb() - rss_before
+    max_jitter = max(roaster.stats()['max_jitter'] for roaster in roasters)
+    terminate()
+    print('%-8s %4d threads %8d kB %8.3f ms CPU/roaster/s '
+          'max jitter %6.2f ms' % (
+              name, threads, rss,
+              cpu_used * 1e3 / len(roasters) / seconds, max_jitter * 1e3))
+
+
+def main():
+    number_of_roasters = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 5.0
+
+    def threads():
+        roasters = [freshroastsr700.freshroastsr700(backend=backend.THREAD)
+                    for _ in range(number_of_roasters)]
+
+        def connect():
+            for roaster in roasters:
+                roaster.connect()
+
+        def terminate():
+            for roaster in roasters:
+                roaster.terminate()
+        return roasters, connect, terminate
+
+    def roaster_fleet():
+        roaster_fleet = fleet.RoasterFleet()
+        roasters = [roaster_fleet.add() for _ in range(number_of_roasters)]
+        return roasters, roaster_fleet.connect, roaster_fleet.terminate
+
+    measure('thread', threads, seconds)
+    measure('fleet', roaster_fleet, seconds)
+
+
+if __name__ == '__main__':
+    main()
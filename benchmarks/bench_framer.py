@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015-2016 Mark Spicer
+# Made available under the MIT license.
+"""Compares the per-byte response decoder that freshroastsr700 used to run
+in its comm loop with protocol.PacketFramer.
+
+Reports decode throughput, read calls per frame, function calls per frame
+and memory blocks allocated per frame for both paths. Allocations are
+counted as the growth of sys.getallocatedblocks() from one bytecode
+instruction to the next, so a temporary created and freed by a single
+instruction (inside a C call) is missed: the count is a lower bound.
+
+Usage: python benchmarks/bench_framer.py [number_of_frames]
+"""
+
+import io
+import sys
+import time
+import struct
+
+from freshroastsr700 import protocol
+
+
+STATUS = b'\xAA\xAA\x61\x74\x00\x04\x02\x09\x32\x03\x01\x60\xAA\xFA'
+QUIRK = b'\xAA\xAA\x61\x74\x00\x04\x02\x09\x32\x03\x00\xFA'
+
+
+class FakeSerial(object):
+    """Just enough of serial.Serial to drive both decoders."""
+    def __init__(self, data):
+        self._stream = io.BytesIO(data)
+        self._left = len(data)
+        self.read_calls = 0
+
+    @property
+    def in_waiting(self):
+        return self._left
+
+    def read(self, size=1):
+        self.read_calls += 1
+        data = self._stream.read(size)
+        self._left -= len(data)
+        return data
+
+
+class LegacyDecoder(object):
+    """The byte-at-a-time state machine formerly found in
+    freshroastsr700._process_reponse_byte, minus the logging."""
+    LOOKING_FOR_HEADER_1 = 0
+    LOOKING_FOR_HEADER_2 = 1
+    PACKET_DATA = 2
+    LOOKING_FOR_FOOTER_2 = 3
+
+    def __init__(self):
+        self.frames = 0
+
+    def run(self, ser):
+        read_state = self.LOOKING_FOR_HEADER_1
+        r = []
+        while ser.in_waiting:
+            _byte = ser.read(1)
+            read_state, r = self.process_byte(read_state, _byte, r)
+
+    def process_byte(self, read_state, _byte, r):
+        if self.LOOKING_FOR_HEADER_1 == read_state:
+            if b'\xAA' == _byte:
+                read_state = self.LOOKING_FOR_HEADER_2
+        elif self.LOOKING_FOR_HEADER_2 == read_state:
+            if b'\xAA' == _byte:
+                read_state = self.PACKET_DATA
+                r = []
+            else:
+                read_state = self.LOOKING_FOR_HEADER_1
+        elif self.PACKET_DATA == read_state:
+            if b'\xAA' == _byte:
+                read_state = self.LOOKING_FOR_FOOTER_2
+            else:
+                r.append(_byte)
+                if(len(r) == 10 and b'\xFA' == _byte):
+                    read_state, r = self.process_byte(read_state, b'\xAA', r)
+                    read_state, r = self.process_byte(read_state, b'\xFA', r)
+        elif self.LOOKING_FOR_FOOTER_2 == read_state:
+            if b'\xFA' == _byte:
+                if len(r) == 10:
+                    struct.unpack(">H", b''.join(r[8:10]))
+                    self.frames += 1
+                read_state = self.LOOKING_FOR_HEADER_1
+            else:
+                r.append(b'\xAA')
+                read_state = self.PACKET_DATA
+                read_state, r = self.process_byte(read_state, _byte, r)
+        return read_state, r
+
+
+def run_legacy(ser):
+    decoder = LegacyDecoder()
+    decoder.run(ser)
+    return decoder.frames
+
+
+def run_framer(ser):
+    framer = protocol.PacketFramer()
+    frames = 0
+    # one read per comm cycle; a cycle normally holds a single frame, so
+    # feed the framer in cycle sized chunks like the comm loop does
+    while ser.in_waiting:
+        framer.feed(ser.read(min(ser.in_waiting, 64)))
+        for payload in framer.frames():
+            protocol.payload_temp(payload)
+            frames += 1
+    return frames
+
+
+def count_allocations(func, *args):
+    """Calls func(*args), and returns the number of memory blocks it
+    allocated, as a lower bound (see the module docstring)."""
+    get_blocks = sys.getallocatedblocks
+    # [blocks allocated, blocks in use at the previous instruction]
+    counts = [0, 0]
+
+    def trace(frame, event, arg):
+        frame.f_trace_opcodes = True
+        blocks = get_blocks()
+        if blocks > counts[1]:
+            counts[0] += blocks - counts[1]
+        counts[1] = blocks
+        return trace
+
+    counts[1] = get_blocks()
+    sys.settrace(trace)
+    func(*args)
+    sys.settrace(None)
+    return counts[0]
+
+
+def measure(name, func, data, frames):
+    ser = FakeSerial(data)
+    start = time.perf_counter()
+    decoded = func(ser)
+    elapsed = time.perf_counter() - start
+    assert decoded == frames, '%s decoded %d of %d frames' % (
+        name, decoded, frames)
+
+    calls = [0]
+
+    def profile(frame, event, arg):
+        if event in ('call', 'c_call'):
+            calls[0] += 1
+
+    ser = FakeSerial(data)
+    sys.setprofile(profile)
+    func(ser)
+    sys.setprofile(None)
+
+    allocations = count_allocations(func, FakeSerial(data))
+
+    print('%-8s %10.0f bytes/s %8.0f frames/s %6.2f reads/frame '
+          '%6.1f calls/frame %6.1f blocks/frame' % (
+              name, len(data) / elapsed, frames / elapsed,
+              ser.read_calls / float(frames), calls[0] / float(frames),
+              allocations / float(frames)))
+
+
+def main(number_of_frames=20000):
+    # one quirk packet every 16 frames, like a roast crossing 250degF
+    data = b''.join(
+        QUIRK if i % 16 == 15 else STATUS for i in range(number_of_frames))
+    measure('legacy', run_legacy, data, number_of_frames)
+    measure('framer', run_framer, data, number_of_frames)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
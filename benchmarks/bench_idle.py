@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015-2016 Mark Spicer
+# Made available under the MIT license.
+"""Measures the CPU time used by idle freshroastsr700 objects, which are
+constructed but never connected, on both backends.
+
+Usage: python benchmarks/bench_idle.py [number_of_roasters] [seconds]
+"""
+
+import sys
+import time
+import resource
+
+import freshroastsr700
+from freshroastsr700 import backend
+
+
+def cpu_seconds(who):
+    usage = resource.getrusage(who)
+    return usage.ru_utime + usage.ru_stime
+
+
+def measure(name, number_of_roasters, seconds):
+    children_before = cpu_seconds(resource.RUSAGE_CHILDREN)
+    roasters = [freshroastsr700.freshroastsr700(backend=name)
+                for _ in range(number_of_roasters)]
+    # engines are only started on connect, which needs hardware
+    for roaster in roasters:
+        roaster._start_comm()
+    # do not count construction
+    self_start = cpu_seconds(resource.RUSAGE_SELF)
+    time.sleep(seconds)
+    self_used = cpu_seconds(resource.RUSAGE_SELF) - self_start
+    for roaster in roasters:
+        roaster.terminate()
+    # child process CPU time is only known once they are reaped
+    children_used = cpu_seconds(resource.RUSAGE_CHILDREN) - children_before
+    if name == backend.THREAD:
+        used = self_used
+    else:
+        used = children_used
+    print('%-8s %8.3f ms CPU/roaster/s' % (
+        name, used * 1e3 / (number_of_roasters * seconds)))
+
+
+def main(number_of_roasters=10, seconds=5):
+    measure(backend.PROCESS, number_of_roasters, seconds)
+    measure(backend.THREAD, number_of_roasters, seconds)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015-2016 Mark Spicer
+# Made available under the MIT license.
+"""Compares the pulse tables of heat_controller with
+modulator.SigmaDeltaModulator: the temperature ripple and heat error of a
+simulated SR700 held at a fixed heater level, the time a new heater level
+waits before it is picked up, and the tracking of the profile of
+examples/pid_tune_aid.py under PID control (with tuning.sweep()).
+
+Usage: python benchmarks/bench_modulator.py [heater_segments]
+"""
+
+import sys
+
+import freshroastsr700
+from freshroastsr700 import modulator
+from freshroastsr700 import simulator
+from freshroastsr700 import tuning
+
+PERIOD = 0.25
+MODULATORS = (
+    (modulator.TABLE, freshroastsr700.heat_controller),
+    (modulator.SIGMA_DELTA, modulator.SigmaDeltaModulator),
+)
+
+
+def ripple(heater_class, segments, level, fan_speed=5, cycles=1200):
+    # peak to peak temperature, and heat error as a fraction of full
+    # heat, over the last third of a long run at a fixed level
+    heater = heater_class(segments)
+    model = simulator.ThermalModel(temp=300)
+    temps = []
+    pulses = 0
+    for cycle in range(cycles):
+        if heater.about_to_rollover():
+            heater.heat_level = level
+        on = heater.generate_bangbang_output()
+        model.step(PERIOD, simulator.ROASTING if on else simulator.COOLING,
+                   fan_speed, 3 if on else 0)
+        if cycle >= cycles * 2 // 3:
+            temps.append(model.temp)
+            pulses += on
+    return (max(temps) - min(temps),
+            abs(pulses / float(len(temps)) - level / float(segments)))
+
+
+def pickup(heater_class, segments):
+    # ticks a level set at each phase of the heater waits before it is
+    # picked up
+    waits = []
+    for phase in range(segments):
+        heater = heater_class(segments)
+        for _ in range(segments + phase):
+            heater.generate_bangbang_output()
+        wait = 0
+        while not heater.about_to_rollover():
+            heater.generate_bangbang_output()
+            wait += 1
+        waits.append(wait)
+    return sum(waits) / float(len(waits)), max(waits)
+
+
+def main():
+    segments = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    for name, heater_class in MODULATORS:
+        # the ripple of the whole levels both can output, and the heat
+        # error of quarter levels, which the tables round
+        ripples = [ripple(heater_class, segments, level)[0]
+                   for level in range(1, segments)]
+        errors = [ripple(heater_class, segments, step / 4.0)[1]
+                  for step in range(1, 4 * segments)]
+        mean_wait, max_wait = pickup(heater_class, segments)
+        print('%-11s ripple mean %.2f max %.2f degF, heat error mean '
+              '%.3f max %.3f, pickup wait mean %.2f s max %.2f s' % (
+                  name, sum(ripples) / len(ripples), max(ripples),
+                  sum(errors) / len(errors), max(errors),
+                  mean_wait * PERIOD, max_wait * PERIOD))
+    for name, _ in MODULATORS:
+        (row,) = tuning.sweep(simulator.ThermalModel(), 0.06, 0.0075, 0.01,
+                              heater_segments=segments, modulation=name)
+        print('%-11s default gains: overshoot %.0f degF, settling %.1f s, '
+              'IAE %.0f degF.s' % ((name,) + tuple(row)[3:6]))
+
+
+if __name__ == '__main__':
+    main()
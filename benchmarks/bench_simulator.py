@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015-2016 Mark Spicer
+# Made available under the MIT license.
+"""Load test: runs a number of thermostat roasters, each on the pty of a
+simulated SR700 (all served by one simulator.Simulator thread), on a
+fleet.RoasterFleet, and reports the packet rate, CPU time and cycle
+jitter. Everything goes through the real port code; nothing is faked.
+
+Usage: python benchmarks/bench_simulator.py [number_of_roasters] [seconds]
+"""
+
+import sys
+import time
+import resource
+
+from freshroastsr700 import fleet
+from freshroastsr700 import simulator
+
+
+def cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def main():
+    number_of_roasters = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 5.0
+    sim = simulator.Simulator()
+    roaster_fleet = fleet.RoasterFleet()
+    devices = []
+    for i in range(number_of_roasters):
+        device = sim.add(model=simulator.ThermalModel(
+            temp=150 + i, noise=1.0, seed=i))
+        devices.append(device)
+        roaster_fleet.add(port=device.port, thermostat=True)
+    start = time.perf_counter()
+    roaster_fleet.connect()
+    print('connected %d roasters in %.1f ms' % (
+        number_of_roasters, (time.perf_counter() - start) * 1e3))
+    for roaster in roaster_fleet:
+        roaster.apply(state='roasting', fan_speed=5, target_temp=400,
+                      time_remaining=600)
+    packets_start = sum(device.packets for device in devices)
+    cpu_start = cpu_seconds()
+    time.sleep(seconds)
+    cpu_used = cpu_seconds() - cpu_start
+    packets = sum(device.packets for device in devices) - packets_start
+    max_jitter = max(roaster.stats()['max_jitter']
+                     for roaster in roaster_fleet)
+    temps = [roaster.current_temp for roaster in roaster_fleet]
+    roaster_fleet.terminate()
+    sim.close()
+    print('%8.1f packets/roaster/s %8.3f ms CPU/roaster/s '
+          'max jitter %6.2f ms' % (
+              packets / number_of_roasters / seconds,
+              cpu_used * 1e3 / number_of_roasters / seconds,
+              max_jitter * 1e3))
+    print('temperatures %d to %d degF' % (min(temps), max(temps)))
+
+
+if __name__ == '__main__':
+    main()
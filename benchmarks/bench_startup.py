@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015-2016 Mark Spicer
+# Made available under the MIT license.
+"""Measures how long importing freshroastsr700 and constructing
+freshroastsr700 objects take, each in a fresh interpreter, and which
+heavy modules they load.
+
+Usage: python benchmarks/bench_startup.py [number_of_roasters]
+"""
+
+import os
+import sys
+import subprocess
+
+
+HEAVY_MODULES = ('serial', 'multiprocessing', 'datetime', 'binascii')
+
+MEASURE = '''
+import sys
+import time
+start = time.perf_counter()
+import freshroastsr700
+imported = time.perf_counter()
+loaded = [m for m in {heavy!r} if m in sys.modules]
+roasters = []
+for _ in range({count:d}):
+    roasters.append(freshroastsr700.freshroastsr700(**{kwargs!r}))
+constructed = time.perf_counter()
+print('%.2f %.2f %s %s' % (
+    (imported - start) * 1e3,
+    (constructed - imported) * 1e3 / {count:d},
+    ','.join(loaded) or '-',
+    ','.join(m for m in {heavy!r}
+             if m in sys.modules and m not in loaded) or '-'))
+'''
+
+
+def measure(name, kwargs, number_of_roasters):
+    # run from the root of the tree holding this script, to import the
+    # freshroastsr700 package next to it
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.check_output(
+        [sys.executable, '-c', MEASURE.format(
+            heavy=HEAVY_MODULES, count=number_of_roasters, kwargs=kwargs)],
+        cwd=root)
+    import_ms, construct_ms, on_import, on_construct = (
+        output.decode().split())
+    print('%-8s import %7s ms  construct %7s ms/roaster  '
+          'loaded on import: %s, on construction: %s' % (
+              name, import_ms, construct_ms, on_import, on_construct))
+
+
+def main(number_of_roasters=10):
+    measure('process', {}, number_of_roasters)
+    measure('thread', {'backend': 'thread'}, number_of_roasters)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
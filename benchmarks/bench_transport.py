@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015-2016 Mark Spicer
+# Made available under the MIT license.
+"""Measures the round trip of a packet through a local TCP stand-in for a
+network bridge, the way the comm engine does it (write a packet, wait for
+the port, read everything available in one call), with
+transport.SocketTransport and with pyserial's own socket:// transport.
+
+Usage: python benchmarks/bench_transport.py [number_of_packets]
+"""
+
+import sys
+import time
+import select
+import socket
+import threading
+
+from freshroastsr700 import transport
+
+
+PACKET = b'\xAA\xAA\x61\x74\x00\x04\x02\x09\x32\x03\x01\x60\xAA\xFA'
+
+
+def serve(server):
+    # answers every packet with a packet
+    while True:
+        conn, _ = server.accept()
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        pending = 0
+        while True:
+            data = conn.recv(4096)
+            if not data:
+                break
+            pending += len(data)
+            while pending >= len(PACKET):
+                pending -= len(PACKET)
+                conn.sendall(PACKET)
+        conn.close()
+
+
+def measure(name, port, number_of_packets):
+    start = time.perf_counter()
+    for _ in range(number_of_packets):
+        port.write(PACKET)
+        received = 0
+        while received < len(PACKET):
+            select.select([port], [], [])
+            waiting = port.in_waiting
+            if waiting:
+                received += len(port.read(waiting))
+    elapsed = time.perf_counter() - start
+    port.close()
+    print('%-18s %8.1f us/round trip' % (
+        name, elapsed * 1e6 / number_of_packets))
+
+
+def main():
+    number_of_packets = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    server.listen(1)
+    threading.Thread(target=serve, args=(server,), daemon=True).start()
+    url = 'socket://127.0.0.1:%d' % server.getsockname()[1]
+    import serial
+    measure('SocketTransport', transport.open_port(url), number_of_packets)
+    measure('pyserial socket://', serial.serial_for_url(url, timeout=0),
+            number_of_packets)
+
+
+if __name__ == '__main__':
+    main()
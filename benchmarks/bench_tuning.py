@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015-2016 Mark Spicer
+# Made available under the MIT license.
+"""Sweeps a grid of PID gains over the 4 minute profile of
+examples/pid_tune_aid.py with tuning.sweep(), on one process and on a
+pool, and prints the time taken and the best gains found.
+
+Usage: python benchmarks/bench_tuning.py [gains_per_axis] [processes]
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+
+from freshroastsr700 import simulator
+from freshroastsr700 import tuning
+
+
+def measure(name, gains, processes):
+    start = time.perf_counter()
+    table = tuning.sweep(simulator.ThermalModel(), *gains,
+                         processes=processes)
+    elapsed = time.perf_counter() - start
+    print('%-10s %7d gain sets in %6.2f s (%6.1f us/roast)' % (
+        name, len(table), elapsed, elapsed * 1e6 / len(table)))
+    return table
+
+
+def main():
+    per_axis = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    processes = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count()
+    gains = tuning.grid(np.linspace(0, 0.3, per_axis),
+                        np.linspace(0, 0.03, per_axis),
+                        np.linspace(0, 0.1, per_axis))
+    measure('1 process', gains, 1)
+    table = measure('%d procs' % processes, gains, processes)
+    print('best: kp %.4f ki %.5f kd %.4f, overshoot %.0f degF, settling '
+          '%.1f s, IAE %.0f degF.s' % tuple(table[0])[:6])
+
+
+if __name__ == '__main__':
+    main()
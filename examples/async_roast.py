@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015-2016 Mark Spicer
+# Made available under the MIT license.
+
+import asyncio
+from freshroastsr700 import aio
+
+
+async def print_samples(roaster):
+    async for sample in roaster.samples():
+        print('%s %d F' % (sample.state_name, sample.current_temp))
+
+
+async def main():
+    # Create a roaster object and connect to the roaster.
+    roaster = aio.AsyncRoaster(thermostat=True)
+    await roaster.connect()
+    printer = asyncio.ensure_future(print_samples(roaster))
+
+    # Roast at 400 F for a minute, then cool for 30 seconds.
+    await roaster.apply(target_temp=400, fan_speed=9, time_remaining=60)
+    await roaster.roast()
+    await roaster.wait_for_transition()
+    await roaster.apply(state='cooling', time_remaining=30)
+    await roaster.wait_for_transition()
+    await roaster.idle()
+
+    printer.cancel()
+    roaster.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
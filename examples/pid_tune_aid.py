@@ -151,22 +151,15 @@ class Roaster(object):
                self.recipe[self.active_recipe_item]['state']
                ))
         print("--------------------------------------------")
-        # set values for next state
-        self.roaster.time_remaining = (
-            self.recipe[self.active_recipe_item]['time_remaining'])
-        self.roaster.target_temp = (
-            self.recipe[self.active_recipe_item]['target_temp'])
-        self.roaster.fan_speed = (
-            self.recipe[self.active_recipe_item]['fan_speed'])
-        # set state
-        if(self.recipe[self.active_recipe_item]['state'] == 'roasting'):
-            self.roaster.roast()
-        elif(self.recipe[self.active_recipe_item]['state'] == 'cooling'):
-            self.roaster.cool()
-        elif(self.recipe[self.active_recipe_item]['state'] == 'idle'):
-            self.roaster.idle()
-        elif(self.recipe[self.active_recipe_item]['state'] == 'cooling'):
-            self.roaster.sleep()
+        # set values for next state, all at once, and send them to the
+        # roaster right away
+        step = self.recipe[self.active_recipe_item]
+        self.roaster.apply(
+            state=step['state'],
+            time_remaining=step['time_remaining'],
+            target_temp=step['target_temp'],
+            fan_speed=step['fan_speed'],
+            write_now=True)
 
     def recipe_total_time(self):
         total_time = 0
@@ -2,17 +2,25 @@
 # Copyright (c) 2015-2016 Mark Spicer
 # Made available under the MIT license.
 
+import os
 import time
-import datetime
-import serial
+import functools
 import threading
 import logging
-import multiprocessing as mp
-from multiprocessing import sharedctypes
-import struct
-import binascii
 
 from freshroastsr700 import pid
+from freshroastsr700 import autotune as autotunes
+from freshroastsr700 import backend as backends
+from freshroastsr700 import clock as clocks
+from freshroastsr700 import discovery
+from freshroastsr700 import modulator
+from freshroastsr700 import protocol
+from freshroastsr700 import recipe
+from freshroastsr700 import scheduler
+from freshroastsr700 import state
+from freshroastsr700 import stats
+from freshroastsr700 import telemetry
+from freshroastsr700 import transport
 from freshroastsr700 import utils
 from freshroastsr700 import exceptions
 
@@ -58,6 +66,93 @@ class freshroastsr700(object):
         heater_segments (int): the pseudo-control range for the internal
         heat_controller object.  Defaults to 8.
 
+        telemetry_func (func): A function to call with a list of
+        telemetry.TelemetryRecords, one per packet received from the
+        hardware, in order. Unlike update_data_func, no sample is ever
+        merged with the next one. Defaults to None.
+
+        telemetry_queue (telemetry.TelemetryQueue): the queue carrying
+        telemetry records from the comm process. Pass one to choose its
+        capacity and backpressure policy, or to read records without a
+        telemetry_func. Defaults to None, in which case a default queue is
+        created if telemetry_func is set.
+
+        telemetry_batch_size (int): maximum number of records passed to
+        a single telemetry_func call. Defaults to None, meaning all records
+        available at the time.
+
+        telemetry_history (history.TelemetryHistory): a shared memory ring
+        to which the comm process appends an entry for every packet
+        received from the hardware, for other processes to read as NumPy
+        arrays. Defaults to None.
+
+        comm_period (float): period of the communication cycle with the
+        hardware, in seconds. Defaults to 0.25, the rate the SR700 expects.
+
+        overrun_policy (str): scheduler.SKIP (the default) or
+        scheduler.CATCH_UP. What the comm process does when a cycle takes
+        longer than comm_period: skip the missed cycles and stay on the
+        time grid, or run them back to back. See
+        scheduler.CycleScheduler.
+
+        backend (str): backend.PROCESS (the default) runs the comm
+        engine in a child process, over shared memory. backend.THREAD runs
+        it as a thread of the calling process, over private memory, which
+        starts faster and uses less memory. The API and behaviour are
+        otherwise the same.
+
+        hotplug (bool): when auto connecting, or resuming the link, wait
+        for the kernel to report the roaster being plugged in, where it
+        can (see discovery.DeviceMonitor). False rescans the USB serial
+        devices every quarter of a second instead. Defaults to True.
+
+        port (str): device node (or port name) of the roaster to connect
+        to, or the URL of a network bridge it is attached to:
+        socket://host:port for a raw TCP bridge, rfc2217://host:port for an
+        RFC 2217 serial port server (see transport.open_port()). A port
+        that is not a USB device, such as the pty of a
+        simulator.SimulatedRoaster, is opened as it is. Defaults to None,
+        for the first roaster found.
+
+        serial_number (str): USB serial number of the roaster to connect
+        to, for computers with several roasters whose adapters have one.
+        Defaults to None.
+
+        resume_window (float): when the link to the roaster drops (three
+        read or write failures in a row, typically a cable glitch), keep
+        trying to reopen the port for this many seconds before giving up.
+        If it comes back in time, the roast carries on where it was: the
+        roaster is not reinitialized nor its recipe read back, and the PID
+        controller, countdown and settings are kept. The length of the
+        gap is carried by the first telemetry record after it. Meanwhile,
+        connect_state is CS_CONNECTING. Defaults to 0, which disconnects
+        right away.
+
+        handshake_timeout (float): seconds to wait for the roaster to send
+        back its recipe when connecting, after which the connection attempt
+        fails. Defaults to 5.
+
+        fast_connect (bool): do not wait for the recipe readback at all,
+        and start the comm cycle right after the initialization packet.
+        The recipe property then stays None. Defaults to False.
+
+        clock (clock.Clock): the time source of the comm engine: the comm
+        cycle, the countdown, the connection, handshake and resume
+        timeouts, and the time stamps of telemetry records all follow it.
+        A clock.ScaledClock or clock.VirtualClock shared with a
+        simulator.SimulatedRoaster runs a whole roast many times faster
+        than real time, with the same control decisions. Defaults to None,
+        for the system clock.
+
+        modulation (str): how the software heater turns heater levels into
+        on and off pulses. modulator.TABLE (the default) uses the pulse
+        trains of heat_controller, which take a new whole level every
+        heater_segments cycles, when the PID controller runs.
+        modulator.SIGMA_DELTA uses a modulator.SigmaDeltaModulator, which
+        takes a new fractional level on every cycle, and the PID
+        controller runs every cycle too. kp, ki and kd keep their meaning
+        either way (see modulator.controller_gains()).
+
     """
     def __init__(self,
                  update_data_func=None,
@@ -65,16 +160,26 @@ class freshroastsr700(object):
                  thermostat=False,
                  kp=0.06, ki=0.0075, kd=0.01,
                  heater_segments=8,
-                 ext_sw_heater_drive=False):
+                 ext_sw_heater_drive=False,
+                 telemetry_func=None,
+                 telemetry_queue=None,
+                 telemetry_batch_size=None,
+                 telemetry_history=None,
+                 comm_period=0.25,
+                 overrun_policy=scheduler.SKIP,
+                 backend=backends.PROCESS,
+                 hotplug=True,
+                 port=None,
+                 serial_number=None,
+                 resume_window=0,
+                 handshake_timeout=5.0,
+                 fast_connect=False,
+                 clock=None,
+                 modulation=modulator.TABLE):
         """Create variables used to send in packets to the roaster. The update
         data function is called when a packet is opened. The state transistion
-        function is used by the timer thread to know what to do next. See wiki
+        function is used by the comm process to know what to do next. See wiki
         for more information on packet structure and fields."""
-        # constants for protocol decoding
-        self.LOOKING_FOR_HEADER_1 = 0
-        self.LOOKING_FOR_HEADER_2 = 1
-        self.PACKET_DATA = 2
-        self.LOOKING_FOR_FOOTER_2 = 3
         # constants for connection state monitoring
         self.CS_NOT_CONNECTED = -2
         self.CS_ATTEMPTING_CONNECT = -1
@@ -85,31 +190,107 @@ class freshroastsr700(object):
         self.CA_AUTO = 1
         self.CA_SINGLE_SHOT = 2
 
+        self._backend = backends.get_backend(backend)
+
         self._create_update_data_system(update_data_func)
         self._create_state_transition_system(state_transition_func)
 
-        self._header = sharedctypes.Array('c', b'\xAA\xAA')
-        self._temp_unit = sharedctypes.Array('c', b'\x61\x74')
-        self._flags = sharedctypes.Array('c', b'\x63')
-        self._current_state = sharedctypes.Array('c', b'\x02\x01')
-        self._footer = b'\xAA\xFA'
-
-        self._fan_speed = sharedctypes.Value('i', 1)
-        self._heat_setting = sharedctypes.Value('i', 0)
-        self._target_temp = sharedctypes.Value('i', 150)
-        self._current_temp = sharedctypes.Value('i', 150)
-        self._time_remaining = sharedctypes.Value('i', 0)
-        self._total_time = sharedctypes.Value('i', 0)
+        self._header = protocol.HEADER
+        self._temp_unit = b'\x61\x74'
+        self._flags = b'\x63'
+        self._footer = protocol.FOOTER
+        # each process gets its own copy of the packet buffer
+        self._encoder = protocol.PacketEncoder(self._temp_unit, self._flags)
+
+        # all state shared with the comm process lives in
+        # a single seqlock-protected block. heater_level is the SW PWM
+        # heater setting.
+        self._state = state.SharedState(
+            self._backend,
+            current_state=b'\x02\x01',
+            cooling_for_pid_control=0,
+            fan_speed=1,
+            heat_setting=0,
+            target_temp=150,
+            current_temp=150,
+            time_remaining_ms=0,
+            total_time_ms=0,
+            heater_level=0,
+            disconnect=0,
+            teardown=0,
+            # initialize to 'not connected'
+            connected=0,
+            connect_state=self.CS_NOT_CONNECTED,
+            # initialize to 'not trying to connect'
+            attempting_connect=self.CA_NONE,
+            pid_kp=kp,
+            pid_ki=ki,
+            pid_kd=kd)
+        self._clock = clock if clock is not None else clocks.SYSTEM
+        # the countdown runs on the roaster's clock
+        self._state.clock = self._clock.monotonic
+        # what every packet is built from, without allocating a copy
+        self._packet_snapshot = state.SnapshotBuffer(self._state)
+
+        if telemetry_queue is None and telemetry_func is not None:
+            telemetry_queue = telemetry.TelemetryQueue(
+                backend=self._backend)
+        self._telemetry_queue = telemetry_queue
+        self.telemetry_func = telemetry_func
+        self._telemetry_batch_size = telemetry_batch_size
+        self.telemetry_thread = None
+        self._telemetry_history = telemetry_history
+        if telemetry_history is not None:
+            # its entries are stamped on this clock
+            telemetry_history.clock = self._clock
+
+        # counters kept by the comm process, see stats()
+        self._comm_stats = stats.create_comm_stats(self._backend)
+        # validated here, so bad values raise in the caller's process
+        scheduler.CycleScheduler(
+            comm_period, overrun_policy, self._comm_stats)
+        self._comm_period = comm_period
+        self._overrun_policy = overrun_policy
+        self._hotplug = hotplug
+        self._port = port
+        self._serial_number = serial_number
+        self._resume_window = resume_window
+        self._handshake_timeout = handshake_timeout
+        self._fast_connect = fast_connect
+        # the recipe read back by the comm process, see recipe
+        self._recipe_buffer = recipe.create_recipe_buffer(self._backend)
+        # seconds the link was down before the next packet, see
+        # resume_window, and when the last packet came in. Only used by
+        # the comm process.
+        self._link_gap = 0.0
+        self._last_sample = None
+        # set when the roaster reported an out of range temperature and
+        # is to be reinitialized. Only used by the comm process.
+        self._reinit_due = False
+        # the pid_gains_seq of the gains in the PID controller, the
+        # autotune_seq of the last autotune request seen, the
+        # autotune.RelayTuner running it, and when it times out. Only used
+        # by the comm process.
+        self._pid_gains_seq = 0
+        self._autotune_seq = 0
+        self._tuner = None
+        self._autotune_end = None
+
+        # set by apply(write_now=True) to have the comm process send a
+        # packet right away, instead of waiting for the next cycle.
+        # Selectable, so the comm process can wait on it and on the
+        # serial port at the same time.
+        self._write_now_event = utils.SelectableEvent(self._backend)
+        # set to wake the comm process up when a connection is requested,
+        # or when it has to exit
+        self._connect_request_event = utils.SelectableEvent(self._backend)
+        # set while no connection attempt is in progress, so connect()
+        # can wait for the outcome of one. Selectable, for AsyncRoaster.
+        self._connect_settled_event = utils.SelectableEvent(self._backend)
+        self._connect_settled_event.set()
 
-        self._disconnect = sharedctypes.Value('i', 0)
-        self._teardown = sharedctypes.Value('i', 0)
-
-        self._cooling_for_pid_control = False
-
-        # for SW PWM heater setting
-        self._heater_level = sharedctypes.Value('i', 0)
         # the following vars are not process-safe, do not access them
-        # from the comm or timer threads, nor from the callbacks.
+        # from the comm process, nor from the callbacks.
         self._ext_sw_heater_drive = ext_sw_heater_drive
         if not self._ext_sw_heater_drive:
             self._thermostat = thermostat
@@ -119,51 +300,31 @@ class freshroastsr700(object):
         self._pid_ki = ki
         self._pid_kd = kd
         self._heater_bangbang_segments = heater_segments
+        # validated here, so bad values raise in the caller's process
+        modulator.controller_gains(kp, ki, kd, heater_segments, modulation)
+        self._modulation = modulation
 
-        # initialize to 'not connected'
-        self._connected = sharedctypes.Value('i', 0)
-        self._connect_state = sharedctypes.Value('i', self.CS_NOT_CONNECTED)
-        # initialize to 'not trying to connect'
-        self._attempting_connect = sharedctypes.Value('i', self.CA_NONE)
-
-        # create comm process
-        self.comm_process = mp.Process(
-            target=self._comm,
-            args=(
-                self._thermostat,
-                self._pid_kp,
-                self._pid_ki,
-                self._pid_kd,
-                self._heater_bangbang_segments,
-                self._ext_sw_heater_drive,
-                self.update_data_event,))
-        self.comm_process.daemon = True
-        self.comm_process.start()
-        # create timer process that counts down time_remaining
-        self.time_process = mp.Process(
-            target=self._timer,
-            args=(
-                self.state_transition_event,))
-        self.time_process.daemon = True
-        self.time_process.start()
+        # the comm process (or thread, see backend) is only started by the
+        # first call to connect() or auto_connect(), see _start_comm()
+        self.comm_process = None
 
     def _create_update_data_system(
             self, update_data_func, setFunc=True, createThread=False):
         # these callbacks cannot be called from another process in Windows.
         # Therefore, spawn a thread belonging to the calling process
         # instead.
-        # the comm and timer processes will set events that the threads
+        # the comm process will set events that the threads
         # will listen for to initiate the callbacks
 
         # only create the mp.Event once -
         # to mimic create_state_transition_system, for future-proofing
         # (in this case, currently, this is only called at __init__() time)
         if not hasattr(self, 'update_data_event'):
-            self.update_data_event = mp.Event()
+            self.update_data_event = utils.SelectableEvent(self._backend)
         # only create the thread.Event once - this is used to exit
         # the callback thread
         if not hasattr(self, 'update_data_callback_kill_event'):
-            self.update_data_callback_kill_event = mp.Event()
+            self.update_data_callback_kill_event = self._backend.Event()
         # destroy an existing thread if we had created one previously
         if(hasattr(self, 'update_data_thread') and
            self.update_data_thread is not None):
@@ -191,17 +352,19 @@ class freshroastsr700(object):
         # these callbacks cannot be called from another process in Windows.
         # Therefore, spawn a thread belonging to the calling process
         # instead.
-        # the comm and timer processes will set events that the threads
+        # the comm process will set events that the threads
         # will listen for to initiate the callbacks
 
         # only create the mp.Event once - this fn can get called more
         # than once, by __init__() and by set_state_transition_func()
         if not hasattr(self, 'state_transition_event'):
-            self.state_transition_event = mp.Event()
+            self.state_transition_event = utils.SelectableEvent(
+                self._backend)
         # only create the thread.Event once - this is used to exit
         # the callback thread
         if not hasattr(self, 'state_transition_callback_kill_event'):
-            self.state_transition_callback_kill_event = mp.Event()
+            self.state_transition_callback_kill_event = (
+                self._backend.Event())
         # destroy an existing thread if we had created one previously
         if(hasattr(self, 'state_transition_thread') and
            self.state_transition_thread is not None):
@@ -234,7 +397,7 @@ class freshroastsr700(object):
         Returns:
             Getter: (int): fan speed
         """
-        return self._fan_speed.value
+        return self._state.block.fan_speed
 
     @fan_speed.setter
     def fan_speed(self, value):
@@ -242,7 +405,7 @@ class freshroastsr700(object):
         if value not in range(1, 10):
             raise exceptions.RoasterValueError
 
-        self._fan_speed.value = value
+        self._state.set(fan_speed=value)
 
     @property
     def heat_setting(self):
@@ -255,7 +418,7 @@ class freshroastsr700(object):
         Returns:
             Getter: (int): heat setting
         """
-        return self._heat_setting.value
+        return self._state.block.heat_setting
 
     @heat_setting.setter
     def heat_setting(self, value):
@@ -263,7 +426,7 @@ class freshroastsr700(object):
         if value not in range(0, 4):
             raise exceptions.RoasterValueError
 
-        self._heat_setting.value = value
+        self._state.set(heat_setting=value)
 
     @property
     def target_temp(self):
@@ -279,14 +442,14 @@ class freshroastsr700(object):
             Getter: (int) target temperature in degF between 150
             and 551
         """
-        return self._target_temp.value
+        return self._state.block.target_temp
 
     @target_temp.setter
     def target_temp(self, value):
         if value not in range(150, 551):
             raise exceptions.RoasterValueError
 
-        self._target_temp.value = value
+        self._state.set(target_temp=value)
 
     @property
     def current_temp(self):
@@ -295,14 +458,14 @@ class freshroastsr700(object):
         Returns:
             (int) current temperature, in degrees Fahrenheit
         """
-        return self._current_temp.value
+        return self._state.block.current_temp
 
     @current_temp.setter
     def current_temp(self, value):
         if value not in range(150, 551):
             raise exceptions.RoasterValueError
 
-        self._current_temp.value = value
+        self._state.set(current_temp=value)
 
     @property
     def time_remaining(self):
@@ -311,8 +474,12 @@ class freshroastsr700(object):
         up to 600 seconds at any time.  When a new value is set,
         freshroastsr700 will count down from this new value down to 0.
 
-        time_remaining is decremented to 0 only when in a roasting or
+        time_remaining counts down only when in a roasting or
         cooling state.  In other states, the value is not touched.
+        The countdown is kept to the millisecond (see time_remaining_ms);
+        this getter rounds it up to whole seconds, so it only reads 0 once
+        the countdown has expired. Roasting or cooling started at 0 calls
+        the state_transition_func about a second later.
 
         Args:
             Setter: time_remaining (int): tiem remaining in seconds
@@ -320,11 +487,31 @@ class freshroastsr700(object):
         Returns:
             Getter: time_remaining(int): time remaining, in seconds
         """
-        return self._time_remaining.value
+        return _seconds(self.time_remaining_ms)
 
     @time_remaining.setter
     def time_remaining(self, value):
-        self._time_remaining.value = value
+        self.time_remaining_ms = value * 1000
+
+    @property
+    def time_remaining_ms(self):
+        """time_remaining, in milliseconds. The state_transition_func
+        is called as soon as it reaches 0.
+
+        Args:
+            Setter: time_remaining_ms (int): time remaining, in ms
+
+        Returns:
+            Getter: time_remaining_ms (int): time remaining, in ms
+        """
+        return state.time_remaining_ms(
+            self._state.snapshot(), self._state.clock())
+
+    @time_remaining_ms.setter
+    def time_remaining_ms(self, value):
+        value = int(value)
+        self._state.set(
+            time_remaining_ms=value, countdown_armed=int(value > 0))
 
     @property
     def total_time(self):
@@ -334,11 +521,12 @@ class freshroastsr700(object):
         Returns:
             total_time (int): time, in seconds
         """
-        return self._total_time.value
+        return state.total_time_ms(
+            self._state.snapshot(), self._state.clock()) // 1000
 
     @total_time.setter
     def total_time(self, value):
-        self._total_time.value = value
+        self._state.set(total_time_ms=value * 1000)
 
     @property
     def heater_level(self):
@@ -348,7 +536,7 @@ class freshroastsr700(object):
            heater_level().
            Min will always be zero, max will be heater_segments
            (optional instantiation parameter, defaults to 8)."""
-        return self._heater_level.value
+        return self._state.block.heater_level
 
     @heater_level.setter
     def heater_level(self, value):
@@ -359,16 +547,90 @@ class freshroastsr700(object):
         if self._ext_sw_heater_drive:
             if value not in range(0, self._heater_bangbang_segments+1):
                 raise exceptions.RoasterValueError
-            self._heater_level.value = value
+            self._state.set(heater_level=value)
         else:
             raise exceptions.RoasterValueError
 
+    @property
+    def telemetry_queue(self):
+        """The telemetry.TelemetryQueue receiving a record for every
+        packet from the hardware, or None if telemetry is not enabled."""
+        return self._telemetry_queue
+
+    @property
+    def telemetry_history(self):
+        """The history.TelemetryHistory the comm process appends to, or
+        None."""
+        return self._telemetry_history
+
+    @property
+    def overruns(self):
+        """Number of comm cycles that took longer than comm_period."""
+        return self._comm_stats.overruns
+
+    @property
+    def jitter_histogram(self):
+        """How late comm cycles started relative to their deadlines, as a
+        list of (upper bound in ms, number of cycles) tuples. The last
+        bin, with a bound of None, counts all later cycles."""
+        return scheduler.jitter_histogram(self._comm_stats)
+
+    @property
+    def sample_to_pid_latency(self):
+        """Time between the arrival of a temperature sample from the
+        hardware and the PID controller update that used it, in thermostat
+        mode. A dict as returned by stats.latency_summary()."""
+        return stats.latency_summary(self._comm_stats.sample_to_pid)
+
+    def stats(self):
+        """Returns the counters kept by the comm process since this object
+        was created, as a dict (see stats.comm_summary()):
+
+            cycles, overruns, skipped, max_jitter, jitter_histogram
+                comm cycles run, cycles that took longer than comm_period,
+                cycles skipped as a result, and how late cycles started.
+            bytes_received, frames_decoded, bad_frames
+                bytes read from the hardware, packets decoded, and packets
+                dropped because they were malformed or the wrong length.
+            reinits
+                times the roaster was reinitialized because it reported an
+                out of range temperature.
+            serial_exceptions, read_errors, write_errors
+                serial port exceptions, and failed reads and writes.
+            write_time, read_time, pid_time, sample_to_pid
+                how long serial writes, serial reads and PID updates took,
+                and the time from the arrival of a sample to the PID update
+                that used it.
+            connect_to_first_packet
+                time from a connect() or auto_connect() call to the first
+                packet decoded from the hardware, once per connection.
+            connect_to_ready
+                time from a connect() or auto_connect() call to the end of
+                the handshake with the hardware, once per connection.
+            handshake_timeouts
+                times the hardware did not send back its recipe within
+                handshake_timeout.
+            link_gap
+                for every drop of the link that was resumed (see
+                resume_window), the time from the last packet before it to
+                the port being open again.
+
+        Reading them is cheap: it copies a small block of shared memory.
+        """
+        return stats.comm_summary(self._comm_stats)
+
+    @property
+    def recipe(self):
+        """The recipe.Recipe the roaster sent back at the last connection
+        (or reinitialization), or None if it has not sent one."""
+        return recipe.read(self._recipe_buffer)
+
     @property
     def connected(self):
         """A getter method for _connected. Indicates that the
         this software is currently communicating with FreshRoast SR700
         hardware."""
-        return self._connected.value
+        return self._state.block.connected
 
     @property
     def connect_state(self):
@@ -384,11 +646,196 @@ class freshroastsr700(object):
             freshroastsr700.CS_ATTEMPTING_CONNECT
                 A call to auto_connect() or connect() was made, and the
                 software is currently attempting to connect to hardware.
+            freshroastsr700.CS_CONNECTING
+                The hardware was found and its port is being opened, or
+                the link dropped and is being resumed (see resume_window).
             freshroastsr700.CS_CONNECTED
                 The hardware was found, and the software is communicating
                 with the hardware.
         """
-        return self._connect_state.value
+        return self._state.block.connect_state
+
+    def apply(self, state=None, fan_speed=None, target_temp=None,
+              time_remaining=None, heat_setting=None, write_now=False,
+              time_remaining_ms=None):
+        """Changes any number of roaster settings at once. All values are
+        validated before anything is changed, and the new settings are then
+        published as a single update, so the comm process never sends a
+        packet holding only some of them. Arguments left to None are not
+        changed.
+
+        Args:
+            state (str): 'roasting', 'cooling', 'idle' or 'sleeping'.
+
+            fan_speed (int): fan speed, 1 to 9 inclusive.
+
+            target_temp (int): target temperature in degF, 150 to 550
+            inclusive.
+
+            time_remaining (int): time remaining, in seconds, 0 to 600
+            inclusive.
+
+            heat_setting (int): heat setting, 0 to 3 inclusive. Do not set
+            when running freshroastsr700 in thermostat mode.
+
+            write_now (bool): send the new settings to the roaster right
+            away instead of with the next regularly scheduled packet (up to
+            0.25 s later). Defaults to False.
+
+            time_remaining_ms (int): time remaining, in milliseconds, 0 to
+            600000 inclusive. Takes precedence over time_remaining.
+
+        Raises:
+            freshroastsr700.exceptions.RoasterValueError
+                A value is out of range. No setting is changed.
+        """
+        fields = {}
+        if state is not None:
+            if state not in _STATE_CODES:
+                raise exceptions.RoasterValueError
+            fields['current_state'] = _STATE_CODES[state]
+            fields['cooling_for_pid_control'] = 0
+        if fan_speed is not None:
+            if fan_speed not in range(1, 10):
+                raise exceptions.RoasterValueError
+            fields['fan_speed'] = fan_speed
+        if target_temp is not None:
+            if target_temp not in range(150, 551):
+                raise exceptions.RoasterValueError
+            fields['target_temp'] = target_temp
+        if time_remaining is not None:
+            if time_remaining not in range(0, 601):
+                raise exceptions.RoasterValueError
+            if time_remaining_ms is None:
+                time_remaining_ms = time_remaining * 1000
+        if time_remaining_ms is not None:
+            if time_remaining_ms not in range(0, 600001):
+                raise exceptions.RoasterValueError
+            fields['time_remaining_ms'] = time_remaining_ms
+            fields['countdown_armed'] = int(time_remaining_ms > 0)
+        if heat_setting is not None:
+            if heat_setting not in range(0, 4):
+                raise exceptions.RoasterValueError
+            fields['heat_setting'] = heat_setting
+
+        self._state.set(**fields)
+        if write_now:
+            self._write_now_event.set()
+
+    def autotune(self, target_temp=None, relay_high=None, relay_low=0,
+                 hysteresis=2.0, cycles=3, rule='ziegler_nichols',
+                 install=True, timeout=900):
+        """Starts tuning the PID controller, in thermostat mode only, and
+        returns right away. The roaster is put in the roasting state, and
+        the comm process drives the heater as a relay around target_temp
+        (see autotune.RelayTuner) in place of the PID controller, until the
+        temperature went through cycles full oscillations. Their period
+        and amplitude give the gains of rule, which replace those of the
+        PID controller right away if install is set, without reconnecting.
+
+        Watch autotune_state to know when it is over. Leaving the roasting
+        state, the link going down for good, or a new autotune() call end
+        it, as a failure. The fan speed and the countdown are left as they
+        are: set time_remaining long enough beforehand, so that the
+        state_transition_func does not end the experiment early.
+
+        Args:
+            target_temp (int): temperature to oscillate around, in degF,
+            150 to 550 inclusive. Defaults to the current target_temp.
+
+            relay_high (int): heater level while heating, up to
+            heater_segments. Defaults to heater_segments.
+
+            relay_low (int): heater level while cooling. Defaults to 0.
+
+            hysteresis (float): half the width of the band around
+            target_temp in which the relay does not switch, in degF.
+            Defaults to 2.
+
+            cycles (int): number of oscillations measured. Defaults to 3.
+
+            rule (str): a tuning rule, one of autotune.RULE_NAMES.
+            Defaults to 'ziegler_nichols'.
+
+            install (bool): install the new gains in the PID controller.
+            Defaults to True.
+
+            timeout (float): seconds after which the experiment fails if
+            it is not over. Defaults to 900.
+
+        Raises:
+            freshroastsr700.exceptions.RoasterStateError
+                Not in thermostat mode.
+            freshroastsr700.exceptions.RoasterValueError
+                A value is out of range. Nothing is changed.
+        """
+        if not self._thermostat:
+            raise exceptions.RoasterStateError
+        segments = self._heater_bangbang_segments
+        if relay_high is None:
+            relay_high = segments
+        if target_temp is None:
+            target_temp = self._state.block.target_temp
+        if (target_temp not in range(150, 551) or
+                relay_high not in range(1, segments + 1) or
+                relay_low not in range(0, relay_high) or
+                hysteresis < 0 or cycles < 1 or timeout <= 0 or
+                rule not in autotunes.RULE_NAMES):
+            raise exceptions.RoasterValueError
+        with self._state.update() as block:
+            state.set_fields(
+                block, current_state=_STATE_CODES['roasting'],
+                cooling_for_pid_control=0, target_temp=target_temp,
+                autotune_seq=block.autotune_seq + 1,
+                autotune_state=autotunes.AT_RUNNING,
+                autotune_high=relay_high, autotune_low=relay_low,
+                autotune_hysteresis=hysteresis, autotune_cycles=cycles,
+                autotune_rule=autotunes.RULE_NAMES.index(rule),
+                autotune_install=int(install), autotune_timeout=timeout)
+
+    @property
+    def autotune_state(self):
+        """State of the last autotune() call: autotune.AT_OFF if there was
+        none, AT_RUNNING, AT_DONE or AT_FAILED."""
+        return self._state.block.autotune_state
+
+    @property
+    def autotune_result(self):
+        """The autotune.AutotuneResult of the last autotune() call, or None
+        if it is not done."""
+        block = self._state.snapshot()
+        if block.autotune_state != autotunes.AT_DONE:
+            return None
+        ultimate_gain = block.autotune_ultimate_gain
+        ultimate_period = block.autotune_ultimate_period
+        return autotunes.AutotuneResult(
+            ultimate_gain, ultimate_period, block.autotune_amplitude,
+            *autotunes.gains(
+                ultimate_gain, ultimate_period,
+                self._heater_bangbang_segments * self._comm_period,
+                autotunes.RULE_NAMES[block.autotune_rule]))
+
+    @property
+    def pid_gains(self):
+        """The (kp, ki, kd) gains of the PID controller, as given at init
+        time, or set by set_pid_gains() or autotune() since."""
+        block = self._state.snapshot()
+        return block.pid_kp, block.pid_ki, block.pid_kd
+
+    def set_pid_gains(self, kp, ki, kd):
+        """Changes the gains of the PID controller. The comm process
+        installs them at its next PID update, carrying the integral term
+        over, so they can be changed in the middle of a roast.
+
+        Raises:
+            freshroastsr700.exceptions.RoasterValueError
+                A gain is negative.
+        """
+        if min(kp, ki, kd) < 0:
+            raise exceptions.RoasterValueError
+        with self._state.update() as block:
+            state.set_fields(block, pid_kp=kp, pid_ki=ki, pid_kd=kd,
+                             pid_gains_seq=block.pid_gains_seq + 1)
 
     def set_state_transition_func(self, func):
         """THIS FUNCTION MUST BE CALLED BEFORE CALLING
@@ -398,7 +845,7 @@ class freshroastsr700(object):
         The supplied function will be called from a separate thread within
         freshroastsr700, triggered by a separate, internal child process.
         This function will fail if the freshroastsr700 device is already
-        connected to hardware, because by that time, the timer process
+        connected to hardware, because by that time, the comm process
         and thread have already been spawned.
 
         Args:
@@ -409,7 +856,7 @@ class freshroastsr700(object):
         Returns:
             nothing
        """
-        if self._connected.value:
+        if self._state.block.connected:
             logging.error("freshroastsr700.set_state_transition_func must be "
                           "called before freshroastsr700.auto_connect()."
                           " Not registering func.")
@@ -431,9 +878,19 @@ class freshroastsr700(object):
                 return
             self.update_data_func()
 
+    def telemetry_run(self):
+        """This is the thread that delivers batches of telemetry records
+           from the comm process to the telemetry_func callback
+           in the context of the main process.
+           """
+        while True:
+            records = self._telemetry_queue.get(self._telemetry_batch_size)
+            if records:
+                self.telemetry_func(records)
+
     def state_transition_run(self, event_to_wait_on):
         """This is the thread that listens to an event from
-           the timer process to execute the state_transition_func callback
+           the comm process to execute the state_transition_func callback
            in the context of the main process.
            """
         # with the daemon=Turue setting, this thread should
@@ -444,99 +901,206 @@ class freshroastsr700(object):
                 return
             self.state_transition_func()
 
-    def _connect(self):
+    def _connect(self, port=None):
         """Do not call this directly - call auto_connect() or connect(),
         which will call _connect() for you.
 
-        Connects to the roaster and creates communication thread.
+        Connects to the roaster at port, or looks for it if None.
         Raises a RoasterLokkupError exception if the hardware is not found.
         """
-        # the following call raises a RoasterLookupException when the device
-        # is not found. It is
-        port = utils.find_device('1A86:5523')
+        if port is None:
+            # the following call raises a RoasterLookupException when the
+            # device is not found.
+            port = self._find_port()
+        if transport.is_url(port):
+            # a bridge is either there or not, no need to wait for it
+            self._state.set(connect_state=self.CS_CONNECTING)
+            try:
+                self._ser = self._open_port(port)
+            except IOError:
+                raise exceptions.RoasterLookupError
+            return self._handshake()
         # on some systems, after the device port is added to the device list,
         # it can take up to 20 seconds after USB insertion for
         # the port to become available... (!)
         # let's put a safety timeout in here as a precaution
-        wait_timeout = time.time() + 40.0  # should be PLENTY of time!
+        wait_timeout = self._clock.monotonic() + 40.0  # PLENTY of time!
         # let's update the _connect_state while we're at it...
-        self._connect_state.value = self.CS_CONNECTING
+        self._state.set(connect_state=self.CS_CONNECTING)
         connect_success = False
-        while time.time() < wait_timeout:
+        while self._clock.monotonic() < wait_timeout:
             try:
-                self._ser = serial.Serial(
-                    port=port,
-                    baudrate=9600,
-                    bytesize=8,
-                    parity='N',
-                    stopbits=1.5,
-                    timeout=0.25,
-                    xonxoff=False,
-                    rtscts=False,
-                    dsrdtr=False)
+                self._ser = self._open_port(port)
                 connect_success = True
                 break
-            except serial.SerialException:
-                time.sleep(0.5)
+            except IOError:
+                self._clock.sleep(0.5)
         if not connect_success:
             # timeout on attempts
             raise exceptions.RoasterLookupError
 
-        self._initialize()
+        self._handshake()
+
+    def _handshake(self):
+        """Initializes the roaster over the newly opened port. Raises a
+        RoasterLookupError exception, and closes the port, if it does not
+        answer."""
+        if not self._initialize():
+            # whatever answers on this port, it does not speak SR700
+            self._ser.close()
+            raise exceptions.RoasterLookupError
+
+    def _find_port(self, index=None):
+        """Returns the port of the roaster: the port given to the
+        constructor if it is the URL of a network transport, or else the
+        node of a connected SR700 matching it and serial_number, looked up
+        in index (a discovery.DeviceIndex), or in a fresh scan if None.
+        Raises a RoasterLookupError exception if there is none."""
+        if transport.is_url(self._port):
+            return self._port
+        if index is None:
+            index = discovery.DeviceIndex(discovery.scan())
+        try:
+            return index.find(
+                discovery.SR700_VIDPID, self._serial_number, self._port)
+        except exceptions.RoasterLookupError:
+            port = self._unlisted_port(index)
+            if port is None:
+                raise
+            return port
+
+    def _unlisted_port(self, index):
+        """Returns the port given to the constructor if it exists but is
+        not a USB serial device at all (a pty, such as that of a
+        simulator.SimulatedRoaster, or a built-in serial port), in which
+        case it is taken at its word. Returns None otherwise."""
+        port = self._port
+        if (port is None or self._serial_number is not None or
+                not os.path.exists(port)):
+            return None
+        if any(device.node == port for device in index.devices()):
+            # a USB device, but not an SR700
+            return None
+        return port
+
+    def _open_port(self, port):
+        """Opens the transport to the roaster at port (see
+        transport.open_port()), in a single attempt. Raises IOError if it
+        cannot."""
+        return transport.open_port(port)
+
+    def _reopen(self, monitor=None):
+        """Looks for the roaster again and reopens its port, in a single
+        attempt, after the link dropped. The port is looked up in the
+        index of monitor (a discovery.DeviceMonitor), if any. Unlike
+        _connect(), the roaster is left as it is: it is neither
+        initialized nor asked for its recipe. Raises a RoasterLookupError
+        exception if it cannot."""
+        port = self._find_port(None if monitor is None else monitor.index)
+        try:
+            self._ser = self._open_port(port)
+        except IOError:
+            raise exceptions.RoasterLookupError
 
     def _initialize(self):
-        """Sends the initialization packet to the roaster."""
-        self._header.value = b'\xAA\x55'
-        self._current_state.value = b'\x00\x00'
-        s = self._generate_packet()
+        """Sends the initialization packet to the roaster, and reads back
+        the recipe it answers with, unless fast_connect. Returns False if
+        the roaster did not answer within handshake_timeout."""
+        self._state.set(current_state=b'\x00\x00')
+        s = self._generate_packet(protocol.INIT_HEADER)
+        start = time.monotonic()
         self._ser.write(s)
-        self._header.value = b'\xAA\xAA'
-        self._current_state.value = b'\x02\x01'
+        stats.record_latency(
+            self._comm_stats.write_time, time.monotonic() - start)
+        self._state.set(current_state=b'\x02\x01')
 
-        return self._read_existing_recipe()
+        if self._fast_connect:
+            # the readback is dropped as it comes in, see
+            # _read_and_process()
+            return True
+        return self._read_existing_recipe() is not None
 
     def _write_to_device(self):
         success = False
         try:
             packet = self._generate_packet()
-            logging.debug('WR: ' + str(binascii.hexlify(packet)))
+            if logging.root.isEnabledFor(logging.DEBUG):
+                logging.debug('WR: ' + _hexlify(packet))
+            start = time.monotonic()
             self._ser.write(packet)
+            stats.record_latency(
+                self._comm_stats.write_time, time.monotonic() - start)
             success = True
-        except serial.serialutil.SerialException:
+        except IOError:
+            # serial.SerialException, or an OSError from the port itself
             logging.error('caught serial exception writing')
+            self._comm_stats.serial_exceptions += 1
+            self._comm_stats.write_errors += 1
         return success
 
-    def _read_from_device(self):
-        r = []
-        footer_reached = False
-        while len(r) < 14 and footer_reached is False:
-            r.append(self._ser.read(1))
-            if len(r) >= 2 and b''.join(r)[-2:] == self._footer:
-                footer_reached = True
-        logging.debug('RD: ' + str(binascii.hexlify(b''.join(r))))
-        return b''.join(r)
+    def _read_from_device(self, framer):
+        """Moves everything the device has sent so far into framer, with a
+        single read call."""
+        comm_stats = self._comm_stats
+        start = time.monotonic()
+        try:
+            bytes_waiting = self._ser.in_waiting
+            if bytes_waiting:
+                data = self._ser.read(bytes_waiting)
+        except IOError:
+            comm_stats.serial_exceptions += 1
+            comm_stats.read_errors += 1
+            raise
+        if bytes_waiting:
+            stats.record_latency(
+                comm_stats.read_time, time.monotonic() - start)
+            comm_stats.bytes_received += len(data)
+            if logging.root.isEnabledFor(logging.DEBUG):
+                logging.debug('RD: ' + _hexlify(data))
+            framer.feed(data)
+        return bytes_waiting
 
     def _read_existing_recipe(self):
-        existing_recipe = []
-        end_of_recipe = False
-        while not end_of_recipe:
-            bytes_waiting = self._ser.in_waiting
-            if bytes_waiting < 14:
+        """Reads the recipe the roaster sends after the initialization
+        packet, publishes it (see recipe) and returns it as a
+        recipe.Recipe. Keeps writing a packet every quarter of a second
+        meanwhile, as the roaster expects. Returns None if the readback did
+        not end within handshake_timeout, or reading failed."""
+        reader = recipe.RecipeReader()
+        framer = protocol.PacketFramer()
+        selectable = _selectable(self._ser)
+        now = self._clock.monotonic()
+        deadline = now + self._handshake_timeout
+        next_write = now + 0.25
+        while True:
+            try:
+                received = self._read_from_device(framer)
+            except IOError:
+                logging.error('read from device failed while handshaking')
+                return None
+            for payload in framer.frames():
+                if reader.feed(payload):
+                    recipe.publish(self._recipe_buffer, reader.payloads)
+                    return reader.recipe()
+            now = self._clock.monotonic()
+            if now >= deadline:
+                logging.error('no recipe from the roaster within %g s' %
+                              self._handshake_timeout)
+                self._comm_stats.handshake_timeouts += 1
+                return None
+            if received:
+                continue
+            if now >= next_write:
                 # still need to write to device every .25sec it seems
-                time.sleep(0.25)
                 self._write_to_device()
+                next_write = now + 0.25
+            timeout = min(next_write, deadline) - now
+            if selectable:
+                # woken up as soon as the readback starts coming in
+                self._clock.wait(functools.partial(
+                    scheduler.wait_readable, [self._ser]), timeout)
             else:
-                while (bytes_waiting // 14) > 0:
-                    r = self._read_from_device()
-                    bytes_waiting = self._ser.in_waiting
-                    if len(r) < 14:
-                        logging.warn('short packet length')
-                    else:
-                        existing_recipe.append(r)
-                        if r[4:5] == b'\xAF' or r[4:5] == b'\x00':
-                            end_of_recipe = True
-                        continue
-        return existing_recipe
+                self._clock.sleep(min(timeout, _HANDSHAKE_POLL))
 
     def connect(self):
         """Attempt to connect to hardware immediately.  Will not retry.
@@ -547,10 +1111,8 @@ class freshroastsr700(object):
                 No hardware connected to the computer.
         """
         self._start_connect(self.CA_SINGLE_SHOT)
-        while(self._connect_state.value == self.CS_ATTEMPTING_CONNECT or
-              self._connect_state.value == self.CS_CONNECTING):
-            time.sleep(0.1)
-        if self.CS_CONNECTED != self._connect_state.value:
+        self._connect_settled_event.wait()
+        if self.CS_CONNECTED != self._state.block.connect_state:
             raise exceptions.RoasterLookupError
 
     def auto_connect(self):
@@ -563,14 +1125,24 @@ class freshroastsr700(object):
         from the user context, either from auto_connect() or connect().
         Never call this from the _comm() process context.
         """
-        if self._connect_state.value != self.CS_NOT_CONNECTED:
-            # already done or in process, assume success
-            return
-
-        self._connected.value = 0
-        self._connect_state.value = self.CS_ATTEMPTING_CONNECT
-        # tell comm process to attempt connection
-        self._attempting_connect.value = connect_type
+        with self._state.update() as block:
+            if block.connect_state != self.CS_NOT_CONNECTED:
+                # already done or in process, assume success
+                return
+            if block.teardown:
+                # terminated, there is no comm process to connect
+                return
+            # cleared in the same update, so nobody sees the attempt
+            # without also seeing it unsettled
+            self._connect_settled_event.clear()
+            # tell comm process to attempt connection
+            state.set_fields(
+                block, connected=0,
+                connect_state=self.CS_ATTEMPTING_CONNECT,
+                attempting_connect=connect_type,
+                connect_mark=time.monotonic())
+        self._connect_request_event.set()
+        self._start_comm()
 
         # EXTREMELY IMPORTANT - for this to work at all in Windows,
         # where the above processes are spawned (vs forked in Unix),
@@ -588,21 +1160,103 @@ class freshroastsr700(object):
             self._create_state_transition_system(
                 None, setFunc=False, createThread=True)
             self.state_transition_thread.start()
-
-    def _auto_connect(self):
-        """Attempts to connect to the roaster every quarter of a second."""
-        while not self._teardown.value:
-            try:
-                self._connect()
-                return True
-            except exceptions.RoasterLookupError:
-                time.sleep(.25)
+        if (self.telemetry_func is not None and
+                self.telemetry_thread is None):
+            # unlike the threads above, this one survives disconnects
+            self.telemetry_thread = threading.Thread(
+                name='sr700_telemetry',
+                target=self.telemetry_run,
+                daemon=True
+                )
+            self.telemetry_thread.start()
+
+    def _start_comm(self):
+        """Starts the comm process (or thread, see backend), unless it is
+        already running."""
+        if self.comm_process is not None and self.comm_process.is_alive():
+            return
+        args = (self._thermostat,
+                self._pid_kp,
+                self._pid_ki,
+                self._pid_kd,
+                self._heater_bangbang_segments,
+                self._ext_sw_heater_drive,
+                self.update_data_event,
+                self.state_transition_event)
+        start_steps = getattr(self._backend, 'start_steps', None)
+        if start_steps is not None:
+            # the backend runs the loop itself, see fleet.RoasterFleet
+            self.comm_process = start_steps(
+                self._comm_steps(*args), name='sr700_comm',
+                on_failure=self._comm_failed)
+        else:
+            self.comm_process = self._backend.start(
+                self._comm, args, name='sr700_comm')
+
+    def _comm_failed(self):
+        """Called by a fleet.RoasterFleet worker when the comm loop raised:
+        the connection attempt, or the link, is settled as lost, so that
+        connect() returns rather than waiting for a loop that is gone.
+        The next connection request starts a new loop."""
+        self._settle_connect(self.CS_NOT_CONNECTED, disconnect=0)
+
+    def _auto_connect_steps(self):
+        """Waits for the roaster to be plugged in, and connects to it.
+        Returns False as soon as terminate() is called. A step generator,
+        see _comm_steps()."""
+        # terminate() sets the event to cut the wait short. It is also set
+        # by the request that got us here, so clear it before looking at
+        # teardown.
+        self._connect_request_event.clear()
+        if transport.is_url(self._port):
+            # no hotplug events from a bridge, knock until it answers
+            while not self._state.block.teardown:
+                try:
+                    yield scheduler.Call(self._connect, (self._port,))
+                    return True
+                except exceptions.RoasterLookupError:
+                    yield scheduler.Wait(
+                        [self._connect_request_event], _BRIDGE_RETRY)
+                    self._connect_request_event.clear()
+            return False
+        monitor = discovery.DeviceMonitor(hotplug=self._hotplug)
+        try:
+            while not self._state.block.teardown:
+                try:
+                    port = monitor.index.find(
+                        discovery.SR700_VIDPID, self._serial_number,
+                        self._port)
+                except exceptions.RoasterLookupError:
+                    port = self._unlisted_port(monitor.index)
+                if port is None:
+                    # only woken up when a device appears, or every
+                    # poll_interval if the monitor has to poll
+                    if monitor.polling:
+                        yield scheduler.Wait(
+                            [self._connect_request_event],
+                            monitor.poll_interval)
+                    else:
+                        yield scheduler.Wait(
+                            [self._connect_request_event, monitor], None)
+                    if self._connect_request_event.is_set():
+                        self._connect_request_event.clear()
+                    else:
+                        monitor.refresh()
+                    continue
+                try:
+                    yield scheduler.Call(self._connect, (port,))
+                    return True
+                except exceptions.RoasterLookupError:
+                    # listed, but could not be opened: gone again
+                    monitor.index.remove(port)
+        finally:
+            monitor.close()
         return False
 
     def disconnect(self):
         """Stops the communication loop to the roaster. Note that this will not
         actually stop the roaster itself."""
-        self._disconnect.value = 1
+        self._state.set(disconnect=1)
 
     def terminate(self):
         """Stops the communication loop to the roaster and closes down all
@@ -611,14 +1265,20 @@ class freshroastsr700(object):
         You will need to instantiate a new freshroastsr700 object after
         calling this function, in order to re-start communications with
         the hardware.
+
+        Waits for the comm process to exit, as it keeps using the shared
+        state until then.
         """
         self.disconnect()
-        self._teardown.value = 1
+        self._state.set(teardown=1)
+        self._connect_request_event.set()
+        if self.comm_process is not None:
+            self.comm_process.join()
 
     def _comm(self, thermostat=False,
               kp=0.06, ki=0.0075, kd=0.01,
               heater_segments=8, ext_sw_heater_drive=False,
-              update_data_event=None):
+              update_data_event=None, state_transition_event=None):
         """Do not call this directly - call auto_connect(), which will spawn
         comm() for you.
 
@@ -653,262 +1313,545 @@ class freshroastsr700(object):
             comm_process to signal to the parent process that new device data
             is available.
 
+            state_transition_event (multiprocessing.Event): If set, signalled
+            when time_remaining counts down to 0 while roasting or cooling.
+            Otherwise, the roaster is set to idle at that point.
+
         Returns:
             nothing
         """
+        scheduler.run_steps(self._comm_steps(
+            thermostat, kp, ki, kd, heater_segments, ext_sw_heater_drive,
+            update_data_event, state_transition_event), self._clock)
+
+    def _comm_steps(self, thermostat=False,
+                    kp=0.06, ki=0.0075, kd=0.01,
+                    heater_segments=8, ext_sw_heater_drive=False,
+                    update_data_event=None, state_transition_event=None):
+        """The loop of _comm(), as a step generator (see
+        scheduler.run_steps()): it yields a scheduler.Wait wherever it
+        waits, and a scheduler.Call for the blocking connection attempts,
+        so that a fleet.RoasterFleet can run the loops of many roasters on
+        one thread. Takes the same arguments as _comm()."""
         # since this process is started with daemon=True, it should exit
         # when the owning process terminates. Therefore, safe to loop forever.
-        while not self._teardown.value:
-
-            # waiting for command to attempt connect
-            # print( "waiting for command to attempt connect")
-            while self._attempting_connect.value == self.CA_NONE:
-                time.sleep(0.25)
-                if self._teardown.value:
-                    break
+        while not self._state.block.teardown:
+
+            # sleep until we get the command to attempt to connect, or
+            # to tear down. The flags are published before the event is
+            # set, so they are checked again after every wake up.
+            while (self._state.block.attempting_connect == self.CA_NONE and
+                    not self._state.block.teardown):
+                yield scheduler.Wait([self._connect_request_event], None)
+                self._connect_request_event.clear()
             # if we're tearing down, bail now.
-            if self._teardown.value:
+            if self._state.block.teardown:
                 break
 
             # we got the command to attempt to connect
             # change state to 'attempting_connect'
-            self._connect_state.value = self.CS_ATTEMPTING_CONNECT
+            self._state.set(connect_state=self.CS_ATTEMPTING_CONNECT)
+            connect_mark = self._state.block.connect_mark
             # attempt connection
-            if self.CA_AUTO == self._attempting_connect.value:
+            if self.CA_AUTO == self._state.block.attempting_connect:
                 # this call will block until a connection is achieved
                 # it will also set _connect_state to CS_CONNECTING
                 # if appropriate
-                if self._auto_connect():
-                    # when we unblock, it is an indication of a successful
-                    # connection
-                    self._connected.value = 1
-                    self._connect_state.value = self.CS_CONNECTED
-                else:
-                    # failure, normally due to a timeout
-                    self._connected.value = 0
-                    self._connect_state.value = self.CS_NOT_CONNECTED
-                    # we failed to connect - start over from the top
-                    # reset flag
-                    self._attempting_connect.value = self.CA_NONE
+                connected = yield from self._auto_connect_steps()
+                if not connected:
+                    # failure, we are tearing down
+                    self._settle_connect(self.CS_NOT_CONNECTED)
                     continue
 
-            elif self.CA_SINGLE_SHOT == self._attempting_connect.value:
+            elif self.CA_SINGLE_SHOT == self._state.block.attempting_connect:
                 # try once, now, if failure, start teh big loop over
                 try:
-                    self._connect()
-                    self._connected.value = 1
-                    self._connect_state.value = self.CS_CONNECTED
+                    yield scheduler.Call(self._connect, ())
                 except exceptions.RoasterLookupError:
-                    self._connected.value = 0
-                    self._connect_state.value = self.CS_NOT_CONNECTED
-                if self._connect_state.value != self.CS_CONNECTED:
-                    # we failed to connect - start over from the top
-                    # reset flag
-                    self._attempting_connect.value = self.CA_NONE
+                    self._settle_connect(self.CS_NOT_CONNECTED)
                     continue
             else:
                 # shouldn't be here
                 # reset flag
-                self._attempting_connect.value = self.CA_NONE
+                self._state.set(attempting_connect=self.CA_NONE)
                 continue
 
             # We are connected!
-            # print( "We are connected!")
-            # reset flag right away
-            self._attempting_connect.value = self.CA_NONE
+            stats.record_latency(
+                self._comm_stats.connect_to_ready,
+                time.monotonic() - connect_mark)
+            self._settle_connect(self.CS_CONNECTED)
 
             # Initialize PID controller if thermostat function was specified at
             # init time
             pidc = None
             heater = None
             if(thermostat):
-                pidc = pid.PID(kp, ki, kd,
+                # with the gains last set, which are kp, ki and kd unless
+                # set_pid_gains() or autotune() changed them
+                block = self._state.snapshot()
+                pidc = pid.PID(*self._controller_gains(block),
                                Output_max=heater_segments,
                                Output_min=0
                                )
+                self._pid_gains_seq = block.pid_gains_seq
+            if self._modulation == modulator.SIGMA_DELTA:
+                heater_class = modulator.SigmaDeltaModulator
+            else:
+                heater_class = heat_controller
             if thermostat or ext_sw_heater_drive:
-                heater = heat_controller(number_of_segments=heater_segments)
-
-            read_state = self.LOOKING_FOR_HEADER_1
-            r = []
-            write_errors = 0
-            read_errors = 0
-            while not self._disconnect.value:
-                start = datetime.datetime.now()
-                # write to device
-                if not self._write_to_device():
-                    logging.error('comm - _write_to_device() failed!')
-                    write_errors += 1
-                    if write_errors > 3:
-                        # it's time to consider the device as being "gone"
-                        logging.error('comm - 3 successive write '
-                                      'failures, disconnecting.')
-                        self._disconnect.value = 1
-                        continue
-                else:
-                    # reset write_errors
-                    write_errors = 0
+                heater = heater_class(number_of_segments=heater_segments)
+
+            # the controllers outlive the link, so that a roast resumed
+            # after a short drop (see resume_window) carries on with the
+            # PID state it had
+            while (yield from self._link_steps(
+                    heater, pidc, ext_sw_heater_drive, update_data_event,
+                    state_transition_event, connect_mark)):
+                resumed = yield from self._resume_steps(
+                    state_transition_event)
+                if not resumed:
+                    break
+                # counted from the last packet heard before the drop
+                self._link_gap = self._clock.monotonic() - self._last_sample
+                stats.record_latency(
+                    self._comm_stats.link_gap, self._link_gap)
+                self._settle_connect(self.CS_CONNECTED)
+                # connect_to_first_packet is only measured once per
+                # connect() or auto_connect() call
+                connect_mark = None
+            if self._tuner is not None:
+                self._end_autotune(autotunes.AT_FAILED)
+            # reset disconnect flag and connection values
+            self._settle_connect(self.CS_NOT_CONNECTED, disconnect=0)
+        # drop a connect request made while tearing down, and let
+        # connect() return
+        self._settle_connect(self.CS_NOT_CONNECTED)
+
+    def _link_steps(self, heater, pidc, ext_sw_heater_drive,
+                    update_data_event, state_transition_event,
+                    connect_mark=None):
+        """Talks to the connected roaster, one packet per cycle, until
+        disconnect() is called or the link drops, and closes the port.
+        Returns True if the link dropped. connect_mark is the
+        time.monotonic() time of the connection request (on the system
+        clock, like all the latencies of stats()), or None if the first
+        packet is not to be timed. A step generator, see
+        _comm_steps()."""
+        framer = protocol.PacketFramer()
+        # drop out-of-cycle write requests made while disconnected
+        self._write_now_event.clear()
+        write_errors = 0
+        read_errors = 0
+        cycle = scheduler.CycleScheduler(
+            self._comm_period, self._overrun_policy, self._comm_stats,
+            self._clock.monotonic)
+        cycle.start()
+        # wait on the port and on apply(write_now=True) requests at
+        # the same time, so packets are decoded the moment they arrive.
+        # Where the port has no file descriptor (Windows), the port
+        # is only polled when the cycle or a write request wakes us.
+        if _selectable(self._ser):
+            waitables = [self._ser, self._write_now_event]
+        else:
+            waitables = [self._write_now_event]
+        # arrival time of the newest sample not yet used by the PID, for
+        # the sample_to_pid latency
+        sample_time = None
+        # a link that drops before any packet came in was down from the
+        # start of the session
+        self._last_sample = self._clock.monotonic()
+        # the heater is ticked once per cycle, as soon as that cycle's
+        # response arrives, so the PID works on the freshest sample
+        heater_due = False
+        first_packet = connect_mark is not None
+        link_lost = False
+        while not self._state.block.disconnect and not link_lost:
+            cycle.begin_cycle()
+            # time at which the countdown expires, if it is running
+            deadline = self._run_timer(state_transition_event)
+            if heater_due:
+                # no response last cycle, tick the heater anyway
+                if self._drive_heater(
+                        heater, pidc, ext_sw_heater_drive, sample_time):
+                    sample_time = None
+            heater_due = heater is not None
+            # write to device
+            if not self._write_to_device():
+                logging.error('comm - _write_to_device() failed!')
+                write_errors += 1
+                if write_errors > 3:
+                    # it's time to consider the device as being "gone"
+                    logging.error('comm - 3 successive write '
+                                  'failures, disconnecting.')
+                    link_lost = True
+                    continue
+            else:
+                # reset write_errors
+                write_errors = 0
 
-                # read from device
+            # read from device, until the next cycle is due, sending
+            # the packets requested by apply(write_now=True) in the
+            # meantime
+            while True:
                 try:
-                    while self._ser.in_waiting:
-                        _byte = self._ser.read(1)
-                        read_state, r, err = (
-                            self._process_reponse_byte(
-                                read_state, _byte, r, update_data_event))
+                    processed = self._read_and_process(
+                        framer, update_data_event)
+                    if self._reinit_due:
+                        self._reinit_due = False
+                        # the handshake blocks for up to handshake_timeout,
+                        # which would stall the other roasters of a fleet
+                        yield scheduler.Call(self._initialize, ())
+                    if processed:
+                        sample_time = time.monotonic()
+                        self._last_sample = self._clock.monotonic()
+                        if first_packet:
+                            first_packet = False
+                            stats.record_latency(
+                                self._comm_stats.connect_to_first_packet,
+                                sample_time - connect_mark)
+                        if heater_due:
+                            heater_due = False
+                            if self._drive_heater(
+                                    heater, pidc, ext_sw_heater_drive,
+                                    sample_time):
+                                sample_time = None
                 except IOError:
                     # typically happens when device is suddenly unplugged
                     logging.error('comm - read from device failed!')
                     read_errors += 1
-                    if write_errors > 3:
+                    if read_errors > 3:
                         # it's time to consider the device as being "gone"
                         logging.error('comm - 3 successive read '
                                       'failures, disconnecting.')
-                        self._disconnect.value = 1
-                        continue
+                        link_lost = True
+                        break
                 else:
                     read_errors = 0
-
-                # next, drive SW heater when using
-                # thermostat mode (PID controller calcs)
-                # or in external sw heater drive mode,
-                # when roasting.
-                if thermostat or ext_sw_heater_drive:
-                    if ('roasting' == self.get_roaster_state() or self._cooling_for_pid_control):
-                        if heater.about_to_rollover():
-                            # it's time to use the PID controller value
-                            # and set new output level on heater!
-                            if ext_sw_heater_drive:
-                                # read user-supplied value
-                                heater.heat_level = self._heater_level.value
-                            else:
-                                # thermostat
-                                output = pidc.update(
-                                    self.current_temp, self.target_temp)
-                                heater.heat_level = output
-                                # make this number visible to other processes...
-                                self._heater_level.value = heater.heat_level
-                        # read bang-bang heater output array element & apply it
-                        if heater.generate_bangbang_output():
-                            # ON
-                            self.heat_setting = 3
-                            self.roast()
-                        else:
-                            # OFF
-                            self.heat_setting = 0
-                            self.cool(True)
-                    else:
-                        # for all other states, heat_level = OFF
-                        heater.heat_level = 0
-                        # make this number visible to other processes...
-                        self._heater_level.value = heater.heat_level
-                        self.heat_setting = 0
-
-                # calculate sleep time to stick to 0.25sec period
-                comp_time = datetime.datetime.now() - start
-                sleep_duration = 0.25 - comp_time.total_seconds()
-                if sleep_duration > 0:
-                    time.sleep(sleep_duration)
-
-            self._ser.close()
-            # reset disconnect flag
-            self._disconnect.value = 0
-            # reset connection values
-            self._connected.value = 0
-            self._connect_state.value = self.CS_NOT_CONNECTED
-            # print("We are disconnected.")
-
-    def _process_reponse_byte(self, read_state, _byte, r, update_data_event):
-        err = False
-        if self.LOOKING_FOR_HEADER_1 == read_state:
-            if b'\xAA' == _byte:
-                read_state = self.LOOKING_FOR_HEADER_2
-        elif self.LOOKING_FOR_HEADER_2 == read_state:
-            if b'\xAA' == _byte:
-                read_state = self.PACKET_DATA
-                # reset packet array now...
-                r = []
-            else:
-                read_state = self.LOOKING_FOR_HEADER_1
-        elif self.PACKET_DATA == read_state:
-            if b'\xAA' == _byte:
-                # this could be the start of an end of packet marker
-                read_state = self.LOOKING_FOR_FOOTER_2
+                timeout = cycle.timeout(deadline)
+                if timeout is None:
+                    break
+                if read_errors:
+                    # a port that failed usually stays readable, so
+                    # waiting on it would retry right away: try again
+                    # next cycle
+                    yield scheduler.Wait([self._write_now_event], timeout)
+                else:
+                    yield scheduler.Wait(waitables, timeout)
+                if self._write_now_event.is_set():
+                    self._write_now_event.clear()
+                    self._write_to_device()
+                # fire the transition as close to the deadline as
+                # the OS lets us wake up
+                deadline = self._run_timer(state_transition_event)
+
+        self._ser.close()
+        return link_lost
+
+    def _resume_steps(self, state_transition_event=None):
+        """Tries to get the link back after it dropped, for up to
+        resume_window seconds, keeping the countdown running in the
+        meantime. Returns True once the port is open again, and False if
+        the window runs out or disconnect() is called first. A step
+        generator, see _comm_steps()."""
+        if self._resume_window <= 0:
+            return False
+        logging.warning('comm - link lost, trying to resume for %g s' %
+                        self._resume_window)
+        self._state.set(connected=0, connect_state=self.CS_CONNECTING)
+        end = self._clock.monotonic() + self._resume_window
+        monitor = None
+        if not transport.is_url(self._port):
+            # kept up to date from hotplug events, rather than scanning
+            # all the serial devices on every attempt
+            monitor = discovery.DeviceMonitor(hotplug=self._hotplug)
+        refreshed = self._clock.monotonic()
+        try:
+            while True:
+                block = self._state.block
+                if block.disconnect or block.teardown:
+                    return False
+                deadline = self._run_timer(state_transition_event)
+                try:
+                    yield scheduler.Call(self._reopen, (monitor,))
+                    return True
+                except exceptions.RoasterLookupError:
+                    pass
+                now = self._clock.monotonic()
+                if now >= end:
+                    logging.error('comm - could not resume, disconnecting.')
+                    return False
+                timeout = min(end - now, _RESUME_RETRY)
+                if deadline is not None:
+                    timeout = max(0.0, min(timeout, deadline - now))
+                # terminate() cuts the wait short
+                yield scheduler.Wait([self._connect_request_event], timeout)
+                self._connect_request_event.clear()
+                # a monitor that has to poll rescans on refresh(), so
+                # only every poll_interval
+                now = self._clock.monotonic()
+                if monitor is not None and (
+                        not monitor.polling or
+                        now - refreshed >= monitor.poll_interval):
+                    monitor.refresh()
+                    refreshed = now
+        finally:
+            if monitor is not None:
+                monitor.close()
+
+    def _settle_connect(self, connect_state, **fields):
+        """Publishes the outcome of a connection attempt, or a disconnect,
+        along with any other fields, and wakes up whoever waits for it in
+        connect()."""
+        with self._state.update() as block:
+            state.set_fields(
+                block, connected=int(connect_state == self.CS_CONNECTED),
+                connect_state=connect_state,
+                attempting_connect=self.CA_NONE, **fields)
+            self._connect_settled_event.set()
+
+    def _read_and_process(self, framer, update_data_event):
+        """Reads whatever the device sent and processes every complete
+        packet. Returns the number of packets processed. Stops at a packet
+        asking for the roaster to be reinitialized, and drops what came
+        after it."""
+        self._read_from_device(framer)
+        count = 0
+        bad_frames = framer.bad_frames
+        for payload in framer.frames():
+            if payload[protocol.PAYLOAD_FLAGS] != protocol.FLAGS_ROASTER:
+                # recipe lines, from a readback nobody waited for
+                continue
+            self._process_response_data(payload, update_data_event)
+            count += 1
+            if self._reinit_due:
+                framer.reset()
+                break
+        comm_stats = self._comm_stats
+        comm_stats.frames_decoded += count
+        comm_stats.bad_frames += framer.bad_frames - bad_frames
+        return count
+
+    def _drive_heater(self, heater, pidc, ext_sw_heater_drive,
+                      sample_time=None):
+        """Runs one tick of the SW heater when using thermostat mode (PID
+        controller calcs) or in external sw heater drive mode, when roasting.
+        sample_time is the time.monotonic() arrival time of the newest
+        sample, if the PID has not used it yet. Returns True if the PID
+        controller ran."""
+        if heater is None:
+            return False
+        pid_ran = False
+        snapshot = self._state.snapshot()
+        roasting = 'roasting' == _roaster_state(snapshot)
+        relay_level = None
+        if pidc is not None:
+            relay_level = self._autotune_tick(pidc, snapshot, roasting)
+        if roasting:
+            heater_level = None
+            if heater.about_to_rollover():
+                # it's time to use the PID controller value
+                # and set new output level on heater!
+                if ext_sw_heater_drive:
+                    # read user-supplied value
+                    heater.heat_level = snapshot.heater_level
+                elif relay_level is not None:
+                    # autotune() drives the heater
+                    heater.heat_level = relay_level
+                    heater_level = heater.heat_level
+                else:
+                    if snapshot.pid_gains_seq != self._pid_gains_seq:
+                        # set_pid_gains() or autotune() changed them
+                        self._pid_gains_seq = snapshot.pid_gains_seq
+                        pidc.setGains(*self._controller_gains(snapshot))
+                    # thermostat
+                    start = time.monotonic()
+                    heater.heat_level = pidc.update(
+                        snapshot.current_temp, snapshot.target_temp)
+                    end = time.monotonic()
+                    pid_ran = True
+                    stats.record_latency(
+                        self._comm_stats.pid_time, end - start)
+                    if sample_time is not None:
+                        stats.record_latency(
+                            self._comm_stats.sample_to_pid,
+                            end - sample_time)
+                    # make this number visible to other processes...
+                    heater_level = heater.heat_level
+            # read bang-bang heater output array element & apply it
+            self._apply_heater_output(
+                heater.generate_bangbang_output(), heater_level)
+        else:
+            # for all other states, heat_level = OFF
+            heater.heat_level = 0
+            # make this number visible to other processes...
+            self._state.set(heater_level=0, heat_setting=0)
+        return pid_ran
+
+    def _controller_gains(self, block):
+        """Returns the gains of block to give the PID controller (see
+        modulator.controller_gains())."""
+        return modulator.controller_gains(
+            block.pid_kp, block.pid_ki, block.pid_kd,
+            self._heater_bangbang_segments, self._modulation)
+
+    def _autotune_tick(self, pidc, snapshot, roasting):
+        """Runs the autotune() experiment, if one is requested or running,
+        on the temperature of snapshot. Returns the heater level it
+        wants, or None if the PID controller is in charge."""
+        now = self._clock.monotonic()
+        if snapshot.autotune_seq != self._autotune_seq:
+            # a new request, which replaces any running one
+            self._autotune_seq = snapshot.autotune_seq
+            self._tuner = None
+            if snapshot.autotune_state == autotunes.AT_RUNNING:
+                self._tuner = autotunes.RelayTuner(
+                    snapshot.target_temp, snapshot.autotune_high,
+                    snapshot.autotune_low, snapshot.autotune_hysteresis,
+                    snapshot.autotune_cycles)
+                self._autotune_end = now + snapshot.autotune_timeout
+        tuner = self._tuner
+        if tuner is None:
+            return None
+        if not roasting or now > self._autotune_end:
+            logging.error('comm - autotune failed')
+            self._end_autotune(autotunes.AT_FAILED, pidc, snapshot)
+            return None
+        level = tuner.update(now, snapshot.current_temp)
+        if not tuner.done:
+            return level
+        result = tuner.result(
+            self._heater_bangbang_segments * self._comm_period,
+            autotunes.RULE_NAMES[snapshot.autotune_rule])
+        fields = dict(
+            autotune_ultimate_gain=result.ultimate_gain,
+            autotune_ultimate_period=result.ultimate_period,
+            autotune_amplitude=result.amplitude)
+        if snapshot.autotune_install:
+            # installed by the next PID update, like set_pid_gains()
+            fields.update(pid_kp=result.kp, pid_ki=result.ki,
+                          pid_kd=result.kd)
+        self._end_autotune(autotunes.AT_DONE, pidc, snapshot, **fields)
+        return None
+
+    def _end_autotune(self, autotune_state, pidc=None, snapshot=None,
+                      **fields):
+        """Publishes the outcome of the running autotune() experiment,
+        unless another one was requested in the meantime, and hands the
+        heater back to the PID controller, if given, at the temperature of
+        snapshot and with the mean heater level of the relay as its
+        integral term."""
+        self._tuner = None
+        with self._state.update() as block:
+            if block.autotune_seq != self._autotune_seq:
+                return
+            if 'pid_kp' in fields:
+                fields['pid_gains_seq'] = block.pid_gains_seq + 1
+            state.set_fields(block, autotune_state=autotune_state,
+                             **fields)
+        if pidc is not None:
+            level = (snapshot.autotune_high + snapshot.autotune_low) / 2.0
+            if pidc.Ki > 0.0:
+                # setGains() carries the integral term over
+                pidc.setIntegrator(min(level / pidc.Ki, pidc.Integrator_max))
             else:
-                r.append(_byte)
-                # SR700 FW bug - if current temp is 250 degF (0xFA),
-                # the FW does not transmit the footer at all.
-                # fake the footer here.
-                if(len(r) == 10 and b'\xFA' == _byte):
-                    # we will 'fake' a footer to make this decoder work
-                    # as intended
-                    read_state, r, _ = (
-                        self._process_reponse_byte(
-                            read_state, b'\xAA', r, update_data_event))
-                    read_state, r, err = (
-                        self._process_reponse_byte(
-                            read_state, b'\xFA', r, update_data_event))
-
-        elif self.LOOKING_FOR_FOOTER_2 == read_state:
-            if b'\xFA' == _byte:
-                # OK we have a full packet - PROCESS PACKET
-                err = self._process_response_data(r, update_data_event)
-                read_state = self.LOOKING_FOR_HEADER_1
+                pidc.setIntegrator(0.0)
+            pidc.setDerivator(snapshot.current_temp)
+
+    def _apply_heater_output(self, heater_on, heater_level=None):
+        """Publishes one software heater pulse (and optionally the new
+        heater_level) as a single update. Nothing is written if the state
+        was changed from roasting by another process in the meantime."""
+        with self._state.update() as block:
+            if 'roasting' != _roaster_state(block):
+                return
+            if heater_on:
+                block.heat_setting = 3
+                block.current_state[:] = b'\x04\x02'
+                block.cooling_for_pid_control = 0
             else:
-                # the last byte was not the beginning of the footer
-                r.append(b'\xAA')
-                read_state = self.PACKET_DATA
-                read_state, r, err = self._process_reponse_byte(
-                    read_state, _byte, r, update_data_event)
-        else:
-            # error state, shouldn't happen...
-            logging.error('_process_reponse_byte - invalid read_state %d' %
-                          read_state)
-            read_state = self.LOOKING_FOR_HEADER_1
-            err = True
-        return read_state, r, err
-
-    def _process_response_data(self, r, update_data_event):
+                block.heat_setting = 0
+                block.current_state[:] = b'\x04\x04'
+                block.cooling_for_pid_control = 1
+            if heater_level is not None:
+                # a modulator.SigmaDeltaModulator takes fractional levels
+                block.heater_level = int(round(heater_level))
+
+    def _process_response_data(self, payload, update_data_event):
         err = False
-        if len(r) != 10:
-            logging.warn('read packet data len not 10, got: %d' % len(r))
-            logging.warn('RD: ' + str(binascii.hexlify(b''.join(r))))
+        if len(payload) != protocol.PAYLOAD_LENGTH:
+            logging.warn('read packet data len not 10, got: %d' %
+                         len(payload))
+            logging.warn('RD: ' + _hexlify(payload))
+            self._comm_stats.bad_frames += 1
             err = True
         else:
-            temp = struct.unpack(">H", b''.join(r[8:10]))[0]
+            temp = protocol.payload_temp(payload)
             if(temp == 65280):
-                self.current_temp = 150
+                self._state.set(current_temp=150)
             elif(temp > 550 or temp < 150):
                 logging.warn('temperature out of range: reinitializing...')
-                self._initialize()
+                self._comm_stats.reinits += 1
+                # done by the comm loop, see _link_steps()
+                self._reinit_due = True
                 err = True
                 return
             else:
-                self.current_temp = temp
-
+                self._state.set(current_temp=temp)
+
+            if (self._telemetry_queue is not None or
+                    self._telemetry_history is not None):
+                record = self._telemetry_record()
+                if self._telemetry_queue is not None:
+                    self._telemetry_queue.put(record)
+                if self._telemetry_history is not None:
+                    self._telemetry_history.append(record)
+            # the gap only goes with the first packet after it
+            self._link_gap = 0.0
             if(update_data_event is not None):
                 update_data_event.set()
         return err
 
-    def _timer(self, state_transition_event=None):
-        """Timer loop used to keep track of the time while roasting or
-        cooling. If the time remaining reaches zero, the roaster will call the
-        supplied state transistion function or the roaster will be set to
-        the idle state."""
-        while not self._teardown.value:
-            state = self.get_roaster_state()
-            if(state == 'roasting' or state == 'cooling'):
-                time.sleep(1)
-                self.total_time += 1
-                if(self.time_remaining > 0):
-                    self.time_remaining -= 1
-                else:
-                    if(state_transition_event is not None):
-                        state_transition_event.set()
-                    else:
-                        self.idle()
+    def _telemetry_record(self):
+        """Returns a telemetry.TelemetryRecord of the current state."""
+        snapshot = self._state.snapshot()
+        return telemetry.TelemetryRecord(
+            0, self._clock.time(), self._clock.monotonic(),
+            snapshot.current_temp, snapshot.target_temp,
+            snapshot.heater_level, snapshot.heat_setting,
+            snapshot.fan_speed,
+            telemetry.STATE_CODES[_roaster_state(snapshot)],
+            _seconds(state.time_remaining_ms(snapshot, self._state.clock())),
+            self._link_gap)
+
+    def _run_timer(self, state_transition_event=None):
+        """Fires the state transition once the countdown kept in the shared
+        state (see state.SharedState) expires while roasting or cooling:
+        state_transition_event is signalled, or the roaster is set to the
+        idle state if there is no event. Called by the comm loop whenever
+        it wakes up.
+
+        Returns the time at which the countdown will expire, on the
+        roaster's clock, or None if it is not running.
+        """
+        deadline = state.countdown_deadline(self._state.snapshot())
+        if deadline is None or self._state.clock() < deadline:
+            return deadline
+        with self._state.update() as block:
+            # the user may have changed the countdown in the meantime
+            deadline = state.countdown_deadline(block)
+            expired = (block.countdown_armed and deadline is not None and
+                       block.time_remaining_ms == 0 and
+                       deadline <= self._state.clock())
+            if expired:
+                block.countdown_armed = 0
+                block.countdown_due = 0.0
+        if expired:
+            if(state_transition_event is not None):
+                state_transition_event.set()
             else:
-                time.sleep(0.01)
+                self.idle()
+        return state.countdown_deadline(self._state.snapshot())
 
     def get_roaster_state(self):
         """Returns a string based upon the current state of the roaster. Will
@@ -922,66 +1865,103 @@ class freshroastsr700(object):
             'connecting' if in hardware connection phase,
             'unknown' otherwise
         """
-        value = self._current_state.value
-        if(value == b'\x02\x01'):
-            return 'idle'
-        elif(value == b'\x04\x04'):
-            if self._cooling_for_pid_control:
-                return 'roasting'
-            else:
-                return 'cooling'
-        elif(value == b'\x08\x01'):
-            return 'sleeping'
-        # handle null bytes as empty strings
-        elif(value == b'\x00\x00' or value == b''):
-            return 'connecting'
-        elif(value == b'\x04\x02'):
-            return 'roasting'
-        else:
-            return 'unknown'
+        return _roaster_state(self._state.snapshot())
 
-    def _generate_packet(self):
+    def _generate_packet(self, header=protocol.HEADER):
         """Generates a packet based upon the current class variables. Note that
         current temperature is not sent, as the original application sent zeros
-        to the roaster for the current temperature."""
-        roaster_time = utils.seconds_to_float(self._time_remaining.value)
-        packet = (
-            self._header.value +
-            self._temp_unit.value +
-            self._flags.value +
-            self._current_state.value +
-            struct.pack(">B", self._fan_speed.value) +
-            struct.pack(">B", int(round(roaster_time * 10.0))) +
-            struct.pack(">B", self._heat_setting.value) +
-            b'\x00\x00' +
-            self._footer)
-
-        return packet
+        to the roaster for the current temperature.
+
+        Returns a memoryview over the encoder's packet buffer, which is
+        only valid until the next call."""
+        snapshot = self._state.snapshot(self._packet_snapshot)
+        return self._encoder.encode(
+            header,
+            self._packet_snapshot.current_state,
+            snapshot.fan_speed,
+            _seconds(state.time_remaining_ms(snapshot, self._state.clock())),
+            snapshot.heat_setting)
 
     def idle(self):
         """Sets the current state of the roaster to idle."""
-        self._cooling_for_pid_control = False
-        self._current_state.value = b'\x02\x01'
+        self._state.set(current_state=b'\x02\x01', cooling_for_pid_control=0)
 
     def roast(self):
         """Sets the current state of the roaster to roast and begins
         roasting."""
-        self._cooling_for_pid_control = False
-        self._current_state.value = b'\x04\x02'
+        self._state.set(current_state=b'\x04\x02', cooling_for_pid_control=0)
 
     def cool(self, cool_for_pid_control=False):
         """Sets the current state of the roaster to cool. The roaster expects
         that cool will be run after roast, and will not work as expected if ran
         before."""
-        self._cooling_for_pid_control = cool_for_pid_control
-        self._current_state.value = b'\x04\x04'
+        self._state.set(
+            current_state=b'\x04\x04',
+            cooling_for_pid_control=int(cool_for_pid_control))
 
     def sleep(self):
         """Sets the current state of the roaster to sleep. Different than idle
         in that this will set double dashes on the roaster display rather than
         digits."""
-        self._cooling_for_pid_control = False
-        self._current_state.value = b'\x08\x01'
+        self._state.set(current_state=b'\x08\x01', cooling_for_pid_control=0)
+
+
+# seconds between attempts to reopen the port after the link dropped
+_RESUME_RETRY = 0.1
+# seconds between reads of a port that cannot be waited on while
+# handshaking
+_HANDSHAKE_POLL = 0.01
+# seconds between attempts to reach a network bridge when auto connecting
+_BRIDGE_RETRY = 1.0
+
+# current_state field values for the states a user can request
+_STATE_CODES = {
+    'idle': b'\x02\x01',
+    'roasting': b'\x04\x02',
+    'cooling': b'\x04\x04',
+    'sleeping': b'\x08\x01',
+}
+
+
+def _selectable(fileobj):
+    # True if fileobj has a file descriptor select() can wait on
+    try:
+        fileobj.fileno()
+    except (AttributeError, ValueError, OSError):
+        return False
+    return True
+
+
+def _hexlify(data):
+    """Formats packet data for the logs."""
+    import binascii
+    return str(binascii.hexlify(data))
+
+
+def _seconds(ms):
+    """Rounds a countdown in milliseconds up to whole seconds."""
+    return (ms + 999) // 1000
+
+
+def _roaster_state(block):
+    """Maps the current_state field of a state.StateBlock to the names
+    returned by freshroastsr700.get_roaster_state()."""
+    value = bytes(block.current_state)
+    if(value == b'\x02\x01'):
+        return 'idle'
+    elif(value == b'\x04\x04'):
+        if block.cooling_for_pid_control:
+            return 'roasting'
+        else:
+            return 'cooling'
+    elif(value == b'\x08\x01'):
+        return 'sleeping'
+    elif(value == b'\x00\x00'):
+        return 'connecting'
+    elif(value == b'\x04\x02'):
+        return 'roasting'
+    else:
+        return 'unknown'
 
 
 class heat_controller(object):
@@ -995,7 +1975,8 @@ class heat_controller(object):
         less often the heat value can be changed, because this object is
         designed to be called at a regular time interval to output N binary
         values before rolling over or picking up the latest commanded heat
-        value.
+        value. modulator.SigmaDeltaModulator does without that wait, at
+        any resolution.
     """
     def __init__(self, number_of_segments=8):
         # num_segments determines how many time samples are used to produce
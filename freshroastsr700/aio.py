@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015-2016 Mark Spicer
+# Made available under the MIT license.
+
+import asyncio
+
+import freshroastsr700
+from freshroastsr700 import telemetry
+from freshroastsr700 import exceptions
+
+
+# comm periods apply() waits for the first sample after a change
+_APPLY_PERIODS = 4
+
+
+class AsyncRoaster(object):
+    """An asyncio front end to a freshroastsr700.
+
+    The roaster runs on the same comm engine as a plain freshroastsr700,
+    but no callback threads are started: the telemetry queue and the
+    state transition event are file descriptors, watched directly by the
+    event loop, so samples and transitions are delivered without a thread
+    hop.
+
+    Attributes not defined here (current_temp, fan_speed, roast(),
+    ...) are those of the underlying freshroastsr700, available as
+    AsyncRoaster.roaster.
+
+    Args:
+        **kwargs: keyword arguments of freshroastsr700, except the
+        callbacks (update_data_func, state_transition_func and
+        telemetry_func), which are replaced by samples() and
+        wait_for_transition().
+    """
+    _CALLBACKS = ('update_data_func', 'state_transition_func',
+                  'telemetry_func')
+
+    def __init__(self, **kwargs):
+        for name in self._CALLBACKS:
+            if name in kwargs:
+                raise TypeError(
+                    'AsyncRoaster does not take %s' % name)
+        if kwargs.get('telemetry_queue') is None:
+            # the comm engine fills it, from a process or a thread
+            kwargs['telemetry_queue'] = telemetry.TelemetryQueue(
+                backend=kwargs.get('backend'))
+        self.roaster = freshroastsr700.freshroastsr700(**kwargs)
+        self._loop = None
+        self._watching_telemetry = False
+        # one asyncio.Queue per samples() iterator
+        self._subscribers = []
+        # (time the settings were published, future) per pending apply()
+        self._pending_applies = []
+        self._transition_waiters = []
+
+    def __getattr__(self, name):
+        if name == 'roaster':
+            raise AttributeError(name)
+        return getattr(self.roaster, name)
+
+    async def connect(self):
+        """Connects to the hardware. Will not retry.
+
+        Raises:
+            freshroastsr700.exceptions.RoasterLookupError
+                No hardware connected to the computer.
+        """
+        roaster = self.roaster
+        roaster._start_connect(roaster.CA_SINGLE_SHOT)
+        settled = roaster._connect_settled_event
+        if not settled.is_set():
+            loop = self._get_loop()
+            future = loop.create_future()
+            loop.add_reader(settled.fileno(), self._on_settled, future)
+            try:
+                await future
+            finally:
+                loop.remove_reader(settled.fileno())
+        if roaster.connect_state != roaster.CS_CONNECTED:
+            raise exceptions.RoasterLookupError
+        self._watch_telemetry()
+
+    async def samples(self):
+        """Asynchronous iterator over the telemetry.TelemetryRecords
+        received from the hardware from now on, one per packet. Every
+        iterator gets every record; records pile up in memory for as long
+        as an iterator is not consumed."""
+        queue = asyncio.Queue()
+        self._subscribers.append(queue)
+        self._watch_telemetry()
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self._subscribers.remove(queue)
+
+    async def wait_for_transition(self):
+        """Waits until time_remaining counts down to 0 while roasting or
+        cooling, and returns the state the roaster was in
+        ('roasting' or 'cooling'). The caller then decides what to do
+        next. Returns right away if a transition happened since the last
+        call."""
+        event = self.roaster.state_transition_event
+        if event.is_set():
+            event.clear()
+            return self.roaster.get_roaster_state()
+        loop = self._get_loop()
+        future = loop.create_future()
+        if not self._transition_waiters:
+            loop.add_reader(event.fileno(), self._on_transition)
+        self._transition_waiters.append(future)
+        try:
+            return await future
+        finally:
+            if future in self._transition_waiters:
+                self._transition_waiters.remove(future)
+                if not self._transition_waiters:
+                    loop.remove_reader(event.fileno())
+
+    async def apply(self, **fields):
+        """Changes any number of settings at once, as
+        freshroastsr700.apply(), and sends them to the hardware right away.
+        Waits for the first sample decoded after the change, for up to a
+        few comm periods, and returns it as a telemetry.TelemetryRecord.
+        Returns None without waiting if the roaster is not connected.
+
+        Raises:
+            freshroastsr700.exceptions.RoasterValueError
+                A value is out of range. No setting is changed.
+
+            freshroastsr700.exceptions.RoasterLookupError
+                The link went down before the sample came in. The
+                settings are changed all the same.
+
+            asyncio.TimeoutError
+                The roaster did not answer in time. The settings are
+                changed all the same.
+        """
+        # on the clock of the telemetry records
+        published = self.roaster._clock.monotonic()
+        self.roaster.apply(write_now=True, **fields)
+        if not self.roaster.connected:
+            return None
+        future = self._get_loop().create_future()
+        self._pending_applies.append((published, future))
+        self._watch_telemetry()
+        try:
+            # the link is checked once per comm period, as it may drop
+            # (or be resuming) without a sample to tell
+            for _ in range(_APPLY_PERIODS):
+                await asyncio.wait([future], timeout=self.roaster._comm_period)
+                if future.done():
+                    return future.result()
+                if not self.roaster.connected:
+                    raise exceptions.RoasterLookupError
+            raise asyncio.TimeoutError
+        finally:
+            if (published, future) in self._pending_applies:
+                self._pending_applies.remove((published, future))
+
+    async def set_fan_speed(self, value):
+        """Awaitable freshroastsr700.fan_speed setter. See apply()."""
+        return await self.apply(fan_speed=value)
+
+    async def set_heat_setting(self, value):
+        """Awaitable freshroastsr700.heat_setting setter. See apply()."""
+        return await self.apply(heat_setting=value)
+
+    async def set_target_temp(self, value):
+        """Awaitable freshroastsr700.target_temp setter. See apply()."""
+        return await self.apply(target_temp=value)
+
+    async def set_time_remaining(self, value):
+        """Awaitable freshroastsr700.time_remaining setter. See apply()."""
+        return await self.apply(time_remaining=value)
+
+    async def roast(self):
+        """Awaitable freshroastsr700.roast(). See apply()."""
+        return await self.apply(state='roasting')
+
+    async def cool(self):
+        """Awaitable freshroastsr700.cool(). See apply()."""
+        return await self.apply(state='cooling')
+
+    async def idle(self):
+        """Awaitable freshroastsr700.idle(). See apply()."""
+        return await self.apply(state='idle')
+
+    async def sleep(self):
+        """Awaitable freshroastsr700.sleep(). See apply()."""
+        return await self.apply(state='sleeping')
+
+    def close(self):
+        """Stops watching the roaster and terminates its processes."""
+        if self._watching_telemetry:
+            self._loop.remove_reader(self.roaster.telemetry_queue.fileno())
+            self._watching_telemetry = False
+        if self._transition_waiters:
+            self._loop.remove_reader(
+                self.roaster.state_transition_event.fileno())
+        self.roaster.terminate()
+
+    def _get_loop(self):
+        if self._loop is None:
+            self._loop = asyncio.get_event_loop()
+        return self._loop
+
+    def _watch_telemetry(self):
+        if not self._watching_telemetry:
+            self._get_loop().add_reader(
+                self.roaster.telemetry_queue.fileno(), self._on_telemetry)
+            self._watching_telemetry = True
+
+    def _on_telemetry(self):
+        records = self.roaster.telemetry_queue.get(timeout=0)
+        if not records:
+            return
+        for queue in self._subscribers:
+            for record in records:
+                queue.put_nowait(record)
+        pending = []
+        for published, future in self._pending_applies:
+            if future.done():
+                continue
+            for record in records:
+                if record.monotonic > published:
+                    future.set_result(record)
+                    break
+            else:
+                pending.append((published, future))
+        self._pending_applies = pending
+
+    def _on_settled(self, future):
+        if self.roaster._connect_settled_event.is_set() and not future.done():
+            future.set_result(None)
+
+    def _on_transition(self):
+        event = self.roaster.state_transition_event
+        if not event.is_set():
+            return
+        event.clear()
+        state = self.roaster.get_roaster_state()
+        self._loop.remove_reader(event.fileno())
+        waiters, self._transition_waiters = self._transition_waiters, []
+        for future in waiters:
+            if not future.done():
+                future.set_result(state)
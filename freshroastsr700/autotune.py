@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015-2016 Mark Spicer
+# Made available under the MIT license.
+
+import math
+import collections
+
+from freshroastsr700 import exceptions
+
+
+# values of freshroastsr700.autotune_state
+AT_OFF = 0
+AT_RUNNING = 1
+AT_DONE = 2
+AT_FAILED = 3
+
+# tuning rules, as (Kp / Ku, Ti / Tu, Td / Tu)
+RULES = {
+    'ziegler_nichols': (0.6, 0.5, 0.125),
+    'some_overshoot': (0.33, 0.5, 1.0 / 3),
+    'no_overshoot': (0.2, 0.5, 1.0 / 3),
+}
+# the indices of the rules in the shared state
+RULE_NAMES = tuple(sorted(RULES))
+
+
+class AutotuneResult(collections.namedtuple('AutotuneResult', [
+        'ultimate_gain', 'ultimate_period', 'amplitude', 'kp', 'ki',
+        'kd'])):
+    """The outcome of a relay auto-tune: the ultimate gain (in heater
+    levels per degF) and period (in seconds) of the roaster, the amplitude
+    of the oscillation they were measured on (in degF, half of peak to
+    peak), and the PID gains computed from them, for pid.PID."""
+    __slots__ = ()
+
+
+def gains(ultimate_gain, ultimate_period, interval,
+          rule='ziegler_nichols'):
+    """Returns the (kp, ki, kd) gains of a tuning rule (a key of RULES)
+    for a roaster of the given ultimate gain and period.
+
+    pid.PID folds the time between its updates into ki and kd, so they are
+    scaled by interval, the time between two updates in seconds
+    (heater_segments * comm_period in thermostat mode).
+    """
+    if rule not in RULES:
+        raise exceptions.RoasterValueError
+    kp_ratio, ti_ratio, td_ratio = RULES[rule]
+    kp = kp_ratio * ultimate_gain
+    ti = ti_ratio * ultimate_period
+    td = td_ratio * ultimate_period
+    return kp, kp / ti * interval, kp * td / interval
+
+
+class RelayTuner(object):
+    """An Astrom-Hagglund relay experiment: the heat goes to high while the
+    temperature is below target_temp - hysteresis, and to low once it is
+    above target_temp + hysteresis, which makes the temperature oscillate
+    around target_temp at the ultimate period of the roaster. Its
+    amplitude gives the ultimate gain.
+
+    Call update() with every temperature sample. The experiment is over
+    once cycles full oscillations were measured after the first one, which
+    is the heat up and is left out.
+
+    Args:
+        target_temp (float): temperature to oscillate around, in degF.
+
+        high (int): heat level while heating.
+
+        low (int): heat level while cooling. Defaults to 0.
+
+        hysteresis (float): half the width of the dead band around
+        target_temp, in degF, to keep noise from flipping the relay.
+        Defaults to 2.
+
+        cycles (int): number of oscillations to average. Defaults to 3.
+    """
+    def __init__(self, target_temp, high, low=0, hysteresis=2.0, cycles=3):
+        if high <= low or hysteresis < 0 or cycles < 1:
+            raise exceptions.RoasterValueError
+        self.target_temp = target_temp
+        self.high = high
+        self.low = low
+        self.hysteresis = hysteresis
+        self.cycles = cycles
+        self.level = None
+        # times the relay switched to low, and the peaks and troughs of
+        # the temperature, in order
+        self._switches = []
+        self._peaks = []
+        self._troughs = []
+        self._extreme = None
+
+    @property
+    def done(self):
+        return len(self._switches) > self.cycles + 1
+
+    def update(self, now, temp):
+        """Takes the temperature at time now (in seconds), and returns the
+        heat level to apply."""
+        if self.level is None:
+            self.level = (self.high if temp < self.target_temp
+                          else self.low)
+        if self.level == self.high:
+            # the trough comes after the heat went back on
+            if self._extreme is None or temp < self._extreme:
+                self._extreme = temp
+            if temp > self.target_temp + self.hysteresis:
+                self.level = self.low
+                self._switches.append(now)
+                if self._switches[1:]:
+                    self._troughs.append(self._extreme)
+                self._extreme = temp
+        else:
+            if self._extreme is None or temp > self._extreme:
+                self._extreme = temp
+            if temp < self.target_temp - self.hysteresis:
+                self.level = self.high
+                if self._switches:
+                    self._peaks.append(self._extreme)
+                self._extreme = temp
+        return self.level
+
+    def result(self, interval, rule='ziegler_nichols'):
+        """Returns the AutotuneResult of the experiment, once done, with
+        the gains of rule (see gains())."""
+        if not self.done:
+            raise exceptions.RoasterStateError
+        switches = self._switches[-(self.cycles + 1):]
+        period = (switches[-1] - switches[0]) / self.cycles
+        peaks = self._peaks[-self.cycles:]
+        troughs = self._troughs[-self.cycles:]
+        amplitude = (sum(peaks) / len(peaks) -
+                     sum(troughs) / len(troughs)) / 2.0
+        # the describing function of a relay with hysteresis, on readings
+        # in whole degF
+        effective = amplitude
+        if amplitude > self.hysteresis:
+            effective = math.sqrt(amplitude ** 2 - self.hysteresis ** 2)
+        relay = (self.high - self.low) / 2.0
+        ultimate_gain = 4.0 * relay / (math.pi * max(effective, 0.5))
+        return AutotuneResult(
+            ultimate_gain, period, amplitude,
+            *gains(ultimate_gain, period, interval, rule))
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015-2016 Mark Spicer
+# Made available under the MIT license.
+
+import select
+import threading
+
+from freshroastsr700 import exceptions
+
+
+# names of the execution backends
+PROCESS = 'process'
+THREAD = 'thread'
+
+
+class ProcessBackend(object):
+    """Runs the comm engine in a child process. State it shares with the
+    user process lives in shared memory, guarded by multiprocessing
+    locks.
+
+    The factory methods mirror those of a multiprocessing context.
+    multiprocessing itself is only imported when one of them is first
+    called."""
+    name = PROCESS
+
+    def Event(self):
+        import multiprocessing as mp
+        return mp.Event()
+
+    def Lock(self):
+        import multiprocessing as mp
+        return mp.Lock()
+
+    def Condition(self, lock=None):
+        import multiprocessing as mp
+        return mp.Condition(lock)
+
+    def Pipe(self):
+        """Returns the (reader, writer) ends of a one way pipe, as
+        multiprocessing.Connections."""
+        import multiprocessing as mp
+        return mp.Pipe(duplex=False)
+
+    def RawValue(self, type_):
+        from multiprocessing import sharedctypes
+        return sharedctypes.RawValue(type_)
+
+    def RawArray(self, type_, size):
+        from multiprocessing import sharedctypes
+        return sharedctypes.RawArray(type_, size)
+
+    def start(self, target, args=(), name=None):
+        """Starts target(*args) as a daemon process, and returns it."""
+        import multiprocessing as mp
+        worker = mp.Process(target=target, args=args, name=name)
+        worker.daemon = True
+        worker.start()
+        return worker
+
+
+class ThreadBackend(object):
+    """Runs the comm engine as a thread of the user process, over plain
+    ctypes objects in private memory and threading locks. No process is
+    spawned and nothing needs to be pickled, which saves the memory and
+    start up time of an interpreter per roaster."""
+    name = THREAD
+
+    def Event(self):
+        return threading.Event()
+
+    def Lock(self):
+        return threading.Lock()
+
+    def Condition(self, lock=None):
+        return threading.Condition(lock)
+
+    def Pipe(self):
+        """Returns the (reader, writer) ends of a one way pipe, with the
+        parts of the multiprocessing.Connection interface used here. A
+        socket pair, so it can be selected on Windows as well."""
+        import socket
+        reader, writer = socket.socketpair()
+        return _PipeEnd(reader), _PipeEnd(writer)
+
+    def RawValue(self, type_):
+        return type_()
+
+    def RawArray(self, type_, size):
+        return (type_ * size)()
+
+    def start(self, target, args=(), name=None):
+        """Starts target(*args) as a daemon thread, and returns it."""
+        worker = threading.Thread(target=target, args=args, name=name,
+                                  daemon=True)
+        worker.start()
+        return worker
+
+
+class _PipeEnd(object):
+    # one end of a socket pair carrying single byte messages
+    def __init__(self, sock):
+        self._sock = sock
+
+    def fileno(self):
+        return self._sock.fileno()
+
+    def close(self):
+        self._sock.close()
+
+    def send_bytes(self, data):
+        self._sock.sendall(data)
+
+    def recv_bytes(self):
+        return self._sock.recv(1)
+
+    def poll(self, timeout=0.0):
+        return bool(select.select([self._sock], [], [], timeout)[0])
+
+
+_BACKENDS = {
+    PROCESS: ProcessBackend,
+    THREAD: ThreadBackend,
+}
+
+
+def get_backend(backend=None):
+    """Returns the backend object for a backend name (PROCESS or THREAD),
+    or backend itself if it already is a backend object. None selects
+    PROCESS.
+
+    Raises:
+        freshroastsr700.exceptions.RoasterValueError
+            Unknown backend name.
+    """
+    if backend is None:
+        backend = PROCESS
+    if isinstance(backend, (ProcessBackend, ThreadBackend)):
+        return backend
+    if backend not in _BACKENDS:
+        raise exceptions.RoasterValueError
+    return _BACKENDS[backend]()
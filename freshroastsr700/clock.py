@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015-2016 Mark Spicer
+# Made available under the MIT license.
+
+import time
+import ctypes
+
+from freshroastsr700 import backend as backends
+from freshroastsr700 import exceptions
+
+
+class Clock(object):
+    """The time source of a roaster's comm engine: the comm cycle, the
+    countdown, the connection and handshake timeouts and the time stamps of
+    telemetry records all follow it. This one is the system clock; see
+    ScaledClock and VirtualClock for clocks that run faster.
+
+    Durations measured for stats() (read and write times, latencies) are
+    always taken on the system clock, as they measure the library itself.
+
+    The comm engine never blocks but through wait() and sleep(), which
+    lets a clock decide how long a timeout really lasts.
+    """
+    def monotonic(self):
+        """Seconds on the clock, for deadlines (cf. time.monotonic())."""
+        return time.monotonic()
+
+    def time(self):
+        """Seconds since the epoch, for time stamps (cf. time.time())."""
+        return time.time()
+
+    def wait(self, waiter, timeout):
+        """Calls waiter, a function blocking for up to its only argument
+        in seconds of real time (forever if None), so that it blocks for up
+        to timeout seconds on this clock, and returns what it returns: true
+        if what it waited for happened."""
+        return waiter(timeout)
+
+    def sleep(self, seconds):
+        """Blocks for seconds on this clock."""
+        time.sleep(seconds)
+
+
+# the default clock
+SYSTEM = Clock()
+
+
+class ScaledClock(Clock):
+    """A clock running rate times as fast as the system clock, from the
+    time it is created. Timeouts are cut by as much, so that everything
+    waited for is on time at the faster pace.
+
+    Works across processes, as long as the system's monotonic clock does
+    (it does on Linux, macOS and Windows).
+
+    Args:
+        rate (float): seconds on this clock per real second.
+
+    Raises:
+        freshroastsr700.exceptions.RoasterValueError
+            rate is not positive.
+    """
+    def __init__(self, rate):
+        if rate <= 0:
+            raise exceptions.RoasterValueError
+        self.rate = rate
+        self._start = time.monotonic()
+        self._epoch = time.time()
+
+    def monotonic(self):
+        return self._start + (time.monotonic() - self._start) * self.rate
+
+    def time(self):
+        return self._epoch + (time.monotonic() - self._start) * self.rate
+
+    def wait(self, waiter, timeout):
+        if timeout is None:
+            return waiter(None)
+        return waiter(timeout / self.rate)
+
+    def sleep(self, seconds):
+        time.sleep(seconds / self.rate)
+
+
+class VirtualClock(Clock):
+    """A clock that only moves forward when the comm engine waits on it:
+    a wait for something that does not happen within grace seconds of real
+    time jumps the clock to the end of the timeout, and a sleep() jumps it
+    right away. A roast runs as fast as the roaster (typically a
+    simulator.SimulatedRoaster sharing the clock) answers, and since
+    whatever answers in time does so at the very time it was asked, every
+    control decision is taken at the same clock time, and on the same
+    samples, as it would be in real time.
+
+    Only a single thread (one comm loop, or the worker of a
+    fleet.RoasterFleet) may wait on a VirtualClock; any may read it.
+
+    Args:
+        start (float): initial monotonic() time. Defaults to that of the
+        system clock.
+
+        grace (float): seconds of real time a wait gives what it waits for
+        to happen, before jumping ahead. Defaults to 0.002, well above the
+        round trip of a simulator.Simulator.
+
+        backend: where the time lives, see backend.get_backend(). Defaults
+        to None, for shared memory.
+    """
+    def __init__(self, start=None, grace=0.002, backend=None):
+        if start is None:
+            start = time.monotonic()
+        self.grace = grace
+        self._now = backends.get_backend(backend).RawValue(ctypes.c_double)
+        self._now.value = start
+        self._epoch = time.time() - start
+
+    def monotonic(self):
+        return self._now.value
+
+    def time(self):
+        return self._epoch + self._now.value
+
+    def advance(self, seconds):
+        """Moves the clock forward by seconds."""
+        if seconds > 0:
+            self._now.value += seconds
+
+    def wait(self, waiter, timeout):
+        if timeout is None:
+            # nothing to jump to
+            return waiter(None)
+        result = waiter(min(timeout, self.grace))
+        if not result:
+            self.advance(timeout)
+        return result
+
+    def sleep(self, seconds):
+        self.advance(seconds)
@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015-2016 Mark Spicer
+# Made available under the MIT license.
+
+import os
+import socket
+import collections
+
+from freshroastsr700 import exceptions
+
+
+# VID:PID of the USB serial chip in the SR700
+SR700_VIDPID = '1A86:5523'
+
+SYSFS_TTY = '/sys/class/tty'
+DEV = '/dev'
+
+# netlink protocol and multicast group of the kernel's device events
+_NETLINK_KOBJECT_UEVENT = 15
+_KERNEL_GROUP = 1
+# how far up from a tty's device to look for the USB device it belongs to
+_MAX_DEPTH = 4
+
+
+class Device(collections.namedtuple('Device', [
+        'node', 'vid', 'pid', 'serial_number'])):
+    """A USB serial device. node is the device node (/dev/ttyUSB0), vid and
+    pid are the USB vendor and product ids as 4 upper case hex digits, and
+    serial_number is None if the device has none."""
+    __slots__ = ()
+
+    @property
+    def vidpid(self):
+        return '%s:%s' % (self.vid, self.pid)
+
+
+def read_device(name, sysfs_root=SYSFS_TTY, dev_root=DEV):
+    """Returns the Device for the tty called name (ttyUSB0), from sysfs,
+    or None if it is not a USB device."""
+    path = os.path.join(sysfs_root, name, 'device')
+    # USB serial adapters (ttyUSB) hang off a usb-serial port, modems
+    # (ttyACM) off a USB interface
+    subsystem = os.path.basename(
+        os.path.realpath(os.path.join(path, 'subsystem')))
+    if subsystem not in ('usb', 'usb-serial'):
+        return None
+    path = os.path.realpath(path)
+    for _ in range(_MAX_DEPTH):
+        try:
+            with open(os.path.join(path, 'idVendor')) as f:
+                vid = f.read().strip().upper()
+            with open(os.path.join(path, 'idProduct')) as f:
+                pid = f.read().strip().upper()
+        except (IOError, OSError):
+            path = os.path.dirname(path)
+            continue
+        try:
+            with open(os.path.join(path, 'serial')) as f:
+                serial_number = f.read().strip()
+        except (IOError, OSError):
+            serial_number = None
+        return Device(os.path.join(dev_root, name), vid, pid, serial_number)
+    return None
+
+
+def scan(sysfs_root=SYSFS_TTY, dev_root=DEV):
+    """Returns the list of USB serial Devices connected to the computer.
+
+    On Linux, reads sysfs, and only looks further at ttys backed by a
+    device, so virtual consoles and ptys cost a single stat each.
+    Elsewhere, falls back to pyserial's port enumeration."""
+    if not os.path.isdir(sysfs_root):
+        return _scan_comports()
+    devices = []
+    for name in os.listdir(sysfs_root):
+        if not os.path.exists(os.path.join(sysfs_root, name, 'device')):
+            continue
+        device = read_device(name, sysfs_root, dev_root)
+        if device is not None:
+            devices.append(device)
+    return devices
+
+
+def _scan_comports():
+    # imported here, so that importing freshroastsr700 does not load
+    # pyserial
+    from serial.tools import list_ports
+    devices = []
+    for port in list_ports.comports():
+        if port.vid is None:
+            continue
+        devices.append(Device(
+            port.device, '%04X' % port.vid, '%04X' % port.pid,
+            port.serial_number))
+    return devices
+
+
+class DeviceIndex(object):
+    """Devices indexed by node, by VID:PID and by serial number, so finding
+    one does not enumerate the ports of the system."""
+    def __init__(self, devices=()):
+        self._by_node = {}
+        self._by_vidpid = {}
+        self._by_serial_number = {}
+        self.update(devices)
+
+    def update(self, devices):
+        """Replaces the contents of the index."""
+        self._by_node = {}
+        self._by_vidpid = {}
+        self._by_serial_number = {}
+        for device in devices:
+            self.add(device)
+
+    def add(self, device):
+        self.remove(device.node)
+        self._by_node[device.node] = device
+        self._by_vidpid.setdefault(device.vidpid, []).append(device)
+        if device.serial_number is not None:
+            self._by_serial_number[device.serial_number] = device
+
+    def remove(self, node):
+        device = self._by_node.pop(node, None)
+        if device is None:
+            return
+        self._by_vidpid[device.vidpid].remove(device)
+        if not self._by_vidpid[device.vidpid]:
+            del self._by_vidpid[device.vidpid]
+        if self._by_serial_number.get(device.serial_number) == device:
+            del self._by_serial_number[device.serial_number]
+
+    def devices(self, vidpid=None):
+        """Returns the Devices with the given VID:PID (all Devices if None),
+        sorted by node."""
+        if vidpid is None:
+            devices = self._by_node.values()
+        else:
+            devices = self._by_vidpid.get(vidpid.upper(), ())
+        return sorted(devices)
+
+    def find(self, vidpid, serial_number=None, node=None):
+        """Returns the node of a device with the given VID:PID and, if not
+        None, serial number and node. Without either, the device with the
+        lowest node is chosen.
+
+        Raises:
+            freshroastsr700.exceptions.RoasterLookupError
+                No such device.
+        """
+        if node is not None:
+            device = self._by_node.get(node)
+            if (device is None or device.vidpid != vidpid.upper() or
+                    serial_number not in (None, device.serial_number)):
+                raise exceptions.RoasterLookupError
+            return node
+        if serial_number is not None:
+            device = self._by_serial_number.get(serial_number)
+            if device is None or device.vidpid != vidpid.upper():
+                raise exceptions.RoasterLookupError
+            return device.node
+        devices = self.devices(vidpid)
+        if not devices:
+            raise exceptions.RoasterLookupError
+        return devices[0].node
+
+
+class DeviceMonitor(object):
+    """Keeps a DeviceIndex of the USB serial devices up to date.
+
+    On Linux, the monitor listens to the kernel's hotplug events on a
+    netlink socket, and only reads sysfs for the ttys that come and go. As
+    sysfs does not support inotify, this is the only way to be told about
+    new devices. Where the socket cannot be opened, or if hotplug is False,
+    the monitor rescans every poll_interval seconds instead.
+
+    Args:
+        hotplug (bool): listen to hotplug events. Defaults to True.
+
+        poll_interval (float): seconds between rescans when polling.
+        Defaults to 0.25.
+    """
+    def __init__(self, hotplug=True, poll_interval=0.25,
+                 sysfs_root=SYSFS_TTY, dev_root=DEV):
+        self.poll_interval = poll_interval
+        self._sysfs_root = sysfs_root
+        self._dev_root = dev_root
+        self._sock = None
+        if hotplug and os.path.isdir(sysfs_root):
+            self._sock = _open_uevent_socket()
+        # open the socket first, so no device can slip in unnoticed
+        # between the scan and the first event
+        self.index = DeviceIndex(scan(sysfs_root, dev_root))
+
+    @property
+    def polling(self):
+        """True if the monitor rescans periodically."""
+        return self._sock is None
+
+    def fileno(self):
+        """File descriptor of the hotplug socket, readable when devices
+        may have come or gone. Only valid if not polling."""
+        return self._sock.fileno()
+
+    def refresh(self):
+        """Brings the index up to date: handles the pending hotplug events
+        or, if polling, rescans. Returns True if a device appeared."""
+        if self._sock is None:
+            before = set(self.index.devices())
+            self.index.update(scan(self._sysfs_root, self._dev_root))
+            return bool(set(self.index.devices()) - before)
+        appeared = False
+        while True:
+            try:
+                message = self._sock.recv(8192, socket.MSG_DONTWAIT)
+            except (BlockingIOError, InterruptedError):
+                return appeared
+            except OSError:
+                # the kernel dropped events (ENOBUFS): start over
+                self.index.update(scan(self._sysfs_root, self._dev_root))
+                return True
+            if self._handle(message):
+                appeared = True
+
+    def _handle(self, message):
+        fields = parse_uevent(message)
+        if fields.get('SUBSYSTEM') != 'tty' or 'DEVNAME' not in fields:
+            return False
+        name = os.path.basename(fields['DEVNAME'])
+        if fields.get('ACTION') == 'remove':
+            self.index.remove(os.path.join(self._dev_root, name))
+        elif fields.get('ACTION') == 'add':
+            device = read_device(name, self._sysfs_root, self._dev_root)
+            if device is not None:
+                self.index.add(device)
+                return True
+        return False
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+
+def parse_uevent(message):
+    """Returns the KEY=VALUE fields of a kernel uevent message as a dict of
+    strings."""
+    fields = {}
+    for part in message.split(b'\x00')[1:]:
+        key, sep, value = part.partition(b'=')
+        if sep:
+            fields[key.decode('ascii', 'replace')] = value.decode(
+                'utf-8', 'replace')
+    return fields
+
+
+def _open_uevent_socket():
+    # returns None where there is no netlink (not Linux) or it is not
+    # allowed (some containers)
+    try:
+        sock = socket.socket(
+            socket.AF_NETLINK, socket.SOCK_DGRAM, _NETLINK_KOBJECT_UEVENT)
+    except (AttributeError, OSError):
+        return None
+    try:
+        sock.bind((0, _KERNEL_GROUP))
+    except OSError:
+        sock.close()
+        return None
+    return sock
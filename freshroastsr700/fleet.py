@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015-2016 Mark Spicer
+# Made available under the MIT license.
+
+import heapq
+import logging
+import threading
+import selectors
+import itertools
+
+import freshroastsr700
+from freshroastsr700 import backend as backends
+from freshroastsr700 import clock as clocks
+from freshroastsr700 import discovery
+from freshroastsr700 import exceptions
+from freshroastsr700 import scheduler
+from freshroastsr700 import utils
+
+
+class RoasterFleet(object):
+    """Drives any number of roasters from a small pool of threads.
+
+    Every roaster of the fleet is a plain freshroastsr700, with the API and
+    behaviour of one running on the thread backend, and its own PID,
+    heater and countdown. But instead of a thread each, the comm loops of
+    all the roasters of a worker share that worker's thread, which waits
+    on all their serial ports and events at once. Connection attempts,
+    which block, run on short-lived threads of their own.
+
+    Args:
+        workers (int): number of worker threads. Roasters are spread over
+        them in turn. Defaults to 1.
+
+        clock (clock.Clock): the clock of all the roasters of the fleet,
+        see freshroastsr700. Defaults to None, for the system clock.
+    """
+    def __init__(self, workers=1, clock=None):
+        if workers < 1:
+            raise exceptions.RoasterValueError
+        self.clock = clock if clock is not None else clocks.SYSTEM
+        self._workers = [_Worker('sr700_fleet_%d' % i, self.clock)
+                         for i in range(workers)]
+        self.roasters = []
+
+    def add(self, port=None, serial_number=None, **kwargs):
+        """Creates a roaster driven by this fleet, and returns it.
+
+        Args:
+            port (str): device node of the roaster.
+
+            serial_number (str): USB serial number of the roaster.
+
+            **kwargs: other keyword arguments of freshroastsr700, except
+            backend and clock.
+        """
+        if 'backend' in kwargs or 'clock' in kwargs:
+            raise TypeError('RoasterFleet roasters take no backend or clock')
+        worker = self._workers[len(self.roasters) % len(self._workers)]
+        roaster = freshroastsr700.freshroastsr700(
+            backend=worker.backend, port=port, serial_number=serial_number,
+            clock=self.clock, **kwargs)
+        self.roasters.append(roaster)
+        return roaster
+
+    def add_connected(self, **kwargs):
+        """Adds a roaster for every SR700 connected to the computer, by
+        serial number where the adapter has one and by device node
+        otherwise, and returns the new roasters. kwargs are as for add()."""
+        index = discovery.DeviceIndex(discovery.scan())
+        added = []
+        for device in index.devices(discovery.SR700_VIDPID):
+            if device.serial_number is not None:
+                added.append(self.add(
+                    serial_number=device.serial_number, **kwargs))
+            else:
+                added.append(self.add(port=device.node, **kwargs))
+        return added
+
+    def __len__(self):
+        return len(self.roasters)
+
+    def __iter__(self):
+        return iter(self.roasters)
+
+    def __getitem__(self, key):
+        """Returns a roaster by position, or by the port or serial number
+        it was added with."""
+        if isinstance(key, int):
+            return self.roasters[key]
+        for roaster in self.roasters:
+            if key in (roaster._port, roaster._serial_number):
+                return roaster
+        raise KeyError(key)
+
+    def connect(self):
+        """Connects all the roasters at once, and waits for the outcome.
+        Will not retry.
+
+        Raises:
+            freshroastsr700.exceptions.RoasterLookupError
+                Some roaster was not found. The others are connected.
+        """
+        for roaster in self.roasters:
+            roaster._start_connect(roaster.CA_SINGLE_SHOT)
+        for roaster in self.roasters:
+            roaster._connect_settled_event.wait()
+        if not all(roaster.connected for roaster in self.roasters):
+            raise exceptions.RoasterLookupError
+
+    def auto_connect(self):
+        """Has every roaster connect when it is plugged in."""
+        for roaster in self.roasters:
+            roaster.auto_connect()
+
+    def terminate(self):
+        """Terminates all the roasters, and stops the worker threads."""
+        for roaster in self.roasters:
+            roaster.disconnect()
+        for roaster in self.roasters:
+            roaster.terminate()
+        for worker in self._workers:
+            worker.stop()
+
+
+class _FleetBackend(backends.ThreadBackend):
+    # the thread backend, except that comm loops are handed to a worker
+    # as step generators (see freshroastsr700._start_comm())
+    def __init__(self, worker):
+        self._worker = worker
+
+    def start_steps(self, steps, name=None, on_failure=None):
+        return self._worker.start_steps(steps, name, on_failure)
+
+
+class _Task(object):
+    """A comm loop run by a worker. Has the is_alive() and join() methods
+    of the thread it replaces. on_failure, if not None, is called on the
+    worker thread if the loop raises."""
+    def __init__(self, steps, name, on_failure=None):
+        self.name = name
+        self.steps = steps
+        self.on_failure = on_failure
+        self.fileobjs = ()
+        # bumped whenever the task is resumed, which cancels its timeout
+        self.generation = 0
+        self._done = threading.Event()
+
+    def is_alive(self):
+        return not self._done.is_set()
+
+    def join(self, timeout=None):
+        self._done.wait(timeout)
+
+
+class _Worker(object):
+    # a thread running the comm loops of several roasters
+    def __init__(self, name, clock):
+        self.name = name
+        self.backend = _FleetBackend(self)
+        self._clock = clock
+        self._lock = threading.Lock()
+        # (task, result, error) to resume the tasks with
+        self._resumes = []
+        self._stopping = False
+        self._wakeup = utils.SelectableEvent(backends.THREAD)
+        self._thread = None
+
+    def start_steps(self, steps, name=None, on_failure=None):
+        task = _Task(steps, name, on_failure)
+        self._resume(task)
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    name=self.name, target=self._run, daemon=True)
+                self._thread.start()
+        return task
+
+    def stop(self):
+        with self._lock:
+            self._stopping = True
+            thread = self._thread
+        self._wakeup.set()
+        if thread is not None:
+            thread.join()
+
+    def _resume(self, task, result=None, error=None):
+        # may be called from any thread
+        with self._lock:
+            self._resumes.append((task, result, error))
+        self._wakeup.set()
+
+    def _call(self, task, call):
+        # runs a blocking call on a thread of its own
+        def run():
+            try:
+                result = call.func(*call.args)
+            except Exception as e:
+                self._resume(task, error=e)
+            else:
+                self._resume(task, result)
+        threading.Thread(
+            name='%s_call' % self.name, target=run, daemon=True).start()
+
+    def _run(self):
+        selector = selectors.DefaultSelector()
+        selector.register(self._wakeup, selectors.EVENT_READ)
+        # (due, tiebreaker, generation, task) for the tasks with a timeout
+        timeouts = []
+        counter = itertools.count()
+        tasks = set()
+        # tasks woken up by their file objects
+        woken = set()
+        while True:
+            self._wakeup.clear()
+            with self._lock:
+                resumes, self._resumes = self._resumes, []
+                tasks.update(task for task, _, _ in resumes)
+                if self._stopping and not tasks:
+                    break
+            now = self._clock.monotonic()
+            while timeouts and timeouts[0][0] <= now:
+                _, _, generation, task = heapq.heappop(timeouts)
+                if generation == task.generation:
+                    woken.add(task)
+            due = dict((task, (None, None)) for task in woken)
+            due.update((task, (result, error))
+                       for task, result, error in resumes)
+            woken.clear()
+            for task, (result, error) in due.items():
+                request = self._step(task, result, error, selector)
+                if not task.is_alive():
+                    tasks.discard(task)
+                elif request is not None and request.timeout is not None:
+                    heapq.heappush(timeouts, (
+                        self._clock.monotonic() + request.timeout,
+                        next(counter), task.generation, task))
+            # drop the timeouts of tasks resumed since
+            while timeouts and timeouts[0][2] != timeouts[0][3].generation:
+                heapq.heappop(timeouts)
+            timeout = None
+            if timeouts:
+                timeout = max(
+                    0.0, timeouts[0][0] - self._clock.monotonic())
+            for key, _ in self._clock.wait(selector.select, timeout):
+                if key.data is not None:
+                    woken.add(key.data)
+        selector.close()
+
+    def _step(self, task, result, error, selector):
+        # resumes a task, and sets up what it waits for next. Returns the
+        # scheduler.Wait it yielded, or None if it is done or in a call.
+        task.generation += 1
+        self._watch(task, (), selector)
+        try:
+            if error is not None:
+                request = task.steps.throw(error)
+            else:
+                request = task.steps.send(result)
+        except StopIteration:
+            task._done.set()
+            return None
+        except Exception:
+            logging.exception('fleet - comm loop %s failed', task.name)
+            task._done.set()
+            if task.on_failure is not None:
+                task.on_failure()
+            return None
+        if isinstance(request, scheduler.Call):
+            self._call(task, request)
+            return None
+        self._watch(task, request.fileobjs, selector)
+        return request
+
+    def _watch(self, task, fileobjs, selector):
+        for fileobj in task.fileobjs:
+            selector.unregister(fileobj)
+        for fileobj in fileobjs:
+            selector.register(fileobj, selectors.EVENT_READ, task)
+        task.fileobjs = fileobjs
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015-2016 Mark Spicer
+# Made available under the MIT license.
+
+import os
+import sys
+import struct
+from multiprocessing import shared_memory
+
+from freshroastsr700 import clock as clocks
+from freshroastsr700 import exceptions
+
+
+_MAGIC = b'SR7H'
+# magic, entry size, capacity, count of entries ever written
+_HEADER = struct.Struct('<4sIIxxxxQ')
+_HEADER_SIZE = 64
+_COUNT = struct.Struct('<Q')
+_COUNT_OFFSET = 16
+# monotonic, current_temp, target_temp, heater_level, heat_setting,
+# fan_speed, state, time_remaining, link_gap (in what used to be the
+# padding to 8 byte alignment)
+_ENTRY = struct.Struct('<d7if')
+
+FIELDS = ('monotonic', 'current_temp', 'target_temp', 'heater_level',
+          'heat_setting', 'fan_speed', 'state', 'time_remaining',
+          'link_gap')
+
+
+def entry_dtype():
+    """Returns the NumPy structured dtype of a history entry."""
+    import numpy as np
+    return np.dtype({
+        'names': list(FIELDS),
+        'formats': ['<f8'] + ['<i4'] * 7 + ['<f4'],
+        'offsets': [0, 8, 12, 16, 20, 24, 28, 32, 36],
+        'itemsize': _ENTRY.size})
+
+
+class TelemetryHistory(object):
+    """A fixed-size ring of telemetry entries in a named shared memory
+    segment. The comm process appends one entry per decoded packet; any
+    number of other processes can attach to the segment by name and read
+    it as a NumPy structured array, without locks and, as long as the
+    requested entries do not wrap around the end of the ring, without
+    copying.
+
+    Entries have the fields listed in FIELDS. monotonic is the time on the
+    roaster's clock when the packet was decoded, state is an index into
+    telemetry.STATE_NAMES, and link_gap is as in telemetry.TelemetryRecord.
+    A freshroastsr700 given the history sets its clock attribute to its
+    own clock, which last() reads.
+
+    Arrays returned by the readers are views of live shared memory. An
+    entry is overwritten capacity - 1 appends after it was written (over
+    17 minutes for the default capacity at 4 Hz); copy() arrays that need
+    to outlive that.
+
+    Args:
+        capacity (int): number of entries in the ring. Defaults to 4096,
+        a 15 minute roast with room to spare.
+
+        name (str): name of the shared memory segment, which readers pass
+        to attach(). Defaults to None, for a name chosen by the system.
+
+        clock (clock.Clock): the clock the entries are stamped with.
+        Defaults to None, for the system clock.
+    """
+    def __init__(self, capacity=4096, name=None, clock=None):
+        if capacity < 2:
+            raise exceptions.RoasterValueError
+        self._shm = shared_memory.SharedMemory(
+            name=name, create=True,
+            size=_HEADER_SIZE + capacity * _ENTRY.size)
+        self._owner = True
+        self._setup(capacity, clock)
+        _HEADER.pack_into(self._shm.buf, 0, _MAGIC, _ENTRY.size, capacity, 0)
+
+    @classmethod
+    def attach(cls, name, clock=None):
+        """Maps an existing history, created by another process, for
+        reading. clock is as for TelemetryHistory."""
+        history = cls.__new__(cls)
+        history._shm = _attach(name)
+        history._owner = False
+        magic, entry_size, capacity, _ = _HEADER.unpack_from(
+            history._shm.buf, 0)
+        if magic != _MAGIC or entry_size != _ENTRY.size:
+            history._shm.close()
+            raise exceptions.RoasterValueError
+        history._setup(capacity, clock)
+        return history
+
+    def _setup(self, capacity, clock):
+        self.capacity = capacity
+        self.name = self._shm.name
+        self.clock = clock if clock is not None else clocks.SYSTEM
+        self._buf = self._shm.buf
+
+    def __getstate__(self):
+        return {'name': self.name, 'clock': self.clock}
+
+    def __setstate__(self, state):
+        # a process receiving the history maps it without taking
+        # ownership, so it does not unlink the segment when it exits
+        self._shm = _attach(state['name'])
+        self._owner = False
+        self._setup(_HEADER.unpack_from(self._shm.buf, 0)[2],
+                    state['clock'])
+
+    @property
+    def count(self):
+        """Number of entries appended since the history was created."""
+        return _COUNT.unpack_from(self._buf, _COUNT_OFFSET)[0]
+
+    def append(self, record):
+        """Appends a telemetry.TelemetryRecord. Only one process may
+        append to a history."""
+        count = self.count
+        _ENTRY.pack_into(
+            self._buf, _HEADER_SIZE + (count % self.capacity) * _ENTRY.size,
+            record.monotonic, record.current_temp, record.target_temp,
+            record.heater_level, record.heat_setting, record.fan_speed,
+            record.state, record.time_remaining, record.link_gap)
+        # publishing the new count is what makes the entry visible
+        _COUNT.pack_into(self._buf, _COUNT_OFFSET, count + 1)
+
+    def ring(self):
+        """Returns the whole ring as a NumPy structured array, in storage
+        order, along with the count it was taken at. Entry i of the
+        history lives at index i % capacity."""
+        import numpy as np
+        count = self.count
+        return np.ndarray(
+            (self.capacity,), dtype=entry_dtype(), buffer=self._buf,
+            offset=_HEADER_SIZE), count
+
+    def latest(self, n=None):
+        """Returns the last n entries (all retained entries if None), oldest
+        first. This is a view, unless the entries wrap around the end of
+        the ring, in which case it is a copy."""
+        import numpy as np
+        ring, count = self.ring()
+        # the slot after the newest entry may be rewritten at any moment
+        available = min(count, self.capacity - 1)
+        if n is None or n > available:
+            n = available
+        start = (count - n) % self.capacity
+        end = start + n
+        if end <= self.capacity:
+            return ring[start:end]
+        return np.concatenate((ring[start:], ring[:end - self.capacity]))
+
+    def last(self, seconds, now=None):
+        """Returns the entries decoded within the last seconds, oldest
+        first, as with latest().
+
+        Args:
+            seconds (float): length of the window.
+
+            now (float): end of the window, on the history's clock.
+            Defaults to the current time.
+        """
+        import numpy as np
+        if now is None:
+            now = self.clock.monotonic()
+        entries = self.latest()
+        start = np.searchsorted(entries['monotonic'], now - seconds)
+        return entries[start:]
+
+    def close(self):
+        """Unmaps the history. The process that created it also removes
+        the shared memory segment. All arrays obtained from this object
+        must have been released."""
+        self._buf = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+
+def _attach(name):
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    shm = shared_memory.SharedMemory(name=name)
+    if os.name != 'posix':
+        return shm
+    # before 3.13, attaching registers the segment with this process'
+    # resource tracker, which would unlink it when this process exits
+    from multiprocessing import resource_tracker
+    resource_tracker.unregister(shm._name, 'shared_memory')
+    return shm
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015-2016 Mark Spicer
+# Made available under the MIT license.
+
+from freshroastsr700 import exceptions
+
+
+# values of the modulation argument of freshroastsr700
+TABLE = 'table'
+SIGMA_DELTA = 'sigma_delta'
+
+
+class SigmaDeltaModulator(object):
+    """A first order sigma-delta (error diffusion) modulator for the
+    bang-bang heater, a drop-in replacement for
+    freshroastsr700.heat_controller.
+
+    Every pulse adds heat_level to an accumulator, and the heater goes on
+    (taking number_of_segments out of it) whenever the accumulator reaches
+    half of number_of_segments, which spreads on pulses as evenly as they
+    can be over any number of ticks, at any resolution. The accumulator
+    holds heat levels rather than fractions of a pulse, so that whole
+    levels add up exactly. A new heat_level is picked up by the very next
+    pulse, so about_to_rollover() is always True, and the PID controller
+    runs on every tick.
+
+    Args:
+        number_of_segments (int): full heat, as for heat_controller. The
+        heat level is not rounded, so this only sets the scale of
+        heat_level. Defaults to 8.
+    """
+    def __init__(self, number_of_segments=8):
+        if number_of_segments <= 0:
+            raise exceptions.RoasterValueError
+        self._num_segments = number_of_segments
+        self._heat_level = 0.0
+        # the heat asked for that has not been output yet, in heat levels,
+        # in [-number_of_segments / 2, number_of_segments / 2)
+        self._error = 0.0
+
+    @property
+    def heat_level(self):
+        """Set/Get the desired output level, between 0 and
+        number_of_segments inclusive, fractions included. Values out of
+        range are clamped."""
+        return self._heat_level
+
+    @heat_level.setter
+    def heat_level(self, value):
+        self._heat_level = float(min(max(value, 0), self._num_segments))
+
+    def generate_bangbang_output(self):
+        """Returns the next on (True) or off (False) pulse of the output."""
+        self._error += self._heat_level
+        out = 2 * self._error >= self._num_segments
+        if out:
+            self._error -= self._num_segments
+        return out
+
+    def about_to_rollover(self):
+        """Always True: a new heat_level can be set before every pulse."""
+        return True
+
+
+def controller_gains(kp, ki, kd, number_of_segments=8, modulation=TABLE):
+    """Returns the gains to give pid.PID for the gains kp, ki and kd of
+    freshroastsr700. pid.PID folds the time between its updates into ki
+    and kd, and freshroastsr700's gains are meant for an update every
+    number_of_segments comm cycles, which is how often heat_controller
+    takes a new level. The PID updates on every comm cycle with
+    SigmaDeltaModulator, so the gains are scaled to match.
+    """
+    if modulation == SIGMA_DELTA:
+        return kp, ki / number_of_segments, kd * number_of_segments
+    if modulation != TABLE:
+        raise exceptions.RoasterValueError
+    return kp, ki, kd
@@ -64,6 +64,26 @@ class PID(object):
         self.Integrator = 0
         self.Derivator = 0
 
+    def setGains(self, P, I, D):
+        """Changes all three gains of a running controller. The integrator
+        is rescaled so that the integral term carries on where it was,
+        for a bumpless change."""
+        if I > 0.0 and self.Ki > 0.0:
+            self.Integrator = self.Integrator * self.Ki / I
+        else:
+            self.Integrator = 0.0
+        self.Kp = P
+        self.Ki = I
+        self.Kd = D
+        if(I > 0.0):
+            self.Integrator_max = self.Output_max / I
+            self.Integrator_min = self.Output_min / I
+        else:
+            self.Integrator_max = 0.0
+            self.Integrator_min = 0.0
+        self.Integrator = min(max(self.Integrator, self.Integrator_min),
+                              self.Integrator_max)
+
     def setIntegrator(self, Integrator):
         self.Integrator = Integrator
 
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015-2016 Mark Spicer
+# Made available under the MIT license.
+
+import struct
+
+from freshroastsr700 import utils
+
+
+HEADER = b'\xAA\xAA'
+INIT_HEADER = b'\xAA\x55'
+FOOTER = b'\xAA\xFA'
+PACKET_LENGTH = 14
+PAYLOAD_LENGTH = 10
+
+# offsets into the 10 byte payload (the packet minus header and footer)
+PAYLOAD_FLAGS = 2
+PAYLOAD_FAN = 5
+PAYLOAD_TIME = 6
+PAYLOAD_HEAT = 7
+PAYLOAD_TEMP = 8
+
+# flags field values of the packets sent by the roaster: an ordinary
+# response, the manual settings, and the lines of a recipe read back
+FLAGS_ROASTER = 0x00
+FLAGS_MANUAL = 0xA0
+FLAGS_RECIPE = 0xAA
+FLAGS_RECIPE_END = 0xAF
+
+_TEMP = struct.Struct('>H')
+_FIELD_1 = struct.Struct('>B')
+_FIELD_2 = struct.Struct('>2s')
+_FIXED = struct.Struct('>2s2sc2sBBB2s2s')
+
+# offsets into a full packet
+_HEADER_OFFSET = 0
+_STATE_OFFSET = 5
+_FAN_OFFSET = 7
+_TIME_OFFSET = 8
+_HEAT_OFFSET = 9
+
+
+def payload_temp(payload):
+    """Returns the raw current temperature field of a response payload."""
+    return _TEMP.unpack_from(payload, PAYLOAD_TEMP)[0]
+
+
+class PacketFramer(object):
+    """Splits the byte stream coming from the roaster into packets.
+
+    Bytes are appended to a preallocated bytearray with feed(), and complete
+    packets are then pulled out with next_frame(). Garbage between packets
+    (partial packets after a reconnect, line noise) is skipped by searching
+    for the next header.
+
+    Args:
+        capacity (int): size of the internal buffer, in bytes. Defaults to
+        512, which holds well over a full recipe readback burst. Data that
+        would overflow the buffer discards the oldest unframed bytes.
+    """
+    def __init__(self, capacity=512):
+        self._buf = bytearray(capacity)
+        # payloads are copied out through the view, in a single copy. The
+        # buffer is never resized, which the view would not allow.
+        self._view = memoryview(self._buf)
+        self._start = 0
+        self._end = 0
+        # number of frames dropped while resyncing to a header
+        self.bad_frames = 0
+
+    def __len__(self):
+        return self._end - self._start
+
+    def reset(self):
+        """Discards any buffered, unframed bytes."""
+        self._start = 0
+        self._end = 0
+
+    def feed(self, data):
+        """Appends data read from the device to the framing buffer."""
+        n = len(data)
+        capacity = len(self._buf)
+        if n >= capacity:
+            # keep only the newest bytes, nothing buffered survives
+            data = data[n - capacity:]
+            n = capacity
+            self._start = self._end = 0
+        elif self._end + n > capacity:
+            pending = self._end - self._start
+            if pending + n > capacity:
+                # overflow, drop the oldest bytes
+                self._start += pending + n - capacity
+                pending = capacity - n
+            self._buf[0:pending] = self._buf[self._start:self._end]
+            self._start = 0
+            self._end = pending
+        self._buf[self._end:self._end + n] = data
+        self._end += n
+
+    def next_frame(self):
+        """Returns the 10 byte payload of the next complete packet in the
+        buffer, or None if no complete packet is available yet.
+
+        The SR700 firmware does not transmit the footer when the current
+        temperature is 250degF (0xFA as the last payload byte). Such packets
+        are accepted without a footer.
+        """
+        buf = self._buf
+        while True:
+            start = buf.find(HEADER, self._start, self._end)
+            if start < 0:
+                # no header, keep a trailing 0xAA in case it starts one
+                if self._end > self._start and buf[self._end - 1] == 0xAA:
+                    self._start = self._end - 1
+                else:
+                    self._start = self._end
+                return None
+            self._start = start
+            available = self._end - start
+            if available < 2 + PAYLOAD_LENGTH:
+                return None
+            payload_end = start + 2 + PAYLOAD_LENGTH
+            if buf[payload_end - 1] == 0xFA:
+                # firmware quirk, no footer follows
+                self._start = payload_end
+                return bytes(self._view[start + 2:payload_end])
+            if available < PACKET_LENGTH:
+                return None
+            if buf.find(FOOTER, payload_end, payload_end + 2) == payload_end:
+                self._start = payload_end + 2
+                return bytes(self._view[start + 2:payload_end])
+            # not a valid packet, resync on the next header
+            self.bad_frames += 1
+            self._start = start + 1
+
+    def frames(self):
+        """Generates the payloads of all complete packets in the buffer."""
+        frame = self.next_frame()
+        while frame is not None:
+            yield frame
+            frame = self.next_frame()
+
+
+class PacketEncoder(object):
+    """Builds the packets sent to the roaster in a preallocated 14 byte
+    buffer.
+
+    The packet template is written once. Subsequent calls to encode() only
+    rewrite the fields whose value differs from the previous packet, and
+    return a memoryview over the template, so a packet that does not change
+    from one cycle to the next costs no allocation at all. The returned view
+    is only valid until the next call to encode().
+
+    Args:
+        temp_unit (bytes): 2 byte temperature unit field. Defaults to
+        Fahrenheit.
+
+        flags (bytes): 1 byte flags field. Defaults to 0x63, the flags used
+        by packets sent from the computer.
+    """
+    def __init__(self, temp_unit=b'\x61\x74', flags=b'\x63'):
+        self._packet = bytearray(PACKET_LENGTH)
+        self._view = memoryview(self._packet)
+        self._header = HEADER
+        self._state = b'\x00\x00'
+        self._fan_speed = 0
+        self._time_remaining = 0
+        self._heat_setting = 0
+        _FIXED.pack_into(
+            self._packet, 0, self._header, temp_unit, flags, self._state,
+            self._fan_speed, 0, self._heat_setting, b'\x00\x00', FOOTER)
+
+    def encode(self, header, state, fan_speed, time_remaining,
+               heat_setting):
+        """Updates the packet and returns a memoryview of it.
+
+        Args:
+            header (bytes): HEADER, or INIT_HEADER for the initialization
+            packet.
+
+            state (bytes): 2 byte current state field. Shorter values are
+            padded with null bytes. Any other 2 byte buffer, such as the
+            current_state of a state.StateBlock, is copied in as it is,
+            with no need for a bytes copy of it.
+
+            fan_speed (int): fan speed, 1 to 9.
+
+            time_remaining (int): time remaining, in seconds.
+
+            heat_setting (int): heat setting, 0 to 3.
+
+        Returns:
+            (memoryview) the 14 byte packet
+        """
+        if header != self._header:
+            _FIELD_2.pack_into(self._packet, _HEADER_OFFSET, header)
+            self._header = header
+        if not isinstance(state, bytes):
+            # its contents may have changed since the previous call, and
+            # copying 2 bytes costs no more than comparing them
+            self._packet[_STATE_OFFSET:_STATE_OFFSET + 2] = state
+            self._state = None
+        elif state != self._state:
+            _FIELD_2.pack_into(self._packet, _STATE_OFFSET, state)
+            self._state = state
+        if fan_speed != self._fan_speed:
+            _FIELD_1.pack_into(self._packet, _FAN_OFFSET, fan_speed)
+            self._fan_speed = fan_speed
+        if time_remaining != self._time_remaining:
+            roaster_time = utils.seconds_to_float(time_remaining)
+            _FIELD_1.pack_into(
+                self._packet, _TIME_OFFSET, int(round(roaster_time * 10.0)))
+            self._time_remaining = time_remaining
+        if heat_setting != self._heat_setting:
+            _FIELD_1.pack_into(self._packet, _HEAT_OFFSET, heat_setting)
+            self._heat_setting = heat_setting
+        return self._view
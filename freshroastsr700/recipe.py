@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015-2016 Mark Spicer
+# Made available under the MIT license.
+
+import ctypes
+import collections
+
+from freshroastsr700 import backend as backends
+from freshroastsr700 import protocol
+
+
+# most lines a readback is expected to hold: the manual settings, and the
+# lines of a recipe
+MAX_LINES = 16
+
+# a reader that keeps seeing the writer at work (e.g. it was killed
+# mid-update) gives up after this many tries
+_MAX_SPINS = 1000
+
+
+class RecipeStep(collections.namedtuple('RecipeStep', [
+        'fan_speed', 'time', 'heat_setting'])):
+    """One line of a recipe stored on the roaster: fan speed (1 to 9),
+    time in seconds, to the 6 second resolution of the roaster's display,
+    and heat setting (0 to 3)."""
+    __slots__ = ()
+
+
+class Recipe(collections.namedtuple('Recipe', ['manual', 'steps'])):
+    """The recipe read back from the roaster when connecting. manual is the
+    RecipeStep of the settings last made on the roaster's buttons, or None
+    if it sent none, and steps the list of RecipeSteps of the recipe last
+    saved to it."""
+    __slots__ = ()
+
+    @property
+    def total_time(self):
+        """Length of the recipe, in seconds."""
+        return sum(step.time for step in self.steps)
+
+
+def parse_line(payload):
+    """Returns the RecipeStep held by the payload of a readback packet."""
+    return RecipeStep(
+        payload[protocol.PAYLOAD_FAN],
+        payload[protocol.PAYLOAD_TIME] * 6,
+        payload[protocol.PAYLOAD_HEAT])
+
+
+def parse(payloads):
+    """Returns the Recipe held by the payloads of a readback."""
+    manual = None
+    steps = []
+    for payload in payloads:
+        flags = payload[protocol.PAYLOAD_FLAGS]
+        if flags == protocol.FLAGS_MANUAL:
+            manual = parse_line(payload)
+        elif flags in (protocol.FLAGS_RECIPE, protocol.FLAGS_RECIPE_END):
+            steps.append(parse_line(payload))
+    return Recipe(manual, steps)
+
+
+class RecipeReader(object):
+    """The receiving end of the connection handshake, as a state machine:
+    after the initialization packet, the roaster sends a burst of packets
+    holding its recipe, the last of which is flagged FLAGS_RECIPE_END. A
+    roaster with nothing to send answers with an ordinary packet instead.
+
+    Feed it the payloads received, in order, until done is True.
+    """
+    def __init__(self):
+        self.payloads = []
+        self.done = False
+
+    def feed(self, payload):
+        """Takes the payload of the next packet received, and returns
+        done. Payloads after the end of the readback are ignored."""
+        if self.done:
+            return True
+        flags = payload[protocol.PAYLOAD_FLAGS]
+        if flags != protocol.FLAGS_ROASTER:
+            self.payloads.append(payload)
+        if flags in (protocol.FLAGS_RECIPE_END, protocol.FLAGS_ROASTER):
+            self.done = True
+        return self.done
+
+    def recipe(self):
+        """Returns the Recipe read so far."""
+        return parse(self.payloads)
+
+
+class RecipeBuffer(ctypes.Structure):
+    """The payloads of the last readback, in shared memory, so the comm
+    process can hand them to the user process. seq is the sequence counter
+    of a seqlock, as in state.StateBlock, and count is -1 until a readback
+    was published."""
+    _fields_ = [
+        ('seq', ctypes.c_uint32),
+        ('count', ctypes.c_int32),
+        ('payloads', ctypes.c_ubyte * (protocol.PAYLOAD_LENGTH * MAX_LINES)),
+    ]
+
+
+def create_recipe_buffer(backend=None):
+    """Returns an empty RecipeBuffer, in shared memory unless another
+    backend is given (see backend.get_backend())."""
+    buffer_ = backends.get_backend(backend).RawValue(RecipeBuffer)
+    buffer_.count = -1
+    return buffer_
+
+
+def publish(buffer_, payloads):
+    """Stores the payloads of a readback in a RecipeBuffer. Lines beyond
+    MAX_LINES are dropped. Only one process may publish to a buffer."""
+    payloads = payloads[:MAX_LINES]
+    buffer_.seq += 1
+    try:
+        data = b''.join(payloads)
+        ctypes.memmove(buffer_.payloads, data, len(data))
+        buffer_.count = len(payloads)
+    finally:
+        buffer_.seq += 1
+
+
+def read(buffer_):
+    """Returns the Recipe last published to a RecipeBuffer, or None if
+    there is none."""
+    for _ in range(_MAX_SPINS):
+        seq = buffer_.seq
+        if seq & 1:
+            continue
+        count = buffer_.count
+        data = bytes(buffer_.payloads)
+        if buffer_.seq == seq:
+            break
+    else:
+        return None
+    if count < 0:
+        return None
+    length = protocol.PAYLOAD_LENGTH
+    return parse([data[i * length:(i + 1) * length] for i in range(count)])
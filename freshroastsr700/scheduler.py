@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015-2016 Mark Spicer
+# Made available under the MIT license.
+
+import time
+import ctypes
+import select
+import functools
+import collections
+
+from freshroastsr700 import backend as backends
+from freshroastsr700 import clock as clocks
+from freshroastsr700 import exceptions
+
+
+# what to do with deadlines missed because a cycle ran too long
+SKIP = 'skip'
+CATCH_UP = 'catch_up'
+
+# upper bounds of the jitter histogram bins, in milliseconds. The last
+# bin counts everything above the last bound.
+JITTER_BINS_MS = (1, 2, 5, 10, 20, 50, 100, 250)
+
+
+class CycleStats(ctypes.Structure):
+    """Counters kept by a CycleScheduler. Lives in shared memory so the
+    process owning the scheduler can be observed from other processes."""
+    _fields_ = [
+        ('cycles', ctypes.c_uint64),
+        ('overruns', ctypes.c_uint64),
+        ('skipped', ctypes.c_uint64),
+        ('max_jitter', ctypes.c_double),
+        ('jitter_histogram', ctypes.c_uint64 * (len(JITTER_BINS_MS) + 1)),
+    ]
+
+
+def create_cycle_stats(backend=None):
+    """Returns a zeroed CycleStats, in shared memory unless another
+    backend is given (see backend.get_backend())."""
+    return backends.get_backend(backend).RawValue(CycleStats)
+
+
+class CycleScheduler(object):
+    """Runs a loop on a fixed period, against absolute time.monotonic()
+    deadlines, so neither wall clock adjustments nor the time spent in each
+    cycle make the loop drift.
+
+    Call begin_cycle() at the top of every cycle, and wait for timeout()
+    seconds at the bottom (see Wait), on the scheduler's clock.
+
+    Args:
+        period (float): cycle period, in seconds. Defaults to 0.25.
+
+        policy (str): SKIP (the default) drops the deadlines missed by a
+        cycle that overran, and carries on from the next one on the
+        original time grid. CATCH_UP runs one cycle per missed deadline,
+        back to back, until the loop is on time again.
+
+        stats (CycleStats): where to keep counters. Defaults to a new
+        CycleStats in shared memory.
+
+        clock (func): the time source. Defaults to time.monotonic.
+    """
+    def __init__(self, period=0.25, policy=SKIP, stats=None,
+                 clock=time.monotonic):
+        if period <= 0 or policy not in (SKIP, CATCH_UP):
+            raise exceptions.RoasterValueError
+        self.period = period
+        self.policy = policy
+        self.stats = stats if stats is not None else create_cycle_stats()
+        self._clock = clock
+        self._deadline = None
+        # timeout() only counts an overrun the first time it is called in
+        # a cycle
+        self._overrun_checked = False
+
+    @property
+    def deadline(self):
+        """Time the current cycle was (or the next cycle will be) due."""
+        return self._deadline
+
+    def start(self):
+        """Makes the first cycle due right away."""
+        self._deadline = self._clock()
+        self._overrun_checked = False
+
+    def begin_cycle(self):
+        """Marks the start of a cycle. Records how late it started and
+        schedules the next deadline. Returns the lateness, in seconds."""
+        now = self._clock()
+        if self._deadline is None:
+            self._deadline = now
+        lateness = max(0.0, now - self._deadline)
+        stats = self.stats
+        stats.cycles += 1
+        if lateness > stats.max_jitter:
+            stats.max_jitter = lateness
+        lateness_ms = lateness * 1000.0
+        for i, bound in enumerate(JITTER_BINS_MS):
+            if lateness_ms <= bound:
+                stats.jitter_histogram[i] += 1
+                break
+        else:
+            stats.jitter_histogram[len(JITTER_BINS_MS)] += 1
+        if self.policy == SKIP and lateness >= self.period:
+            missed = int(lateness // self.period)
+            stats.skipped += missed
+            self._deadline += missed * self.period
+        self._deadline += self.period
+        self._overrun_checked = False
+        return lateness
+
+    def remaining(self):
+        """Seconds left until the next cycle is due (negative if late)."""
+        return self._deadline - self._clock()
+
+    def timeout(self, until=None):
+        """Returns how long to wait for the next cycle, in seconds, or None
+        if it is already due. If until (a time on the scheduler's clock)
+        comes before the next cycle is due, the wait ends at until instead.
+        Counts an overrun if the cycle's work ran past the next deadline.
+        May be called again after an early wake up."""
+        remaining = self.remaining()
+        checked, self._overrun_checked = self._overrun_checked, True
+        if remaining <= 0:
+            if not checked:
+                # this cycle's work ran past the next deadline
+                self.stats.overruns += 1
+            return None
+        if until is not None and until < self._deadline:
+            remaining = max(0.0, until - self._clock())
+        return remaining
+
+
+def jitter_histogram(stats):
+    """Returns the jitter histogram of a CycleStats as a list of
+    (upper bound in ms, count) tuples. The last bound is None."""
+    bounds = list(JITTER_BINS_MS) + [None]
+    return list(zip(bounds, stats.jitter_histogram))
+
+
+class Wait(collections.namedtuple('Wait', ['fileobjs', 'timeout'])):
+    """Yielded by a step generator (see run_steps()) to be resumed once
+    any of fileobjs (objects with a fileno()) is readable, or after
+    timeout seconds (never if None). The generator is sent None, and
+    checks for itself what woke it up."""
+    __slots__ = ()
+
+
+class Call(collections.namedtuple('Call', ['func', 'args'])):
+    """Yielded by a step generator (see run_steps()) to have func(*args)
+    run, for calls that block for long. The generator is sent the result,
+    or has the exception thrown into it."""
+    __slots__ = ()
+
+
+def run_steps(steps, clock=None):
+    """Runs a step generator to completion in the calling thread, and
+    returns its return value.
+
+    A step generator is a loop written as a generator, which yields a Wait
+    or a Call wherever it would block, so that the same loop can either
+    run on its own thread (here) or share a thread with others (see
+    fleet.RoasterFleet). The timeouts of the Waits are in seconds on clock
+    (a clock.Clock), the system clock by default."""
+    if clock is None:
+        clock = clocks.SYSTEM
+    result = None
+    error = None
+    while True:
+        try:
+            if error is not None:
+                request = steps.throw(error)
+            else:
+                request = steps.send(result)
+        except StopIteration as stop:
+            return stop.value
+        result = error = None
+        if isinstance(request, Call):
+            try:
+                result = request.func(*request.args)
+            except Exception as e:
+                error = e
+        else:
+            clock.wait(functools.partial(wait_readable, request.fileobjs),
+                       request.timeout)
+
+
+def wait_readable(fileobjs, timeout=None):
+    """Blocks until any of fileobjs is readable, or for timeout seconds
+    (forever if None). Returns True if one is readable.
+
+    A single object with a wait() method (an Event look-alike) is waited
+    on with it, which also works for pipes that cannot be selected, such
+    as multiprocessing pipes on Windows."""
+    if not fileobjs:
+        if timeout is not None:
+            time.sleep(timeout)
+        return False
+    if len(fileobjs) == 1 and hasattr(fileobjs[0], 'wait'):
+        return bool(fileobjs[0].wait(timeout))
+    return bool(select.select(fileobjs, [], [], timeout)[0])
@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015-2016 Mark Spicer
+# Made available under the MIT license.
+
+import math
+import time
+import random
+import struct
+import logging
+import threading
+import selectors
+
+from freshroastsr700 import backend as backends
+from freshroastsr700 import protocol
+from freshroastsr700 import recipe
+from freshroastsr700 import transport
+from freshroastsr700 import utils
+
+
+# current_state values of the roaster
+ROASTING = b'\x04\x02'
+COOLING = b'\x04\x04'
+
+# temperature field sent while the roaster reads less than 150degF
+_TEMP_LOW = b'\xFF\x00'
+_LOWEST_TEMP = 150
+# footer-less packets are sent at 250degF, whose temperature field ends
+# with 0xFA, see protocol.PacketFramer
+_NO_FOOTER_TEMP = 250
+
+# header, temperature unit, flags, current state, fan speed, time
+# remaining, heat setting, current temperature
+_PACKET = struct.Struct('>2s2sB2sBBB2s')
+
+# the readback example of docs/communication_protocol.rst
+DEFAULT_RECIPE = recipe.Recipe(
+    recipe.RecipeStep(9, 354, 2),
+    [recipe.RecipeStep(9, 18, 3), recipe.RecipeStep(9, 6, 2),
+     recipe.RecipeStep(9, 168, 0)])
+
+
+class ThermalModel(object):
+    """A lumped, first order model of the roasting chamber's temperature,
+    in degF.
+
+    The heater adds heater_power[heat_setting] degF/s while roasting, and
+    heat is lost to the room in proportion to the difference with ambient,
+    at a rate that grows with the air flow: loss + fan_loss * (fan_speed -
+    1) per second while the fan runs (roasting or cooling), idle_loss
+    otherwise. Inputs are held between steps, and each step is solved
+    exactly, so any step length is stable.
+
+    Args:
+        ambient (float): room temperature. Defaults to 70.
+
+        heater_power (tuple): degF/s added by the heater, indexed by heat
+        setting (0 to 3). Defaults to (0, 3, 6, 9), which tops out at
+        about 380degF on high heat and fan speed 9, and 500degF at fan
+        speed 4.
+
+        loss (float): loss rate at fan speed 1, per second. Defaults to
+        1/60, a one minute time constant.
+
+        fan_loss (float): extra loss rate per fan speed step. Defaults to
+        0.0015.
+
+        idle_loss (float): loss rate with the fan off. Defaults to 0.005.
+
+        temp (float): starting temperature. Defaults to ambient.
+
+        noise (float): standard deviation of the noise added to readings.
+        Defaults to 0.
+
+        seed: seed of the noise generator. Defaults to None.
+    """
+    def __init__(self, ambient=70.0, heater_power=(0.0, 3.0, 6.0, 9.0),
+                 loss=1.0 / 60, fan_loss=0.0015, idle_loss=0.005,
+                 temp=None, noise=0.0, seed=None):
+        self.ambient = ambient
+        self.heater_power = heater_power
+        self.loss = loss
+        self.fan_loss = fan_loss
+        self.idle_loss = idle_loss
+        self.temp = ambient if temp is None else temp
+        self.noise = noise
+        self._random = random.Random(seed)
+
+    def step(self, dt, state, fan_speed, heat_setting):
+        """Advances the model by dt seconds with the given current_state
+        bytes, fan speed and heat setting, and returns the temperature."""
+        power = 0.0
+        rate = self.idle_loss
+        if state in (ROASTING, COOLING):
+            rate = self.loss + self.fan_loss * max(0, fan_speed - 1)
+            if state == ROASTING:
+                power = self.heater_power[min(max(heat_setting, 0), 3)]
+        steady = self.ambient + power / rate
+        self.temp = steady + (self.temp - steady) * math.exp(-rate * dt)
+        return self.temp
+
+    def reading(self):
+        """Returns the temperature the roaster's sensor reports, in whole
+        degF."""
+        temp = self.temp
+        if self.noise:
+            temp += self._random.gauss(0.0, self.noise)
+        return int(round(temp))
+
+
+class SimulatedRoaster(object):
+    """An SR700 at the other end of a pty, speaking the 14 byte protocol
+    of docs/communication_protocol.rst.
+
+    Open port, the slave end of the pty, as the roaster's port. The
+    initialization packet (AA 55) is answered with the readback of recipe,
+    and every control packet (AA AA) with a packet holding the settings it
+    carried and the temperature of model, which is driven by them. The
+    roaster only ever answers, so temperature frames come at the rate the
+    host sends packets, 4 Hz for the comm engine. Like the SR700, it sends
+    no footer when the temperature is 250degF, and FF 00 as the
+    temperature below 150degF.
+
+    Call service() when fileno() is readable, or have a Simulator do it.
+
+    Args:
+        model (ThermalModel): defaults to a ThermalModel with its default
+        parameters.
+
+        recipe (recipe.Recipe): what the roaster sends back when
+        initialized. Defaults to DEFAULT_RECIPE.
+
+        clock (func): the time source of the model. Defaults to
+        time.monotonic. Pass the monotonic method of the clock.Clock of the
+        roaster object driving this roaster to run them faster than real
+        time.
+    """
+    def __init__(self, model=None, recipe=DEFAULT_RECIPE,
+                 clock=time.monotonic):
+        self.model = model if model is not None else ThermalModel()
+        self.recipe = recipe
+        self._clock = clock
+        self._transport = transport.PtyTransport()
+        self.port = self._transport.name
+        self._buf = bytearray()
+        self._settings = (b'\x00\x00', 0, 0)
+        self._last_step = None
+        # counts of the packets received
+        self.inits = 0
+        self.packets = 0
+
+    def fileno(self):
+        return self._transport.fileno()
+
+    def service(self):
+        """Handles everything the host sent so far. Never blocks."""
+        waiting = self._transport.in_waiting
+        if waiting:
+            self._buf += self._transport.read(waiting)
+        replies = []
+        for packet in self._packets():
+            if packet[1] == 0x55:
+                self.inits += 1
+                replies.append(self._readback())
+            else:
+                self.packets += 1
+                replies.append(self._answer(packet))
+        if replies:
+            # a single write for all the answers
+            self._transport.write(b''.join(replies))
+
+    def _packets(self):
+        # splits off the complete packets received, skipping garbage
+        buf = self._buf
+        packets = []
+        start = 0
+        while True:
+            start = buf.find(b'\xAA', start)
+            if start < 0:
+                start = len(buf)
+                break
+            end = start + protocol.PACKET_LENGTH
+            if end > len(buf):
+                break
+            if (buf[start + 1] in (0xAA, 0x55) and
+                    buf[end - 2:end] == protocol.FOOTER):
+                packets.append(bytes(buf[start:end]))
+                start = end
+            else:
+                start += 1
+        del buf[:start]
+        return packets
+
+    def _readback(self):
+        lines = []
+        if self.recipe.manual is not None:
+            lines.append((protocol.FLAGS_MANUAL, self.recipe.manual))
+        for i, step in enumerate(self.recipe.steps):
+            last = i == len(self.recipe.steps) - 1
+            lines.append((protocol.FLAGS_RECIPE_END if last else
+                          protocol.FLAGS_RECIPE, step))
+        return b''.join(
+            _PACKET.pack(protocol.HEADER, b'\x61\x74', flags, b'\x00\x00',
+                         step.fan_speed, step.time // 6, step.heat_setting,
+                         b'\x00\x00') + protocol.FOOTER
+            for flags, step in lines)
+
+    def _answer(self, packet):
+        now = self._clock()
+        state, fan_speed, heat_setting = self._settings
+        if self._last_step is not None:
+            # the settings in force since the previous packet
+            self.model.step(
+                now - self._last_step, state, fan_speed, heat_setting)
+        self._last_step = now
+        (_, temp_unit, _, state, fan_speed, time_remaining, heat_setting,
+         _) = _PACKET.unpack_from(packet)
+        self._settings = (state, fan_speed, heat_setting)
+        temp = self.model.reading()
+        if temp < _LOWEST_TEMP:
+            temp_field = _TEMP_LOW
+        else:
+            temp_field = struct.pack('>H', min(temp, 0xFFFF))
+        answer = _PACKET.pack(
+            protocol.HEADER, temp_unit, protocol.FLAGS_ROASTER, state,
+            fan_speed, time_remaining, heat_setting, temp_field)
+        if temp == _NO_FOOTER_TEMP:
+            # firmware quirk
+            return answer
+        return answer + protocol.FOOTER
+
+    def close(self):
+        self._transport.close()
+
+
+class Simulator(object):
+    """Runs any number of SimulatedRoasters on a single thread, which
+    waits on all their ptys at once. For tests and load tests without
+    hardware.
+
+    The thread is started by the first add(), and runs until close().
+    """
+    def __init__(self):
+        self.roasters = []
+        self._lock = threading.Lock()
+        # roasters added since the thread last looked
+        self._added = []
+        self._stopping = False
+        self._wakeup = utils.SelectableEvent(backends.THREAD)
+        self._thread = None
+
+    def add(self, **kwargs):
+        """Creates a SimulatedRoaster and returns it. kwargs are those of
+        SimulatedRoaster. Connect to it through its port attribute."""
+        roaster = SimulatedRoaster(**kwargs)
+        with self._lock:
+            self.roasters.append(roaster)
+            self._added.append(roaster)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    name='sr700_simulator', target=self._run, daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+        return roaster
+
+    def close(self):
+        """Stops the thread, and closes the ptys of all the roasters."""
+        with self._lock:
+            self._stopping = True
+            thread = self._thread
+        self._wakeup.set()
+        if thread is not None:
+            thread.join()
+        for roaster in self.roasters:
+            roaster.close()
+
+    def _run(self):
+        selector = selectors.DefaultSelector()
+        selector.register(self._wakeup, selectors.EVENT_READ)
+        while True:
+            self._wakeup.clear()
+            with self._lock:
+                if self._stopping:
+                    break
+                added, self._added = self._added, []
+            for roaster in added:
+                selector.register(roaster, selectors.EVENT_READ, roaster)
+            for key, _ in selector.select():
+                if key.data is None:
+                    continue
+                try:
+                    key.data.service()
+                except OSError:
+                    # the host end went away, drop the roaster
+                    logging.exception(
+                        'simulator - roaster on %s failed', key.data.port)
+                    selector.unregister(key.data)
+        selector.close()
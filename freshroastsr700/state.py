@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015-2016 Mark Spicer
+# Made available under the MIT license.
+
+import time
+import ctypes
+import contextlib
+
+from freshroastsr700 import backend as backends
+
+
+class StateBlock(ctypes.Structure):
+    """Fixed layout of the roaster state shared between the user process
+    and the comm process.
+
+    seq is the sequence counter of the seqlock protecting the block. It is
+    odd while a writer is updating the block, and even otherwise.
+
+    The countdown runs while roasting or cooling. time_remaining_ms and
+    total_time_ms hold its values as of countdown_mark, the
+    time.monotonic() time the countdown last started or was last updated,
+    or 0 while it is stopped. Use time_remaining_ms() and total_time_ms()
+    to read them. countdown_armed is set while a countdown that has not
+    yet expired is pending. Roasting or cooling started with no time
+    remaining arms the countdown too, and countdown_due is then the time
+    at which it expires, ZERO_COUNTDOWN_DELAY later. It is 0 otherwise.
+
+    connect_mark is the time.monotonic() time of the connect request
+    being served, or of the last one.
+
+    pid_kp, pid_ki and pid_kd are the gains of the PID controller, which
+    the comm process installs whenever pid_gains_seq changes. The autotune
+    fields hold the parameters of the last autotune request, numbered by
+    autotune_seq, and its outcome (see autotune.RelayTuner).
+    """
+    _fields_ = [
+        ('seq', ctypes.c_uint32),
+        ('current_state', ctypes.c_ubyte * 2),
+        ('cooling_for_pid_control', ctypes.c_ubyte),
+        ('countdown_armed', ctypes.c_ubyte),
+        ('fan_speed', ctypes.c_int32),
+        ('heat_setting', ctypes.c_int32),
+        ('target_temp', ctypes.c_int32),
+        ('current_temp', ctypes.c_int32),
+        ('time_remaining_ms', ctypes.c_int32),
+        ('total_time_ms', ctypes.c_int64),
+        ('countdown_mark', ctypes.c_double),
+        ('countdown_due', ctypes.c_double),
+        ('heater_level', ctypes.c_int32),
+        ('disconnect', ctypes.c_int32),
+        ('teardown', ctypes.c_int32),
+        ('connected', ctypes.c_int32),
+        ('connect_state', ctypes.c_int32),
+        ('attempting_connect', ctypes.c_int32),
+        ('connect_mark', ctypes.c_double),
+        ('pid_kp', ctypes.c_double),
+        ('pid_ki', ctypes.c_double),
+        ('pid_kd', ctypes.c_double),
+        ('pid_gains_seq', ctypes.c_uint32),
+        ('autotune_seq', ctypes.c_uint32),
+        ('autotune_state', ctypes.c_int32),
+        ('autotune_high', ctypes.c_int32),
+        ('autotune_low', ctypes.c_int32),
+        ('autotune_cycles', ctypes.c_int32),
+        ('autotune_rule', ctypes.c_int32),
+        ('autotune_install', ctypes.c_int32),
+        ('autotune_hysteresis', ctypes.c_double),
+        ('autotune_timeout', ctypes.c_double),
+        ('autotune_ultimate_gain', ctypes.c_double),
+        ('autotune_ultimate_period', ctypes.c_double),
+        ('autotune_amplitude', ctypes.c_double),
+    ]
+
+
+# current_state values in which the countdown runs: roasting and cooling
+COUNTDOWN_STATES = (b'\x04\x02', b'\x04\x04')
+# seconds after which a countdown started at 0 expires, as it did with
+# the original one second timer
+ZERO_COUNTDOWN_DELAY = 1.0
+
+
+class SharedState(object):
+    """The roaster state, in a single block of shared memory.
+
+    Writers are serialized by a lock and publish any number of fields as a
+    single update. Readers never take the lock: single fields are read
+    straight from the block, and snapshot() returns a copy of the whole
+    block in which all fields were true at the same time.
+
+    Every update first brings the countdown up to date, and starts or
+    stops it if current_state enters or leaves COUNTDOWN_STATES, so the
+    countdown follows state changes to the clock tick. clock is the time
+    source, time.monotonic by default.
+
+    Args:
+        backend: where the block lives, see backend.get_backend(). Defaults
+        to None, for shared memory.
+
+        **fields: initial field values. Bytes fields (current_state) take
+        bytes.
+    """
+    # a reader that keeps seeing a writer at work (e.g. the writer was
+    # killed mid-update) falls back to taking the lock after this many tries
+    _MAX_SPINS = 1000
+
+    def __init__(self, backend=None, **fields):
+        backend = backends.get_backend(backend)
+        self.block = backend.RawValue(StateBlock)
+        self._lock = backend.Lock()
+        self.clock = time.monotonic
+        self.set(**fields)
+
+    def snapshot(self, into=None):
+        """Returns a consistent private copy of the block (a StateBlock).
+        The copy is made into the block of into, a SnapshotBuffer of this
+        state, if given, rather than into a new StateBlock."""
+        block = self.block
+        for _ in range(self._MAX_SPINS):
+            seq = block.seq
+            if seq & 1:
+                continue
+            copy = _copy(block, into)
+            if block.seq == seq:
+                return copy
+        with self._lock:
+            return _copy(block, into)
+
+    @contextlib.contextmanager
+    def update(self):
+        """Context manager yielding the block for writing. All fields
+        assigned within the context are published together when it
+        exits."""
+        with self._lock:
+            block = self.block
+            block.seq += 1
+            try:
+                now = self.clock()
+                _advance_countdown(block, now)
+                yield block
+                running = bytes(block.current_state) in COUNTDOWN_STATES
+                if running and not block.countdown_mark:
+                    block.countdown_mark = now
+                    if not block.time_remaining_ms:
+                        block.countdown_armed = 1
+                        block.countdown_due = now + ZERO_COUNTDOWN_DELAY
+                elif not running:
+                    block.countdown_mark = 0.0
+                if not running or block.time_remaining_ms:
+                    block.countdown_due = 0.0
+            finally:
+                block.seq += 1
+
+    def set(self, **fields):
+        """Publishes the given fields as a single update."""
+        with self.update() as block:
+            set_fields(block, **fields)
+
+
+def set_fields(block, **fields):
+    """Assigns fields of a block held for writing. Bytes fields
+    (current_state) take bytes."""
+    for name, value in fields.items():
+        if isinstance(value, bytes):
+            field = getattr(block, name)
+            field[:] = bytearray(value.ljust(len(field), b'\x00'))
+        else:
+            setattr(block, name, value)
+
+
+class SnapshotBuffer(object):
+    """A private StateBlock, block, which SharedState.snapshot() can copy
+    the block of state into over and over again, for a reader that takes
+    a snapshot every comm cycle: unlike a new copy, copying into it
+    allocates nothing. Each snapshot overwrites the previous one.
+    current_state is the current_state field of block, kept at hand as it
+    is a new array object every time it is read from block.
+
+    Args:
+        state (SharedState): the state the snapshots are taken of.
+    """
+    def __init__(self, state):
+        self.block = StateBlock()
+        self._source = memoryview(state.block).cast('B')
+        self._dest = memoryview(self.block).cast('B')
+        self.current_state = self.block.current_state
+
+
+def _copy(block, into):
+    if into is None:
+        return StateBlock.from_buffer_copy(block)
+    into._dest[:] = into._source
+    return into.block
+
+
+def time_remaining_ms(block, now):
+    """Returns the countdown of a block at time now, in milliseconds."""
+    remaining = block.time_remaining_ms
+    if block.countdown_mark:
+        remaining -= int((now - block.countdown_mark) * 1000.0)
+    return max(0, remaining)
+
+
+def total_time_ms(block, now):
+    """Returns the time a block has spent roasting or cooling at time now,
+    in milliseconds."""
+    total = block.total_time_ms
+    if block.countdown_mark:
+        total += int((now - block.countdown_mark) * 1000.0)
+    return total
+
+
+def countdown_deadline(block):
+    """Returns the time at which the countdown of a block expires, or None
+    if it is stopped or not armed."""
+    if not block.countdown_mark or not block.countdown_armed:
+        return None
+    if block.countdown_due:
+        return block.countdown_due
+    return block.countdown_mark + block.time_remaining_ms / 1000.0
+
+
+def _advance_countdown(block, now):
+    # folds the whole milliseconds elapsed since countdown_mark into the
+    # counters, moving the mark by exactly that much so nothing is lost
+    if not block.countdown_mark:
+        return
+    elapsed = int((now - block.countdown_mark) * 1000.0)
+    if elapsed <= 0:
+        return
+    block.time_remaining_ms = max(0, block.time_remaining_ms - elapsed)
+    block.total_time_ms += elapsed
+    block.countdown_mark += elapsed / 1000.0
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015-2016 Mark Spicer
+# Made available under the MIT license.
+
+import ctypes
+
+from freshroastsr700 import backend as backends
+from freshroastsr700 import scheduler
+
+
+# upper bounds of the latency histogram bins, in milliseconds. The last
+# bin counts everything above the last bound.
+LATENCY_BINS_MS = (0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100)
+
+
+class LatencyStats(ctypes.Structure):
+    """Running summary of a latency or duration measured in the comm
+    process, in seconds. Lives in shared memory so it can be read from the
+    user process."""
+    _fields_ = [
+        ('count', ctypes.c_uint64),
+        ('total', ctypes.c_double),
+        ('max', ctypes.c_double),
+        ('last', ctypes.c_double),
+        ('histogram', ctypes.c_uint64 * (len(LATENCY_BINS_MS) + 1)),
+    ]
+
+
+class CommStats(ctypes.Structure):
+    """Counters kept by the comm process. The leading fields are those of
+    scheduler.CycleStats, so a CommStats can be handed to a
+    scheduler.CycleScheduler."""
+    _fields_ = scheduler.CycleStats._fields_ + [
+        ('bytes_received', ctypes.c_uint64),
+        ('frames_decoded', ctypes.c_uint64),
+        ('bad_frames', ctypes.c_uint64),
+        ('reinits', ctypes.c_uint64),
+        ('serial_exceptions', ctypes.c_uint64),
+        ('read_errors', ctypes.c_uint64),
+        ('write_errors', ctypes.c_uint64),
+        ('handshake_timeouts', ctypes.c_uint64),
+        ('write_time', LatencyStats),
+        ('read_time', LatencyStats),
+        ('pid_time', LatencyStats),
+        ('sample_to_pid', LatencyStats),
+        ('connect_to_first_packet', LatencyStats),
+        ('link_gap', LatencyStats),
+        ('connect_to_ready', LatencyStats),
+    ]
+
+
+_COUNTERS = ('cycles', 'overruns', 'skipped', 'bytes_received',
+             'frames_decoded', 'bad_frames', 'reinits', 'serial_exceptions',
+             'read_errors', 'write_errors', 'handshake_timeouts')
+_TIMINGS = ('write_time', 'read_time', 'pid_time', 'sample_to_pid',
+            'connect_to_first_packet', 'link_gap', 'connect_to_ready')
+
+
+def create_latency_stats(backend=None):
+    """Returns a zeroed LatencyStats, in shared memory unless another
+    backend is given (see backend.get_backend())."""
+    return backends.get_backend(backend).RawValue(LatencyStats)
+
+
+def create_comm_stats(backend=None):
+    """Returns a zeroed CommStats, in shared memory unless another
+    backend is given (see backend.get_backend())."""
+    return backends.get_backend(backend).RawValue(CommStats)
+
+
+def record_latency(latency_stats, latency):
+    """Adds one measurement, in seconds, to a LatencyStats."""
+    latency_stats.count += 1
+    latency_stats.total += latency
+    latency_stats.last = latency
+    if latency > latency_stats.max:
+        latency_stats.max = latency
+    latency_ms = latency * 1000.0
+    for i, bound in enumerate(LATENCY_BINS_MS):
+        if latency_ms <= bound:
+            latency_stats.histogram[i] += 1
+            break
+    else:
+        latency_stats.histogram[len(LATENCY_BINS_MS)] += 1
+
+
+def latency_summary(latency_stats):
+    """Returns a LatencyStats as a dict with count, mean, max and last
+    keys, times in seconds, and a histogram key holding a list of
+    (upper bound in ms, count) tuples. The last bound is None."""
+    count = latency_stats.count
+    return {
+        'count': count,
+        'mean': latency_stats.total / count if count else 0.0,
+        'max': latency_stats.max,
+        'last': latency_stats.last,
+        'histogram': list(zip(list(LATENCY_BINS_MS) + [None],
+                              latency_stats.histogram)),
+    }
+
+
+def comm_summary(comm_stats):
+    """Returns a CommStats as a dict. Counters are ints, timings are
+    dicts as returned by latency_summary(), max_jitter is in seconds and
+    jitter_histogram is as returned by scheduler.jitter_histogram().
+
+    The block is copied without locking, which is cheap but means
+    counters updated while the copy is taken may be one cycle apart."""
+    copy = CommStats.from_buffer_copy(comm_stats)
+    summary = dict((name, getattr(copy, name)) for name in _COUNTERS)
+    for name in _TIMINGS:
+        summary[name] = latency_summary(getattr(copy, name))
+    summary['max_jitter'] = copy.max_jitter
+    summary['jitter_histogram'] = scheduler.jitter_histogram(copy)
+    return summary
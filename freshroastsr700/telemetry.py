@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015-2016 Mark Spicer
+# Made available under the MIT license.
+
+import time
+import ctypes
+import collections
+
+from freshroastsr700 import backend as backends
+from freshroastsr700 import exceptions
+
+
+# backpressure policies for a full TelemetryQueue
+DROP_OLDEST = 'drop_oldest'
+BLOCK = 'block'
+
+# state codes carried in telemetry records, indexed by
+# freshroastsr700.get_roaster_state() names
+STATE_NAMES = ('unknown', 'idle', 'roasting', 'cooling', 'sleeping',
+               'connecting')
+STATE_CODES = dict((name, code) for code, name in enumerate(STATE_NAMES))
+
+
+class TelemetryRecord(collections.namedtuple('TelemetryRecord', [
+        'seq', 'timestamp', 'monotonic', 'current_temp', 'target_temp',
+        'heater_level', 'heat_setting', 'fan_speed', 'state',
+        'time_remaining', 'link_gap'], defaults=(0.0,))):
+    """One decoded packet from the roaster, with the settings in effect
+    when it arrived.
+
+    seq numbers records consecutively, so gaps show where records were
+    dropped. timestamp is time.time() and monotonic is time.monotonic() at
+    the moment the packet was decoded, on the roaster's clock (see
+    clock.Clock). state is an index into STATE_NAMES.
+    link_gap is the number of seconds the link to the roaster was down
+    right before this packet, when a dropped link was resumed, and 0
+    otherwise.
+    """
+    __slots__ = ()
+
+    @property
+    def state_name(self):
+        return STATE_NAMES[self.state]
+
+
+class _Entry(ctypes.Structure):
+    _fields_ = [
+        ('seq', ctypes.c_uint64),
+        ('timestamp', ctypes.c_double),
+        ('monotonic', ctypes.c_double),
+        ('current_temp', ctypes.c_int32),
+        ('target_temp', ctypes.c_int32),
+        ('heater_level', ctypes.c_int32),
+        ('heat_setting', ctypes.c_int32),
+        ('fan_speed', ctypes.c_int32),
+        ('state', ctypes.c_int32),
+        ('time_remaining', ctypes.c_int32),
+        ('link_gap', ctypes.c_double),
+    ]
+
+
+class _Counters(ctypes.Structure):
+    _fields_ = [
+        ('head', ctypes.c_uint64),
+        ('tail', ctypes.c_uint64),
+        ('dropped', ctypes.c_uint64),
+    ]
+
+
+class TelemetryQueue(object):
+    """A bounded, lossless-by-default queue of TelemetryRecords from the comm
+    process to the user process.
+
+    Records are kept in a ring in shared memory. The consumer is woken up
+    through a pipe, which only carries a byte when the ring goes from empty
+    to non-empty, so fileno() can be handed to select() or an event loop.
+
+    Args:
+        capacity (int): number of records the ring holds. Defaults to 256,
+        a minute of samples at 4 Hz.
+
+        policy (str): what the producer does when the ring is full.
+        DROP_OLDEST (the default) overwrites the oldest record. BLOCK waits
+        up to block_timeout seconds for the consumer to make room, and then
+        drops the new record. Either way, dropped records are counted.
+
+        block_timeout (float): see policy. Defaults to 0.1 s, so a stalled
+        consumer cannot hold up the comm cycle for long.
+
+        backend: where the ring lives, see backend.get_backend(). Defaults
+        to None, for shared memory.
+    """
+    def __init__(self, capacity=256, policy=DROP_OLDEST, block_timeout=0.1,
+                 backend=None):
+        if capacity < 1 or policy not in (DROP_OLDEST, BLOCK):
+            raise exceptions.RoasterValueError
+        self.capacity = capacity
+        self.policy = policy
+        self.block_timeout = block_timeout
+        backend = backends.get_backend(backend)
+        self._entries = backend.RawArray(_Entry, capacity)
+        self._counters = backend.RawValue(_Counters)
+        self._cond = backend.Condition()
+        self._bell_reader, self._bell_writer = backend.Pipe()
+
+    @property
+    def dropped(self):
+        """Number of records dropped because the queue was full."""
+        return self._counters.dropped
+
+    def __len__(self):
+        counters = self._counters
+        return counters.head - counters.tail
+
+    def fileno(self):
+        """File descriptor that becomes readable when records are
+        available."""
+        return self._bell_reader.fileno()
+
+    def put(self, record):
+        """Adds a TelemetryRecord (its seq field is ignored, and assigned
+        here). Called by the producer. Returns False if the record was
+        dropped."""
+        counters = self._counters
+        with self._cond:
+            if counters.head - counters.tail >= self.capacity:
+                if self.policy == BLOCK:
+                    self._cond.wait_for(
+                        lambda: counters.head - counters.tail <
+                        self.capacity,
+                        self.block_timeout)
+                    if counters.head - counters.tail >= self.capacity:
+                        counters.dropped += 1
+                        return False
+                else:
+                    counters.tail += 1
+                    counters.dropped += 1
+            was_empty = counters.head == counters.tail
+            entry = self._entries[counters.head % self.capacity]
+            entry.seq = counters.head
+            (_, entry.timestamp, entry.monotonic, entry.current_temp,
+             entry.target_temp, entry.heater_level, entry.heat_setting,
+             entry.fan_speed, entry.state, entry.time_remaining,
+             entry.link_gap) = record
+            counters.head += 1
+        if was_empty:
+            self._bell_writer.send_bytes(b'\x01')
+        return True
+
+    def get(self, max_records=None, timeout=None):
+        """Removes and returns a list of the oldest records, up to
+        max_records (all available if None). Waits up to timeout seconds
+        (forever if None) for records to become available, and returns an
+        empty list if none did. Called by the consumer."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            if not len(self):
+                remaining = None
+                if deadline is not None:
+                    remaining = max(0.0, deadline - time.monotonic())
+                if not self._bell_reader.poll(remaining):
+                    return []
+            while self._bell_reader.poll():
+                self._bell_reader.recv_bytes()
+            records = self._take(max_records)
+            # a bell can outlive the records it announced, try again
+            if records or (deadline is not None and
+                           time.monotonic() >= deadline):
+                return records
+
+    def _take(self, max_records):
+        counters = self._counters
+        records = []
+        with self._cond:
+            count = counters.head - counters.tail
+            if max_records is not None:
+                count = min(count, max_records)
+            for seq in range(counters.tail, counters.tail + count):
+                entry = self._entries[seq % self.capacity]
+                records.append(TelemetryRecord(
+                    entry.seq, entry.timestamp, entry.monotonic,
+                    entry.current_temp, entry.target_temp,
+                    entry.heater_level, entry.heat_setting,
+                    entry.fan_speed, entry.state, entry.time_remaining,
+                    entry.link_gap))
+            counters.tail += count
+            if count:
+                self._cond.notify_all()
+        return records
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015-2016 Mark Spicer
+# Made available under the MIT license.
+
+import os
+import array
+import select
+import socket
+try:
+    import tty
+    import fcntl
+    import termios
+except ImportError:
+    # Windows, where there are no ptys
+    tty = fcntl = termios = None
+
+
+# URL schemes of the network transports
+SOCKET = 'socket'
+RFC2217 = 'rfc2217'
+
+# bytes asked of the OS per read, more than a full recipe readback
+_CHUNK = 4096
+
+
+def is_url(port):
+    """True if port is the URL of a network transport (socket://host:port
+    or rfc2217://host:port) rather than the name of a local port."""
+    return isinstance(port, str) and '://' in port
+
+
+def open_port(port):
+    """Opens the transport to the roaster at port, and returns it.
+
+    A transport is anything with the parts of the serial.Serial interface
+    the comm engine uses: in_waiting, read(), write() and close(), and
+    fileno() if it can be waited on with select(). port is one of:
+
+        socket://host:port
+            a raw TCP connection, to a bridge that passes bytes to and from
+            the roaster's serial port as they are (see SocketTransport).
+        rfc2217://host:port
+            a Telnet connection to an RFC 2217 serial port server, which
+            also carries the port settings.
+        anything else
+            the name of a local serial port (/dev/ttyUSB0, COM3), or the
+            slave end of a pty (see PtyTransport).
+
+    Raises:
+        IOError
+            The transport could not be opened (serial.SerialException is
+            one).
+    """
+    if is_url(port):
+        scheme, _, address = port.partition('://')
+        if scheme == SOCKET:
+            host, _, tcp_port = address.rpartition(':')
+            try:
+                return SocketTransport(host, int(tcp_port))
+            except ValueError:
+                raise IOError('bad address: %s' % port)
+        if scheme != RFC2217:
+            raise IOError('unknown transport: %s' % port)
+    # imported here, so that importing freshroastsr700 does not load
+    # pyserial. serial_for_url() also takes plain port names.
+    import serial
+    return serial.serial_for_url(
+        port,
+        baudrate=9600,
+        bytesize=8,
+        parity='N',
+        stopbits=1.5,
+        timeout=0.25,
+        xonxoff=False,
+        rtscts=False,
+        dsrdtr=False)
+
+
+class SocketTransport(object):
+    """A roaster at the other end of a TCP connection.
+
+    Everything the connection delivers is taken in one recv(), so a burst
+    of packets costs a single system call, and every write() goes out as a
+    single segment (Nagle's algorithm is turned off), so a packet is never
+    held back waiting for the acknowledgement of the previous one.
+
+    Args:
+        host (str): host name or address of the bridge.
+
+        port (int): TCP port of the bridge.
+
+        timeout (float): seconds to wait for the connection, and for a
+        write to be accepted. Defaults to 2.
+    """
+    def __init__(self, host, port, timeout=2.0):
+        self._sock = socket.create_connection((host, port), timeout)
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._buf = bytearray()
+        self._closed_by_peer = False
+
+    @property
+    def in_waiting(self):
+        """Number of bytes received and not read yet. Raises IOError once
+        the bridge closed the connection and everything was read."""
+        self._receive()
+        if self._closed_by_peer and not self._buf:
+            raise ConnectionResetError('connection closed by the bridge')
+        return len(self._buf)
+
+    def _receive(self):
+        while (not self._closed_by_peer and
+               select.select([self._sock], [], [], 0)[0]):
+            data = self._sock.recv(_CHUNK)
+            if not data:
+                self._closed_by_peer = True
+            self._buf += data
+            if len(data) < _CHUNK:
+                break
+
+    def read(self, size):
+        """Returns up to size of the bytes received, without blocking."""
+        self._receive()
+        data = bytes(self._buf[:size])
+        del self._buf[:size]
+        return data
+
+    def write(self, data):
+        self._sock.sendall(data)
+        return len(data)
+
+    def fileno(self):
+        return self._sock.fileno()
+
+    def close(self):
+        self._sock.close()
+
+
+class PtyTransport(object):
+    """The master end of a new pseudo terminal pair.
+
+    Whatever opens the slave end, by the name in the name attribute, talks
+    to this transport as if over a serial cable: a program standing in for
+    a roaster on the slave end can be driven by a roaster object on the
+    master end, or a roaster object can open the slave end as its port.
+
+    Only available where the os module has openpty() (not on Windows).
+    """
+    def __init__(self):
+        master, slave = os.openpty()
+        self.name = os.ttyname(slave)
+        self._fd = master
+        # kept open, so that the master end does not read as hung up
+        # between two users of the slave end
+        self._slave = slave
+        # no echo, no line editing, no translation of the bytes passed
+        tty.setraw(slave)
+        os.set_blocking(master, False)
+
+    @property
+    def in_waiting(self):
+        count = array.array('i', [0])
+        fcntl.ioctl(self._fd, termios.FIONREAD, count)
+        return count[0]
+
+    def read(self, size):
+        """Returns up to size of the bytes received, without blocking."""
+        try:
+            return os.read(self._fd, size)
+        except BlockingIOError:
+            return b''
+
+    def write(self, data):
+        view = memoryview(data)
+        while view:
+            try:
+                view = view[os.write(self._fd, view):]
+            except BlockingIOError:
+                select.select([], [self._fd], [])
+        return len(data)
+
+    def fileno(self):
+        return self._fd
+
+    def close(self):
+        os.close(self._fd)
+        os.close(self._slave)
@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015-2016 Mark Spicer
+# Made available under the MIT license.
+
+import collections
+import multiprocessing
+
+import numpy as np
+
+import freshroastsr700
+from freshroastsr700 import exceptions
+from freshroastsr700 import modulator
+from freshroastsr700 import simulator
+from freshroastsr700 import telemetry
+
+
+# states in which the heater is driven by the comm loop
+_HEATED_STATES = (telemetry.STATE_CODES['roasting'],
+                  telemetry.STATE_CODES['cooling'])
+# readings below this are reported as it, see simulator.SimulatedRoaster
+_LOWEST_TEMP = 150
+
+# the fields of the table returned by sweep()
+RESULT_FIELDS = ('kp', 'ki', 'kd', 'overshoot', 'settling_time', 'iae',
+                 'cost')
+
+
+class ProfileStep(collections.namedtuple(
+        'ProfileStep', ['time', 'target_temp', 'fan_speed'])):
+    """One step of a thermostat roast: time seconds at target_temp, with
+    the fan at fan_speed."""
+    __slots__ = ()
+
+
+# the profile of examples/pid_tune_aid.py, without its cooling
+DEFAULT_PROFILE = (ProfileStep(60, 300, 9), ProfileStep(60, 350, 5),
+                   ProfileStep(60, 400, 5), ProfileStep(60, 450, 4))
+
+
+def grid(kp, ki, kd):
+    """Returns the kp, ki and kd arrays of every combination of the values
+    given for each, for sweep()."""
+    mesh = np.meshgrid(np.asarray(kp, dtype=float),
+                       np.asarray(ki, dtype=float),
+                       np.asarray(kd, dtype=float), indexing='ij')
+    return tuple(gains.ravel() for gains in mesh)
+
+
+def random_gains(count, kp=(0.0, 0.2), ki=(0.0, 0.02), kd=(0.0, 0.05),
+                 seed=None):
+    """Returns the kp, ki and kd arrays of count gain sets drawn uniformly
+    from the given (low, high) ranges, for sweep()."""
+    rng = np.random.default_rng(seed)
+    return tuple(rng.uniform(low, high, count) for low, high in (kp, ki, kd))
+
+
+def simulate(model, kp, ki, kd, profile=DEFAULT_PROFILE, heater_segments=8,
+             period=0.25, start_temp=None, modulation=modulator.TABLE):
+    """Simulates a thermostat roast of profile for every gain set at once,
+    the way the comm loop runs it against a roaster behaving like model (a
+    simulator.ThermalModel, such as one from identify()): once per comm
+    period, a packet goes out with the heater pulse decided the period
+    before, the temperature comes back, and the heat_controller is ticked,
+    with a pid.PID update every heater_segments ticks (every tick with
+    modulator.SigmaDeltaModulator). The arithmetic is that of pid.PID and
+    of the modulator, and the same gains give the same heater levels as a
+    simulator.SimulatedRoaster on a clock.VirtualClock does.
+
+    Args:
+        model (simulator.ThermalModel): the roaster. Its noise is not
+        simulated.
+
+        kp, ki, kd: gains, as arrays of the same shape (or scalars).
+
+        profile: sequence of ProfileSteps. Defaults to DEFAULT_PROFILE.
+
+        heater_segments (int): as for freshroastsr700. Defaults to 8.
+
+        period (float): comm period, in seconds. Defaults to 0.25.
+
+        start_temp (float): temperature of the roaster when the first
+        packet of the roast goes out. Defaults to model.temp.
+
+        modulation (str): as for freshroastsr700. Defaults to
+        modulator.TABLE.
+
+    Returns:
+        (readings, heater_levels, targets): the temperature read and the
+        heater level decided at every comm cycle, as arrays of shape
+        (cycles, number of gain sets), and the target temperature of every
+        cycle, of shape (cycles,). Heater levels are fractional with
+        modulator.SIGMA_DELTA.
+    """
+    kp, ki, kd = (gains.ravel() for gains in np.broadcast_arrays(
+        np.asarray(kp, dtype=float), np.asarray(ki, dtype=float),
+        np.asarray(kd, dtype=float)))
+    kp, ki, kd = modulator.controller_gains(
+        kp, ki, kd, heater_segments, modulation)
+    sigma_delta = modulation == modulator.SIGMA_DELTA
+    targets, fans = _schedule(profile, period)
+    cycles = len(targets)
+    count = len(kp)
+    segments = heater_segments
+    pulses = _pulse_table(segments)
+    # the limits of pid.PID, for Output_min=0
+    integrator_max = np.divide(float(segments), ki,
+                               out=np.zeros(count), where=ki > 0)
+    # the heater power and loss rate for each cycle's fan speed
+    power = model.heater_power[3]
+    rates = model.loss + model.fan_loss * np.maximum(0, fans - 1)
+    decays = np.exp(-rates * period)
+
+    temps = np.full(count, float(
+        model.temp if start_temp is None else start_temp))
+    integrator = np.zeros(count)
+    derivator = np.zeros(count)
+    level = np.zeros(count, dtype=float if sigma_delta else int)
+    # heat_controller's output, see generate_bangbang_output()
+    level_now = np.zeros(count, dtype=int)
+    index = 0
+    # SigmaDeltaModulator's accumulator
+    accumulator = np.zeros(count)
+    pulse = np.zeros(count, dtype=bool)
+    sent = pulse
+    readings = np.empty((cycles, count), dtype=np.int32)
+    heater_levels = np.empty((cycles, count), dtype=level.dtype)
+    for k in range(cycles):
+        if k:
+            # the roaster follows the previous packet until this one
+            steady = model.ambient + np.where(sent, power, 0.0) / rates[k - 1]
+            temps = steady + (temps - steady) * decays[k - 1]
+        sent = pulse
+        reading = np.maximum(np.round(temps), _LOWEST_TEMP)
+        readings[k] = reading
+        if sigma_delta or index >= segments:
+            # pid.PID.update()
+            error = targets[k] - reading
+            integrator = np.clip(integrator + error, 0.0, integrator_max)
+            output = (kp * error + ki * integrator +
+                      kd * (derivator - reading))
+            derivator = reading
+            level = np.clip(output, 0, segments)
+            if not sigma_delta:
+                # heat_controller.heat_level, which rounds half to even,
+                # as np.round() does
+                level = np.round(level).astype(int)
+            level_now = level
+            index = 0
+        if sigma_delta:
+            # SigmaDeltaModulator.generate_bangbang_output()
+            accumulator += level
+            pulse = 2 * accumulator >= segments
+            accumulator -= pulse * segments
+        else:
+            pulse = pulses[level_now, index]
+            index += 1
+        heater_levels[k] = level
+    return readings, heater_levels, targets
+
+
+def score(readings, targets, profile=DEFAULT_PROFILE, period=0.25,
+          band=5.0, overshoot_weight=1.0, settling_weight=1.0):
+    """Scores the roasts of simulate(), and returns the overshoot,
+    settling_time, iae and cost arrays, one value per gain set.
+
+    overshoot is the furthest the temperature went above target, in degF.
+    settling_time is the mean over the steps of the profile of the time it
+    took the temperature to get within band degF of target for good, in
+    seconds (the length of the step if it never did). iae is the integral
+    of the absolute error, in degF.s. cost, by which sweep() ranks, is
+    overshoot * overshoot_weight + settling_time * settling_weight + the
+    mean absolute error.
+    """
+    error = readings - targets[:, np.newaxis]
+    overshoot = np.maximum(error.max(axis=0), 0.0)
+    iae = np.abs(error).sum(axis=0) * period
+    outside = np.abs(error) > band
+    settling_time = np.zeros(readings.shape[1])
+    start = 0
+    for step_cycles in _step_cycles(profile, period):
+        step = outside[start:start + step_cycles]
+        # cycles from the start of the step to the last one out of band
+        last = step_cycles - np.argmax(step[::-1], axis=0)
+        settling_time += np.where(step.any(axis=0), last, 0) * period
+        start += step_cycles
+    settling_time /= len(profile)
+    cost = (overshoot * overshoot_weight +
+            settling_time * settling_weight +
+            iae / (len(targets) * period))
+    return overshoot, settling_time, iae, cost
+
+
+def sweep(model, kp, ki, kd, profile=DEFAULT_PROFILE, heater_segments=8,
+          period=0.25, start_temp=None, band=5.0, overshoot_weight=1.0,
+          settling_weight=1.0, processes=1, chunk_size=4096,
+          modulation=modulator.TABLE):
+    """Simulates (see simulate()) and scores (see score()) a roast for
+    every gain set, and returns a table of the results ranked by cost,
+    best first: a NumPy structured array with the fields of RESULT_FIELDS.
+    Build the gain sets with grid() or random_gains().
+
+    Gain sets are simulated chunk_size at a time, and the chunks spread
+    over a pool of processes if there is more than one.
+    """
+    kp, ki, kd = (gains.ravel() for gains in np.broadcast_arrays(
+        np.asarray(kp, dtype=float), np.asarray(ki, dtype=float),
+        np.asarray(kd, dtype=float)))
+    if not len(kp) or chunk_size < 1 or processes < 1:
+        raise exceptions.RoasterValueError
+    settings = (model, profile, heater_segments, period, start_temp, band,
+                overshoot_weight, settling_weight, modulation)
+    chunks = [(settings, kp[i:i + chunk_size], ki[i:i + chunk_size],
+               kd[i:i + chunk_size])
+              for i in range(0, len(kp), chunk_size)]
+    if processes > 1 and len(chunks) > 1:
+        with multiprocessing.Pool(processes) as pool:
+            results = pool.map(_sweep_chunk, chunks)
+    else:
+        results = [_sweep_chunk(chunk) for chunk in chunks]
+    table = np.concatenate(results)
+    return table[np.argsort(table['cost'], kind='stable')]
+
+
+def _sweep_chunk(chunk):
+    # a chunk of sweep(), in a process of the pool maybe
+    ((model, profile, heater_segments, period, start_temp, band,
+      overshoot_weight, settling_weight, modulation), kp, ki, kd) = chunk
+    readings, _, targets = simulate(
+        model, kp, ki, kd, profile, heater_segments, period, start_temp,
+        modulation)
+    table = np.empty(len(kp), dtype=[(name, 'f8') for name in RESULT_FIELDS])
+    table['kp'] = kp
+    table['ki'] = ki
+    table['kd'] = kd
+    (table['overshoot'], table['settling_time'], table['iae'],
+     table['cost']) = score(readings, targets, profile, period, band,
+                            overshoot_weight, settling_weight)
+    return table
+
+
+def identify(entries, ambient=70.0):
+    """Fits a simulator.ThermalModel to what a roaster did, for simulate()
+    and sweep().
+
+    entries is a NumPy structured array with the fields of
+    history.FIELDS, such as history.TelemetryHistory.latest() returns,
+    covering a roast with the heater going on and off (a thermostat roast
+    will do) at two fan speeds or more. Samples below 150degF, or right
+    after a resumed link drop, are left out.
+
+    The heater is taken to heat in proportion to the heat setting, and the
+    loss rate with the fan off is not identified (it is of no use to
+    thermostat roasts).
+
+    Raises:
+        freshroastsr700.exceptions.RoasterValueError
+            There are not enough samples to fit the model.
+    """
+    now, after = entries[:-1], entries[1:]
+    dt = after['monotonic'] - now['monotonic']
+    usable = (np.isin(now['state'], _HEATED_STATES) &
+              np.isin(after['state'], _HEATED_STATES) &
+              (now['current_temp'] > _LOWEST_TEMP) &
+              (after['current_temp'] > _LOWEST_TEMP) &
+              (after['link_gap'] == 0) & (dt > 0))
+    if usable.sum() < 3:
+        raise exceptions.RoasterValueError
+    now, after, dt = now[usable], after[usable], dt[usable]
+    # the packet sent with a sample drives the roaster until the next one,
+    # which gives dT/dt = power * heat_setting / 3 - (loss + fan_loss *
+    # (fan_speed - 1)) * (T - ambient), taken at mid step
+    slope = (after['current_temp'] - now['current_temp']) / dt
+    above = (after['current_temp'] + now['current_temp']) / 2.0 - ambient
+    heat = np.where(now['state'] == telemetry.STATE_CODES['roasting'],
+                    now['heat_setting'], 0) / 3.0
+    columns = np.column_stack(
+        (heat, -above, -above * np.maximum(0, now['fan_speed'] - 1)))
+    (power, loss, fan_loss), _, _, _ = np.linalg.lstsq(
+        columns, slope, rcond=None)
+    return simulator.ThermalModel(
+        ambient=ambient,
+        heater_power=(0.0, power / 3.0, power * 2.0 / 3.0, power),
+        loss=loss, fan_loss=fan_loss)
+
+
+def _schedule(profile, period):
+    # the target temperature and fan speed of every cycle of a profile
+    counts = _step_cycles(profile, period)
+    targets = np.repeat([step.target_temp for step in profile], counts)
+    fans = np.repeat([step.fan_speed for step in profile], counts)
+    return targets.astype(float), fans
+
+
+def _step_cycles(profile, period):
+    return [int(round(step.time / period)) for step in profile]
+
+
+def _pulse_table(segments):
+    # the pulse trains of heat_controller, indexed by heat level then
+    # tick, taken from the class itself
+    table = np.zeros((segments + 1, segments), dtype=bool)
+    for level in range(segments + 1):
+        heater = freshroastsr700.heat_controller(segments)
+        heater.heat_level = level
+        # the first train is that of level 0, the level picked up at start
+        train = [heater.generate_bangbang_output()
+                 for _ in range(2 * segments)]
+        table[level] = train[segments:]
+    return table
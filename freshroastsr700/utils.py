@@ -2,10 +2,9 @@
 # Copyright (c) 2015-2016 Mark Spicer
 # Made available under the MIT license.
 
-import re
-from serial.tools import list_ports
+import ctypes
 
-from freshroastsr700 import exceptions
+from freshroastsr700 import backend as backends
 
 
 def frange(start, stop, step, precision):
@@ -16,16 +15,6 @@ def frange(start, stop, step, precision):
         value += step
 
 
-def find_device(vidpid):
-    """Finds a connected device with the given VID:PID. Returns the serial
-    port url."""
-    for port in list_ports.comports():
-        if re.search(vidpid, port[2], flags=re.IGNORECASE):
-            return port[0]
-
-    raise exceptions.RoasterLookupError
-
-
 def seconds_to_float(time_in_seconds):
     """Converts seconds to float rounded to one digit. Will cap the float at
     9.9 or 594 seconds."""
@@ -33,3 +22,36 @@ def seconds_to_float(time_in_seconds):
         return round((float(time_in_seconds) / 60.0), 1)
 
     return 9.9
+
+
+class SelectableEvent(object):
+    """A multiprocessing.Event look-alike that also has a file descriptor,
+    readable while the event is set, so it can be waited on together with
+    other file descriptors (see scheduler.Wait). backend is as for
+    backend.get_backend()."""
+    def __init__(self, backend=None):
+        backend = backends.get_backend(backend)
+        self._reader, self._writer = backend.Pipe()
+        self._flag = backend.RawValue(ctypes.c_int)
+        self._lock = backend.Lock()
+
+    def fileno(self):
+        return self._reader.fileno()
+
+    def is_set(self):
+        return bool(self._flag.value)
+
+    def set(self):
+        with self._lock:
+            if not self._flag.value:
+                self._flag.value = 1
+                self._writer.send_bytes(b'\x01')
+
+    def clear(self):
+        with self._lock:
+            if self._flag.value:
+                self._reader.recv_bytes()
+                self._flag.value = 0
+
+    def wait(self, timeout=None):
+        return self._reader.poll(timeout)
@@ -31,5 +31,9 @@ setup(
     packages=find_packages(),
     install_requires=[
         'pyserial>=3.0.1'
-    ]
+    ],
+    extras_require={
+        # NumPy views of history.TelemetryHistory, and the tuning module
+        'numpy': ['numpy']
+    }
 )
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015-2016 Mark Spicer
+# Made available under the MIT license.
+"""Stand-ins for the serial port of a roaster, shared by the tests."""
+
+import threading
+import time
+
+from freshroastsr700 import protocol
+
+
+PAYLOAD = b'\x61\x74\x00\x04\x02\x09\x32\x03\x01\x60'
+
+
+class FakeSerial(object):
+    """Stands in for a serial.Serial connected to a roaster, which
+    answers every packet written to it with payload (PAYLOAD by default).
+    written counts the packets written."""
+    def __init__(self, payload=PAYLOAD):
+        self.payload = payload
+        self.written = 0
+        self._pending = b''
+        self._lock = threading.Lock()
+
+    @property
+    def in_waiting(self):
+        return len(self._pending)
+
+    def read(self, size):
+        with self._lock:
+            data, self._pending = (
+                self._pending[:size], self._pending[size:])
+        return data
+
+    def write(self, data):
+        with self._lock:
+            self.written += 1
+            self._pending += b'\xAA\xAA' + self.payload + b'\xAA\xFA'
+
+    def close(self):
+        pass
+
+
+class RecipeSerial(FakeSerial):
+    """A FakeSerial that answers the initialization packet with the
+    readback of a recipe, or with nothing at all if silent."""
+    READBACK = b''.join(
+        b'\xAA\xAA\x61\x74' + line + b'\x00\x00\xAA\xFA' for line in (
+            b'\xA0\x00\x00\x09\x3B\x02', b'\xAA\x00\x00\x09\x03\x03',
+            b'\xAF\x00\x00\x09\x1C\x00'))
+
+    def __init__(self, silent=False):
+        super(RecipeSerial, self).__init__()
+        self.silent = silent
+
+    def write(self, data):
+        if self.silent:
+            return
+        if bytes(data[:2]) == protocol.INIT_HEADER:
+            with self._lock:
+                self._pending += self.READBACK
+        else:
+            super(RecipeSerial, self).write(data)
+
+
+class FlakySerial(FakeSerial):
+    """A FakeSerial whose link can be cut, as by a cable glitch."""
+    def __init__(self):
+        super(FlakySerial, self).__init__()
+        self.failing = False
+
+    @property
+    def in_waiting(self):
+        if self.failing:
+            raise IOError('link down')
+        return len(self._pending)
+
+    def write(self, data):
+        if self.failing:
+            raise IOError('link down')
+        super(FlakySerial, self).write(data)
+
+
+class ReadFailingSerial(FakeSerial):
+    """A FakeSerial with a file descriptor, fileno, whose reads can be
+    made to fail while writes still go through. failures holds the
+    time.monotonic() time of every failed read."""
+    def __init__(self, fileno):
+        super(ReadFailingSerial, self).__init__()
+        self._fileno = fileno
+        self.failing = False
+        self.failures = []
+
+    def fileno(self):
+        return self._fileno
+
+    @property
+    def in_waiting(self):
+        if self.failing:
+            self.failures.append(time.monotonic())
+            raise IOError('link down')
+        return len(self._pending)
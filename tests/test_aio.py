@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015-2016 Mark Spicer
+# Made available under the MIT license.
+
+import time
+import asyncio
+import threading
+import unittest
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from freshroastsr700 import aio
+from freshroastsr700 import exceptions
+
+from fakes import PAYLOAD
+
+
+class TestAsyncRoaster(unittest.TestCase):
+    def setUp(self):
+        self.roaster = aio.AsyncRoaster()
+
+    def tearDown(self):
+        self.roaster.close()
+
+    def run_async(self, coro):
+        return asyncio.run(asyncio.wait_for(coro, 5))
+
+    def test_callbacks_rejected(self):
+        with self.assertRaises(TypeError):
+            aio.AsyncRoaster(update_data_func=lambda: None)
+
+    def test_attributes_come_from_roaster(self):
+        self.assertEqual(self.roaster.fan_speed, 1)
+        self.assertEqual(self.roaster.get_roaster_state(), 'idle')
+
+    def test_samples(self):
+        async def collect():
+            samples = self.roaster.samples()
+            # start the iterator before the packets arrive
+            first = asyncio.ensure_future(samples.__anext__())
+            await asyncio.sleep(0)
+            self.roaster.roaster._process_response_data(PAYLOAD, None)
+            self.roaster.roaster._process_response_data(PAYLOAD, None)
+            records = [await first, await samples.__anext__()]
+            await samples.aclose()
+            return records
+
+        records = self.run_async(collect())
+        self.assertEqual([r.current_temp for r in records], [352, 352])
+        self.assertEqual(records[1].seq, records[0].seq + 1)
+
+    def test_apply_when_not_connected(self):
+        record = self.run_async(self.roaster.apply(fan_speed=5))
+        self.assertIsNone(record)
+        self.assertEqual(self.roaster.fan_speed, 5)
+
+    def test_apply_waits_for_next_sample(self):
+        async def apply():
+            self.roaster.roaster._state.set(connected=1)
+            task = asyncio.ensure_future(self.roaster.roast())
+            await asyncio.sleep(0)
+            self.assertFalse(task.done())
+            self.roaster.roaster._process_response_data(PAYLOAD, None)
+            return await task
+
+        record = self.run_async(apply())
+        self.assertEqual(record.state_name, 'roasting')
+
+    def test_apply_times_out_on_a_silent_link(self):
+        roaster = aio.AsyncRoaster(comm_period=0.05)
+        self.addCleanup(roaster.close)
+        roaster.roaster._state.set(connected=1)
+        start = time.monotonic()
+        with self.assertRaises(asyncio.TimeoutError):
+            self.run_async(roaster.apply(fan_speed=5))
+        # a few comm periods, well before run_async() gives up
+        self.assertLess(time.monotonic() - start, 1.0)
+        self.assertEqual(roaster.fan_speed, 5)
+        self.assertEqual(roaster._pending_applies, [])
+
+    def test_apply_fails_when_the_link_drops(self):
+        roaster = aio.AsyncRoaster(comm_period=0.05)
+        self.addCleanup(roaster.close)
+
+        async def apply():
+            roaster.roaster._state.set(connected=1)
+            task = asyncio.ensure_future(roaster.roast())
+            await asyncio.sleep(0)
+            # as when the link is lost, resuming or not
+            roaster.roaster._state.set(connected=0)
+            return await task
+
+        with self.assertRaises(exceptions.RoasterLookupError):
+            self.run_async(apply())
+
+    def test_wait_for_transition(self):
+        async def wait():
+            task = asyncio.ensure_future(self.roaster.wait_for_transition())
+            await asyncio.sleep(0)
+            self.roaster.roaster.roast()
+            self.roaster.state_transition_event.set()
+            return await task
+
+        self.assertEqual(self.run_async(wait()), 'roasting')
+        self.assertFalse(self.roaster.state_transition_event.is_set())
+
+    def test_wait_for_past_transition(self):
+        self.roaster.state_transition_event.set()
+        self.assertEqual(
+            self.run_async(self.roaster.wait_for_transition()), 'idle')
+
+    def test_queue_follows_backend(self):
+        roaster = aio.AsyncRoaster(backend='thread')
+        self.addCleanup(roaster.close)
+        queue = roaster.roaster._telemetry_queue
+        # a plain array and condition, not shared memory
+        self.assertIsInstance(queue._cond, threading.Condition)
+        self.assertNotIsInstance(self.roaster.roaster._telemetry_queue._cond,
+                                 threading.Condition)
+
+    def test_connect_without_hardware(self):
+        roaster = aio.AsyncRoaster(backend='thread')
+        self.addCleanup(roaster.close)
+        roaster.roaster._connect = mock.Mock(
+            side_effect=exceptions.RoasterLookupError)
+        with self.assertRaises(exceptions.RoasterLookupError):
+            self.run_async(roaster.connect())
+        self.assertEqual(roaster.connect_state, roaster.CS_NOT_CONNECTED)
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015-2016 Mark Spicer
+# Made available under the MIT license.
+
+import os
+import time
+import unittest
+
+import freshroastsr700
+from freshroastsr700 import autotune
+from freshroastsr700 import backend
+from freshroastsr700 import clock
+from freshroastsr700 import exceptions
+from freshroastsr700 import pid
+from freshroastsr700 import simulator
+
+
+def relay_loop(tuner, rate=1.0, delay=2.0, period=0.25, temp=300.0):
+    """Runs tuner on a roaster whose temperature rises at rate degF/s
+    while the relay is high, falls at rate while it is low, and follows
+    the relay delay seconds late, until it is done. Its oscillation has a
+    period of 4 * (delay + hysteresis / rate) and an amplitude of
+    hysteresis + rate * delay."""
+    levels = [None] * int(delay / period)
+    now = 0.0
+    while not tuner.done:
+        level = levels.pop(0)
+        if level is not None:
+            temp += (rate if level == tuner.high else -rate) * period
+        levels.append(tuner.update(now, temp))
+        now += period
+    return now
+
+
+class TestGains(unittest.TestCase):
+    def test_ziegler_nichols(self):
+        kp, ki, kd = autotune.gains(0.5, 20.0, 2.0)
+        self.assertAlmostEqual(kp, 0.3)
+        # Ti = 10 s, Td = 2.5 s, on a 2 s update interval
+        self.assertAlmostEqual(ki, 0.3 / 10 * 2)
+        self.assertAlmostEqual(kd, 0.3 * 2.5 / 2)
+
+    def test_rules_are_milder(self):
+        zn = autotune.gains(0.5, 20.0, 2.0)
+        for rule in ('some_overshoot', 'no_overshoot'):
+            self.assertLess(autotune.gains(0.5, 20.0, 2.0, rule)[0], zn[0])
+
+    def test_bad_rule(self):
+        with self.assertRaises(exceptions.RoasterValueError):
+            autotune.gains(0.5, 20.0, 2.0, 'cohen_coon')
+
+
+class TestRelayTuner(unittest.TestCase):
+    def test_measures_oscillation(self):
+        tuner = autotune.RelayTuner(350, 8, hysteresis=2.0, cycles=3)
+        relay_loop(tuner)
+        result = tuner.result(2.0)
+        self.assertAlmostEqual(result.ultimate_period, 16.0, delta=0.5)
+        self.assertAlmostEqual(result.amplitude, 4.0, delta=0.5)
+        # 4 * d / (pi * a), with a corrected for the hysteresis
+        self.assertAlmostEqual(
+            result.ultimate_gain, 16 / (3.14159 * 12 ** 0.5), delta=0.1)
+        self.assertEqual(
+            result[3:], autotune.gains(result.ultimate_gain,
+                                       result.ultimate_period, 2.0))
+
+    def test_heat_up_is_left_out(self):
+        tuner = autotune.RelayTuner(350, 8, cycles=2)
+        relay_loop(tuner, temp=200.0)
+        self.assertAlmostEqual(tuner.result(2.0).amplitude, 4.0, delta=0.5)
+
+    def test_not_done(self):
+        tuner = autotune.RelayTuner(350, 8)
+        self.assertEqual(tuner.update(0.0, 300), 8)
+        self.assertFalse(tuner.done)
+        with self.assertRaises(exceptions.RoasterStateError):
+            tuner.result(2.0)
+
+    def test_bad_values(self):
+        for args in ((8, 8), (8, 0, -1.0), (8, 0, 2.0, 0)):
+            with self.assertRaises(exceptions.RoasterValueError):
+                autotune.RelayTuner(350, *args)
+
+
+class TestSetGains(unittest.TestCase):
+    def test_bumpless(self):
+        controller = pid.PID(0.06, 0.0075, 0.01)
+        for temp in (300, 310, 320, 330):
+            controller.update(temp, 350)
+        integral = controller.Integrator * controller.Ki
+        controller.setGains(0.1, 0.015, 0.02)
+        self.assertEqual(controller.Kp, 0.1)
+        self.assertAlmostEqual(controller.Integrator * controller.Ki,
+                               integral)
+        self.assertAlmostEqual(controller.Integrator_max, 8 / 0.015)
+
+    def test_clamped(self):
+        controller = pid.PID(0.06, 0.0075, 0.01)
+        controller.setIntegrator(controller.Integrator_max)
+        controller.setGains(0.06, 0.001, 0.01)
+        self.assertAlmostEqual(controller.Integrator * controller.Ki, 8)
+        controller.setGains(0.06, 0.0, 0.01)
+        self.assertEqual(controller.Integrator, 0.0)
+
+
+class TestRoasterAutotune(unittest.TestCase):
+    def make_roaster(self, **kwargs):
+        self.clock = clock.VirtualClock(grace=0.02, backend=backend.THREAD)
+        sim = simulator.Simulator()
+        self.addCleanup(sim.close)
+        device = sim.add(
+            model=simulator.ThermalModel(heater_power=(0, 15, 30, 45)),
+            clock=self.clock.monotonic)
+        roaster = freshroastsr700.freshroastsr700(
+            port=device.port, backend=backend.THREAD, clock=self.clock,
+            **kwargs)
+        self.addCleanup(roaster.terminate)
+        return roaster
+
+    def wait_while_running(self, roaster, limit=30):
+        end = time.monotonic() + limit
+        while (roaster.autotune_state == autotune.AT_RUNNING and
+               time.monotonic() < end):
+            time.sleep(0.01)
+        return roaster.autotune_state
+
+    @unittest.skipIf(not hasattr(os, 'openpty'), 'no ptys')
+    def test_installs_gains(self):
+        roaster = self.make_roaster(thermostat=True)
+        self.assertEqual(roaster.autotune_state, autotune.AT_OFF)
+        self.assertIsNone(roaster.autotune_result)
+        self.assertEqual(roaster.pid_gains, (0.06, 0.0075, 0.01))
+        roaster.connect()
+        roaster.apply(fan_speed=5)
+        roaster.autotune(target_temp=350, cycles=2)
+        self.assertEqual(roaster.get_roaster_state(), 'roasting')
+        self.assertEqual(self.wait_while_running(roaster),
+                         autotune.AT_DONE)
+        result = roaster.autotune_result
+        self.assertGreater(result.ultimate_period, 2)
+        self.assertGreater(result.amplitude, 2)
+        self.assertEqual(roaster.pid_gains, result[3:])
+        # back under PID control, with the new gains, around the target
+        start = self.clock.monotonic()
+        while self.clock.monotonic() < start + 60:
+            time.sleep(0.01)
+        self.assertAlmostEqual(roaster.current_temp, 350, delta=20)
+
+    @unittest.skipIf(not hasattr(os, 'openpty'), 'no ptys')
+    def test_leaving_roasting_fails(self):
+        roaster = self.make_roaster(thermostat=True)
+        roaster.connect()
+        roaster.autotune(target_temp=350, install=False)
+        roaster.idle()
+        self.assertEqual(self.wait_while_running(roaster),
+                         autotune.AT_FAILED)
+        self.assertIsNone(roaster.autotune_result)
+        self.assertEqual(roaster.pid_gains, (0.06, 0.0075, 0.01))
+
+    def test_thermostat_only(self):
+        roaster = freshroastsr700.freshroastsr700(backend=backend.THREAD)
+        with self.assertRaises(exceptions.RoasterStateError):
+            roaster.autotune(target_temp=350)
+
+    def test_bad_values(self):
+        roaster = freshroastsr700.freshroastsr700(
+            thermostat=True, backend=backend.THREAD)
+        for kwargs in ({'target_temp': 600}, {'relay_high': 9},
+                       {'relay_low': 8}, {'cycles': 0},
+                       {'rule': 'cohen_coon'}):
+            with self.assertRaises(exceptions.RoasterValueError):
+                roaster.autotune(**kwargs)
+        self.assertEqual(roaster.autotune_state, autotune.AT_OFF)
+        self.assertEqual(roaster.get_roaster_state(), 'idle')
+
+    def test_set_pid_gains(self):
+        roaster = freshroastsr700.freshroastsr700(
+            thermostat=True, backend=backend.THREAD)
+        roaster.set_pid_gains(0.1, 0.01, 0.02)
+        self.assertEqual(roaster.pid_gains, (0.1, 0.01, 0.02))
+        with self.assertRaises(exceptions.RoasterValueError):
+            roaster.set_pid_gains(-0.1, 0.01, 0.02)
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015-2016 Mark Spicer
+# Made available under the MIT license.
+
+import ctypes
+import unittest
+
+from freshroastsr700 import backend
+from freshroastsr700 import exceptions
+
+
+class TestBackend(unittest.TestCase):
+    def test_get_backend(self):
+        self.assertIsInstance(backend.get_backend(), backend.ProcessBackend)
+        self.assertIsInstance(
+            backend.get_backend(backend.THREAD), backend.ThreadBackend)
+        thread_backend = backend.ThreadBackend()
+        self.assertIs(backend.get_backend(thread_backend), thread_backend)
+
+    def test_get_backend_unknown(self):
+        with self.assertRaises(exceptions.RoasterValueError):
+            backend.get_backend('fiber')
+
+    def test_factories(self):
+        for name in (backend.PROCESS, backend.THREAD):
+            factory = backend.get_backend(name)
+            value = factory.RawValue(ctypes.c_int)
+            value.value = 3
+            self.assertEqual(value.value, 3)
+            array = factory.RawArray(ctypes.c_int, 4)
+            self.assertEqual(len(array), 4)
+            with factory.Condition(factory.Lock()):
+                pass
+            event = factory.Event()
+            event.set()
+            self.assertTrue(event.is_set())
+
+    def test_thread_start(self):
+        results = []
+        worker = backend.ThreadBackend().start(results.append, (1,))
+        worker.join(5)
+        self.assertEqual(results, [1])
+        self.assertTrue(worker.daemon)
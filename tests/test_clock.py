@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015-2016 Mark Spicer
+# Made available under the MIT license.
+
+import os
+import time
+import threading
+import unittest
+
+import freshroastsr700
+from freshroastsr700 import backend
+from freshroastsr700 import clock
+from freshroastsr700 import exceptions
+from freshroastsr700 import fleet
+from freshroastsr700 import scheduler
+from freshroastsr700 import simulator
+
+
+class Waiter(object):
+    # stands in for a blocking call, recording how long it was asked to
+    # block
+    def __init__(self, result=False):
+        self.result = result
+        self.timeouts = []
+
+    def __call__(self, timeout):
+        self.timeouts.append(timeout)
+        return self.result
+
+
+class TestScaledClock(unittest.TestCase):
+    def test_runs_faster(self):
+        scaled = clock.ScaledClock(50)
+        start = scaled.monotonic()
+        stamp = scaled.time()
+        time.sleep(0.02)
+        self.assertGreaterEqual(scaled.monotonic() - start, 1.0)
+        self.assertGreaterEqual(scaled.time() - stamp, 1.0)
+
+    def test_timeouts_are_scaled(self):
+        waiter = Waiter()
+        scaled = clock.ScaledClock(100)
+        scaled.wait(waiter, 5.0)
+        scaled.wait(waiter, None)
+        self.assertEqual(waiter.timeouts, [0.05, None])
+
+    def test_bad_rate(self):
+        with self.assertRaises(exceptions.RoasterValueError):
+            clock.ScaledClock(0)
+
+
+class TestVirtualClock(unittest.TestCase):
+    def setUp(self):
+        self.clock = clock.VirtualClock(start=100.0, grace=0.001,
+                                        backend=backend.THREAD)
+
+    def test_jumps_when_nothing_happens(self):
+        waiter = Waiter()
+        stamp = self.clock.time()
+        self.assertFalse(self.clock.wait(waiter, 30.0))
+        self.assertEqual(waiter.timeouts, [0.001])
+        self.assertEqual(self.clock.monotonic(), 130.0)
+        self.assertAlmostEqual(self.clock.time() - stamp, 30.0)
+
+    def test_stands_still_when_something_happens(self):
+        waiter = Waiter(result=['ready'])
+        self.assertEqual(self.clock.wait(waiter, 30.0), ['ready'])
+        self.assertEqual(self.clock.wait(waiter, None), ['ready'])
+        self.assertEqual(waiter.timeouts, [0.001, None])
+        self.assertEqual(self.clock.monotonic(), 100.0)
+
+    def test_sleep(self):
+        start = time.monotonic()
+        self.clock.sleep(3600)
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(self.clock.monotonic(), 3700.0)
+
+    def test_run_steps(self):
+        def steps():
+            for _ in range(4):
+                yield scheduler.Wait([], 0.25)
+            return 'done'
+        self.assertEqual(scheduler.run_steps(steps(), self.clock), 'done')
+        self.assertEqual(self.clock.monotonic(), 101.0)
+
+
+@unittest.skipIf(not hasattr(os, 'openpty'), 'no ptys')
+class TestAcceleratedRoast(unittest.TestCase):
+    ROAST = 12
+
+    def roast(self, make_roaster):
+        """Runs a ROAST second thermostat roast on a virtual clock, and
+        returns the telemetry records of its first ROAST - 1 seconds."""
+        # generous, for loaded machines
+        virtual = clock.VirtualClock(grace=0.02, backend=backend.THREAD)
+        sim = simulator.Simulator()
+        self.addCleanup(sim.close)
+        # at ambient, the roaster stays put however long it idles
+        device = sim.add(
+            model=simulator.ThermalModel(heater_power=(0, 15, 30, 45)),
+            clock=virtual.monotonic)
+        records = []
+        done = threading.Event()
+        roaster, connect = make_roaster(
+            virtual, port=device.port, thermostat=True,
+            telemetry_func=records.extend, state_transition_func=done.set)
+        connect()
+        start = virtual.monotonic()
+        roaster.apply(state='roasting', fan_speed=3, target_temp=350,
+                      time_remaining=self.ROAST)
+        self.assertTrue(done.wait(20))
+        self.assertGreaterEqual(virtual.monotonic() - start, self.ROAST)
+        # the telemetry thread may still be on its way
+        time.sleep(0.05)
+        idle = freshroastsr700.telemetry.STATE_CODES['idle']
+        roasting = [record for record in records if record.state != idle]
+        return roasting[:(self.ROAST - 1) * 4]
+
+    def thread_roaster(self, virtual, **kwargs):
+        roaster = freshroastsr700.freshroastsr700(
+            backend=backend.THREAD, clock=virtual, **kwargs)
+        self.addCleanup(roaster.terminate)
+        return roaster, roaster.connect
+
+    def fleet_roaster(self, virtual, **kwargs):
+        roaster_fleet = fleet.RoasterFleet(clock=virtual)
+        self.addCleanup(roaster_fleet.terminate)
+        return roaster_fleet.add(**kwargs), roaster_fleet.connect
+
+    def test_faster_than_real_time(self):
+        start = time.monotonic()
+        records = self.roast(self.thread_roaster)
+        self.assertLess(time.monotonic() - start, self.ROAST / 3)
+        # a packet every comm period, on the dot
+        self.assertEqual(len(records), (self.ROAST - 1) * 4)
+        for previous, record in zip(records, records[1:]):
+            self.assertAlmostEqual(record.monotonic - previous.monotonic,
+                                   0.25)
+        self.assertGreater(max(record.current_temp for record in records),
+                           300)
+
+    def test_same_decisions(self):
+        def decisions(records):
+            return [(round(record.monotonic - records[0].monotonic, 6),
+                     record.current_temp, record.heater_level)
+                    for record in records]
+        first = decisions(self.roast(self.thread_roaster))
+        self.assertEqual(decisions(self.roast(self.thread_roaster)), first)
+        self.assertEqual(decisions(self.roast(self.fleet_roaster)), first)
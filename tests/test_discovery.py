@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015-2016 Mark Spicer
+# Made available under the MIT license.
+
+import os
+import socket
+import shutil
+import tempfile
+import unittest
+
+from freshroastsr700 import discovery
+from freshroastsr700 import exceptions
+
+
+def uevent(action, devname, subsystem='tty'):
+    return b'\x00'.join([
+        ('%s@/devices/virtual/tty/%s' % (action, devname)).encode(),
+        ('ACTION=%s' % action).encode(),
+        ('SUBSYSTEM=%s' % subsystem).encode(),
+        ('DEVNAME=%s' % devname).encode(),
+        b'SEQNUM=1234', b''])
+
+
+class FakeSysfs(object):
+    """A sysfs tree with just enough in it for discovery."""
+    def __init__(self):
+        self.root = tempfile.mkdtemp()
+        self.tty = os.path.join(self.root, 'class', 'tty')
+        os.makedirs(self.tty)
+        for subsystem in ('usb', 'usb-serial', 'platform'):
+            os.makedirs(os.path.join(self.root, 'bus', subsystem))
+        # a virtual console, and a serial port that is not USB
+        os.makedirs(os.path.join(self.tty, 'tty1'))
+        self.add_device('ttyS0', 'platform/serial8250/ttyS0', 'platform')
+
+    def add_device(self, name, device_path, subsystem):
+        device = os.path.join(self.root, 'devices', device_path)
+        os.makedirs(device)
+        os.symlink(os.path.join(self.root, 'bus', subsystem),
+                   os.path.join(device, 'subsystem'))
+        os.makedirs(os.path.join(self.tty, name))
+        os.symlink(device, os.path.join(self.tty, name, 'device'))
+        return device
+
+    def add_usb_serial(self, name, port, vid, pid, serial_number=None):
+        usb_device = os.path.join(self.root, 'devices', 'usb1', port)
+        self.add_device(
+            name, 'usb1/%s/%s:1.0/%s' % (port, port, name), 'usb-serial')
+        for attribute, value in (('idVendor', vid), ('idProduct', pid),
+                                 ('serial', serial_number)):
+            if value is not None:
+                with open(os.path.join(usb_device, attribute), 'w') as f:
+                    f.write(value + '\n')
+
+    def remove(self, name):
+        shutil.rmtree(os.path.join(self.tty, name))
+
+    def close(self):
+        shutil.rmtree(self.root)
+
+
+class TestDiscovery(unittest.TestCase):
+    def setUp(self):
+        self.sysfs = FakeSysfs()
+        self.sysfs.add_usb_serial('ttyUSB0', '1-1', '1a86', '5523')
+        self.sysfs.add_usb_serial('ttyUSB1', '1-2', '0403', '6001', 'FT42')
+
+    def tearDown(self):
+        self.sysfs.close()
+
+    def scan(self):
+        return discovery.scan(self.sysfs.tty, '/dev')
+
+    def test_scan_finds_usb_devices_only(self):
+        self.assertEqual(sorted(self.scan()), [
+            discovery.Device('/dev/ttyUSB0', '1A86', '5523', None),
+            discovery.Device('/dev/ttyUSB1', '0403', '6001', 'FT42')])
+
+    def test_index_find(self):
+        index = discovery.DeviceIndex(self.scan())
+        self.assertEqual(index.find('1a86:5523'), '/dev/ttyUSB0')
+        self.assertEqual(index.find('0403:6001', 'FT42'), '/dev/ttyUSB1')
+        with self.assertRaises(exceptions.RoasterLookupError):
+            index.find('0403:6001', 'FT43')
+        with self.assertRaises(exceptions.RoasterLookupError):
+            index.find('1234:5678')
+
+    def test_index_remove(self):
+        index = discovery.DeviceIndex(self.scan())
+        index.remove('/dev/ttyUSB1')
+        index.remove('/dev/ttyUSB1')
+        self.assertEqual([d.node for d in index.devices()], ['/dev/ttyUSB0'])
+        with self.assertRaises(exceptions.RoasterLookupError):
+            index.find('0403:6001', 'FT42')
+
+    def test_parse_uevent(self):
+        fields = discovery.parse_uevent(uevent('add', 'ttyUSB2'))
+        self.assertEqual(fields['ACTION'], 'add')
+        self.assertEqual(fields['DEVNAME'], 'ttyUSB2')
+        self.assertEqual(fields['SUBSYSTEM'], 'tty')
+
+    def test_polling_monitor_finds_new_device(self):
+        monitor = discovery.DeviceMonitor(
+            hotplug=False, poll_interval=0.01, sysfs_root=self.sysfs.tty,
+            dev_root='/dev')
+        self.addCleanup(monitor.close)
+        self.assertTrue(monitor.polling)
+        self.assertFalse(monitor.refresh())
+        with self.assertRaises(exceptions.RoasterLookupError):
+            monitor.index.find('1A86:5524')
+        self.sysfs.add_usb_serial('ttyUSB2', '1-3', '1a86', '5524')
+        self.assertTrue(monitor.refresh())
+        self.assertEqual(monitor.index.find('1A86:5524'), '/dev/ttyUSB2')
+
+    def test_hotplug_monitor_handles_events(self):
+        monitor = discovery.DeviceMonitor(
+            hotplug=False, sysfs_root=self.sysfs.tty, dev_root='/dev')
+        self.addCleanup(monitor.close)
+        # stand in for the netlink socket
+        monitor._sock, kernel = socket.socketpair(
+            socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.addCleanup(kernel.close)
+        self.assertFalse(monitor.polling)
+        self.sysfs.add_usb_serial('ttyUSB2', '1-3', '1a86', '5524')
+        # not rescanned until the kernel reports it
+        self.assertFalse(monitor.refresh())
+        with self.assertRaises(exceptions.RoasterLookupError):
+            monitor.index.find('1A86:5524')
+        kernel.send(uevent('add', 'ttyUSB3', subsystem='usb'))
+        kernel.send(uevent('add', 'ttyUSB2'))
+        self.assertTrue(monitor.refresh())
+        self.assertEqual(monitor.index.find('1A86:5524'), '/dev/ttyUSB2')
+        self.sysfs.remove('ttyUSB0')
+        kernel.send(uevent('remove', 'ttyUSB0'))
+        self.assertFalse(monitor.refresh())
+        with self.assertRaises(exceptions.RoasterLookupError):
+            monitor.index.find('1A86:5523')
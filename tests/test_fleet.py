@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015-2016 Mark Spicer
+# Made available under the MIT license.
+
+import time
+import threading
+import unittest
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from freshroastsr700 import fleet
+from freshroastsr700 import exceptions
+
+from fakes import PAYLOAD
+from fakes import FakeSerial
+
+
+def fake_connect(roaster):
+    def connect(port=None):
+        roaster._ser = FakeSerial()
+    return connect
+
+
+class TestRoasterFleet(unittest.TestCase):
+    def setUp(self):
+        self.fleet = fleet.RoasterFleet(workers=2)
+
+    def tearDown(self):
+        self.fleet.terminate()
+
+    def wait_for(self, condition):
+        deadline = time.monotonic() + 5
+        while not condition():
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+
+    def test_lookup(self):
+        first = self.fleet.add(port='/dev/ttyUSB0')
+        second = self.fleet.add(serial_number='A1')
+        self.assertEqual(len(self.fleet), 2)
+        self.assertEqual(list(self.fleet), [first, second])
+        self.assertIs(self.fleet[1], second)
+        self.assertIs(self.fleet['/dev/ttyUSB0'], first)
+        self.assertIs(self.fleet['A1'], second)
+        with self.assertRaises(KeyError):
+            self.fleet['A2']
+
+    def test_backend_rejected(self):
+        with self.assertRaises(TypeError):
+            self.fleet.add(backend='thread')
+
+    def test_roasters_share_worker_threads(self):
+        roasters = [self.fleet.add(comm_period=0.05) for _ in range(5)]
+        for roaster in roasters:
+            roaster._connect = fake_connect(roaster)
+        threads = threading.active_count()
+        self.fleet.connect()
+        self.wait_for(lambda: all(
+            roaster.stats()['frames_decoded'] >= 3 for roaster in roasters))
+        # one thread per worker, whatever the number of roasters
+        self.assertLessEqual(threading.active_count(), threads + 2)
+        # each roaster keeps its own state
+        roasters[0].roast()
+        roasters[0].time_remaining = 60
+        self.assertEqual(roasters[0].get_roaster_state(), 'roasting')
+        self.assertEqual(roasters[1].get_roaster_state(), 'idle')
+        self.assertEqual(roasters[1].time_remaining, 0)
+
+    def test_failed_comm_loop_settles_connect(self):
+        broken, healthy = [self.fleet.add(comm_period=0.05)
+                           for _ in range(2)]
+        healthy._connect = fake_connect(healthy)
+
+        def connect(port=None):
+            raise RuntimeError('driver crashed')
+        broken._connect = connect
+        outcome = []
+
+        def connect_fleet():
+            try:
+                self.fleet.connect()
+            except exceptions.RoasterLookupError:
+                outcome.append('failed')
+        caller = threading.Thread(target=connect_fleet, daemon=True)
+        with mock.patch('logging.exception'):
+            caller.start()
+            caller.join(5)
+        self.assertEqual(outcome, ['failed'])
+        self.assertEqual(broken.connect_state, broken.CS_NOT_CONNECTED)
+        self.assertTrue(healthy.connected)
+        # the next request gets a new comm loop
+        broken._connect = fake_connect(broken)
+        broken.connect()
+        self.assertTrue(broken.connected)
+
+    def test_reinit_does_not_stall_the_worker(self):
+        slow = fleet.RoasterFleet()
+        self.addCleanup(slow.terminate)
+        first, second = [slow.add(comm_period=0.05) for _ in range(2)]
+        for roaster in (first, second):
+            roaster._connect = fake_connect(roaster)
+        reinits = []
+
+        def initialize():
+            # a roaster slow to answer the handshake
+            reinits.append(second.stats()['frames_decoded'])
+            time.sleep(1.0)
+            first._ser.payload = PAYLOAD
+            reinits.append(second.stats()['frames_decoded'])
+            return True
+        first._initialize = initialize
+        slow.connect()
+        self.wait_for(lambda: first.stats()['frames_decoded'] >= 3)
+        # 600degF, out of range
+        first._ser.payload = PAYLOAD[:8] + b'\x02\x58'
+        self.wait_for(lambda: len(reinits) == 2)
+        self.assertEqual(first.stats()['reinits'], 1)
+        # the second roaster kept its 20 Hz cadence meanwhile
+        self.assertGreater(reinits[1] - reinits[0], 10)
+
+    def test_connect_reports_missing_roaster(self):
+        found = self.fleet.add()
+        found._connect = fake_connect(found)
+        missing = self.fleet.add()
+        missing._connect = mock.Mock(
+            side_effect=exceptions.RoasterLookupError)
+        with self.assertRaises(exceptions.RoasterLookupError):
+            self.fleet.connect()
+        self.assertTrue(found.connected)
+        self.assertFalse(missing.connected)
+
+    def test_terminate_stops_comm_loops(self):
+        roasters = [self.fleet.add() for _ in range(3)]
+        for roaster in roasters:
+            roaster._connect = fake_connect(roaster)
+        self.fleet.connect()
+        self.fleet.terminate()
+        for roaster in roasters:
+            self.assertFalse(roaster.comm_process.is_alive())
+            self.assertFalse(roaster.connected)
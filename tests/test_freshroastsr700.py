@@ -2,36 +2,63 @@
 # Copyright (c) 2015-2016 Mark Spicer
 # Made available under the MIT license.
 
+import time
+import socket
 import unittest
+import threading
+try:
+    from unittest import mock
+except ImportError:
+    import mock
 import freshroastsr700
 
+from freshroastsr700 import pid
+from freshroastsr700 import backend
+from freshroastsr700 import discovery
+from freshroastsr700 import modulator
+from freshroastsr700 import protocol
+from freshroastsr700 import utils
 from freshroastsr700 import exceptions
+from freshroastsr700 import telemetry
+
+from fakes import PAYLOAD
+from fakes import FakeSerial
+from fakes import FlakySerial
+from fakes import ReadFailingSerial
+from fakes import RecipeSerial
 
 
 class TestFreshroastsr700(unittest.TestCase):
+    backend = backend.PROCESS
+
     def setUp(self):
-        self.roaster = freshroastsr700.freshroastsr700(thermostat=True)
+        self.roaster = freshroastsr700.freshroastsr700(
+            thermostat=True, backend=self.backend)
+
+    def tearDown(self):
+        self.roaster.terminate()
 
     def test_init_var_header(self):
-        self.assertEqual(self.roaster._header.value, b'\xAA\xAA')
+        self.assertEqual(self.roaster._header, b'\xAA\xAA')
 
     def test_init_var_temp_unit(self):
-        self.assertEqual(self.roaster._temp_unit.value, b'\x61\x74')
+        self.assertEqual(self.roaster._temp_unit, b'\x61\x74')
 
     def test_init_var_flags(self):
-        self.assertEqual(self.roaster._flags.value, b'\x63')
+        self.assertEqual(self.roaster._flags, b'\x63')
 
     def test_init_var_current_state(self):
-        self.assertEqual(self.roaster._current_state.value, b'\x02\x01')
+        self.assertEqual(
+            bytes(self.roaster._state.block.current_state), b'\x02\x01')
 
     def test_init_var_footer(self):
         self.assertEqual(self.roaster._footer, b'\xAA\xFA')
 
     def test_init_var_fan_speed(self):
-        self.assertEqual(self.roaster._fan_speed.value, 1)
+        self.assertEqual(self.roaster._state.block.fan_speed, 1)
 
     def test_init_var_heat_setting(self):
-        self.assertEqual(self.roaster._heat_setting.value, 0)
+        self.assertEqual(self.roaster._state.block.heat_setting, 0)
 
     def test_init_var_time_remaining(self):
         self.assertEqual(self.roaster.time_remaining, 0)
@@ -46,19 +73,23 @@ class TestFreshroastsr700(unittest.TestCase):
 
     def test_idle(self):
         self.roaster.idle()
-        self.assertEqual(self.roaster._current_state.value, b'\x02\x01')
+        self.assertEqual(
+            bytes(self.roaster._state.block.current_state), b'\x02\x01')
 
     def test_roast(self):
         self.roaster.roast()
-        self.assertEqual(self.roaster._current_state.value, b'\x04\x02')
+        self.assertEqual(
+            bytes(self.roaster._state.block.current_state), b'\x04\x02')
 
     def test_cool(self):
         self.roaster.cool()
-        self.assertEqual(self.roaster._current_state.value, b'\x04\x04')
+        self.assertEqual(
+            bytes(self.roaster._state.block.current_state), b'\x04\x04')
 
     def test_sleep(self):
         self.roaster.sleep()
-        self.assertEqual(self.roaster._current_state.value, b'\x08\x01')
+        self.assertEqual(
+            bytes(self.roaster._state.block.current_state), b'\x08\x01')
 
     def test_getting_var_fan_speed(self):
         self.assertEqual(self.roaster.fan_speed, 1)
@@ -101,32 +132,324 @@ class TestFreshroastsr700(unittest.TestCase):
         self.roaster.heat_setting = 3
         self.assertEqual(self.roaster.heat_setting, 3)
 
+    def test_apply(self):
+        self.roaster.apply(
+            state='roasting', fan_speed=5, target_temp=400,
+            time_remaining=60)
+        self.assertEqual('roasting', self.roaster.get_roaster_state())
+        self.assertEqual(self.roaster.fan_speed, 5)
+        self.assertEqual(self.roaster.target_temp, 400)
+        self.assertEqual(self.roaster.time_remaining, 60)
+        self.assertFalse(self.roaster._write_now_event.is_set())
+
+    def test_apply_invalid_changes_nothing(self):
+        with self.assertRaises(exceptions.RoasterValueError):
+            self.roaster.apply(state='roasting', fan_speed=10)
+        self.assertEqual('idle', self.roaster.get_roaster_state())
+        self.assertEqual(self.roaster.fan_speed, 1)
+
+    def test_apply_invalid_state(self):
+        with self.assertRaises(exceptions.RoasterValueError):
+            self.roaster.apply(state='connecting')
+
+    def test_apply_write_now(self):
+        self.roaster.apply(heat_setting=2, write_now=True)
+        self.assertTrue(self.roaster._write_now_event.is_set())
+
+    def test_process_response_data_telemetry(self):
+        roaster = freshroastsr700.freshroastsr700(
+            telemetry_queue=telemetry.TelemetryQueue(backend=self.backend),
+            backend=self.backend)
+        self.addCleanup(roaster.terminate)
+        roaster.roast()
+        roaster._process_response_data(
+            b'\x61\x74\x00\x04\x02\x09\x32\x03\x01\x60', None)
+        records = roaster.telemetry_queue.get(timeout=0)
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0].current_temp, 352)
+        self.assertEqual(records[0].state_name, 'roasting')
+
+    def test_drive_heater_records_sample_to_pid_latency(self):
+        heater = freshroastsr700.heat_controller(number_of_segments=8)
+        pidc = pid.PID(0.06, 0.0075, 0.01)
+        self.roaster.roast()
+        self.roaster._state.set(current_temp=300, target_temp=400)
+        # the PID only runs when the heater is about to roll over
+        while not heater.about_to_rollover():
+            heater.generate_bangbang_output()
+        self.assertTrue(self.roaster._drive_heater(
+            heater, pidc, False, 0.0))
+        latency = self.roaster.sample_to_pid_latency
+        self.assertEqual(latency['count'], 1)
+        self.assertEqual(latency['last'], latency['max'])
+
+    def test_drive_heater_sigma_delta(self):
+        heater = modulator.SigmaDeltaModulator(number_of_segments=8)
+        pidc = pid.PID(0.06, 0.0075, 0.01)
+        expected = pid.PID(0.06, 0.0075, 0.01)
+        self.roaster.roast()
+        self.roaster._state.set(current_temp=300, target_temp=400)
+        # the PID runs, and its fractional level is used, on every tick
+        for _ in range(3):
+            self.assertTrue(self.roaster._drive_heater(heater, pidc, False))
+            self.assertEqual(heater.heat_level, expected.update(300, 400))
+        self.assertEqual(self.roaster.heater_level,
+                         round(heater.heat_level))
+
+    def test_drive_heater_sigma_delta_off_when_not_roasting(self):
+        heater = modulator.SigmaDeltaModulator(number_of_segments=8)
+        heater.heat_level = 2.5
+        self.roaster._state.set(heat_setting=3, heater_level=5)
+        self.assertFalse(self.roaster._drive_heater(
+            heater, pid.PID(0.06, 0.0075, 0.01), False))
+        self.assertEqual(heater.heat_level, 0)
+        self.assertEqual(self.roaster.heater_level, 0)
+
+    def test_bad_modulation(self):
+        with self.assertRaises(exceptions.RoasterValueError):
+            freshroastsr700.freshroastsr700(
+                thermostat=True, backend=self.backend, modulation='pwm')
+
+    def test_drive_heater_off_when_not_roasting(self):
+        heater = freshroastsr700.heat_controller(number_of_segments=8)
+        self.roaster._state.set(heat_setting=3, heater_level=5)
+        self.assertFalse(self.roaster._drive_heater(
+            heater, pid.PID(0.06, 0.0075, 0.01), False))
+        self.assertEqual(self.roaster.heat_setting, 0)
+        self.assertEqual(self.roaster.heater_level, 0)
+
+    def test_read_and_process_stats(self):
+        packet = b'\xAA\xAA' + PAYLOAD + b'\xAA\xFA'
+        # a truncated packet, dropped when the next header shows up
+        data = packet[:6] + packet + packet
+        self.roaster._ser = mock.Mock(in_waiting=len(data))
+        self.roaster._ser.read.return_value = data
+        count = self.roaster._read_and_process(protocol.PacketFramer(), None)
+        self.assertEqual(count, 2)
+        stats = self.roaster.stats()
+        self.assertEqual(stats['bytes_received'], len(data))
+        self.assertEqual(stats['frames_decoded'], 2)
+        self.assertEqual(stats['bad_frames'], 1)
+        self.assertEqual(stats['read_time']['count'], 1)
+
+    def test_read_error_stats(self):
+        self.roaster._ser = mock.Mock()
+        type(self.roaster._ser).in_waiting = mock.PropertyMock(
+            side_effect=IOError)
+        with self.assertRaises(IOError):
+            self.roaster._read_from_device(protocol.PacketFramer())
+        stats = self.roaster.stats()
+        self.assertEqual(stats['read_errors'], 1)
+        self.assertEqual(stats['serial_exceptions'], 1)
+
+    def test_initialize_reads_recipe(self):
+        self.assertIsNone(self.roaster.recipe)
+        self.roaster._ser = RecipeSerial()
+        self.assertTrue(self.roaster._initialize())
+        parsed = self.roaster.recipe
+        self.assertEqual(parsed.manual.time, 354)
+        self.assertEqual([step.heat_setting for step in parsed.steps],
+                         [3, 0])
+
+    def test_handshake_timeout(self):
+        roaster = freshroastsr700.freshroastsr700(
+            backend=self.backend, handshake_timeout=0.1)
+        self.addCleanup(roaster.terminate)
+        roaster._ser = RecipeSerial(silent=True)
+        start = time.monotonic()
+        self.assertFalse(roaster._initialize())
+        self.assertLess(time.monotonic() - start, 1.0)
+        self.assertIsNone(roaster.recipe)
+        self.assertEqual(roaster.stats()['handshake_timeouts'], 1)
+
+    def test_fast_connect_skips_readback(self):
+        roaster = freshroastsr700.freshroastsr700(
+            backend=self.backend, fast_connect=True)
+        self.addCleanup(roaster.terminate)
+        roaster._ser = RecipeSerial()
+        self.assertTrue(roaster._initialize())
+        self.assertIsNone(roaster.recipe)
+        # the readback is dropped, the response that follows it is not
+        roaster._ser.write(b'\xAA\xAA')
+        self.assertEqual(
+            roaster._read_and_process(protocol.PacketFramer(), None), 1)
+        self.assertEqual(roaster.stats()['reinits'], 0)
+
+    def fake_clock(self):
+        clock = [100.0]
+        self.roaster._state.clock = lambda: clock[0]
+        return clock
+
+    def test_countdown_runs_while_roasting(self):
+        clock = self.fake_clock()
+        self.roaster.time_remaining = 2
+        clock[0] += 5.0
+        self.assertEqual(self.roaster.time_remaining_ms, 2000)
+        self.roaster.roast()
+        clock[0] += 1.25
+        self.assertEqual(self.roaster.time_remaining_ms, 750)
+        self.assertEqual(self.roaster.time_remaining, 1)
+        self.assertEqual(self.roaster.total_time, 1)
+        self.roaster.idle()
+        clock[0] += 5.0
+        self.assertEqual(self.roaster.time_remaining_ms, 750)
+        self.assertEqual(self.roaster.total_time, 1)
+
+    def test_set_time_remaining_while_roasting(self):
+        clock = self.fake_clock()
+        self.roaster.apply(state='roasting', time_remaining=10)
+        clock[0] += 4.5
+        self.roaster.time_remaining_ms = 2500
+        clock[0] += 0.5
+        self.assertEqual(self.roaster.time_remaining_ms, 2000)
+        self.assertEqual(self.roaster.total_time, 5)
+
+    def test_apply_time_remaining_ms(self):
+        self.roaster.apply(time_remaining=10, time_remaining_ms=1500)
+        self.assertEqual(self.roaster.time_remaining_ms, 1500)
+        with self.assertRaises(exceptions.RoasterValueError):
+            self.roaster.apply(time_remaining_ms=600001)
+
+    def test_run_timer_deadline(self):
+        clock = self.fake_clock()
+        self.assertIsNone(self.roaster._run_timer())
+        self.roaster.apply(state='roasting', time_remaining_ms=1500)
+        self.assertAlmostEqual(self.roaster._run_timer(), clock[0] + 1.5)
+
+    def test_run_timer_transition(self):
+        clock = self.fake_clock()
+        event = utils.SelectableEvent(self.backend)
+        self.roaster.apply(state='cooling', time_remaining_ms=1500)
+        clock[0] += 1.499
+        self.roaster._run_timer(event)
+        self.assertFalse(event.is_set())
+        clock[0] += 0.001
+        self.assertIsNone(self.roaster._run_timer(event))
+        self.assertTrue(event.is_set())
+        self.assertEqual(self.roaster.time_remaining, 0)
+        self.assertEqual('cooling', self.roaster.get_roaster_state())
+        # fires once per countdown
+        event.clear()
+        clock[0] += 1.0
+        self.roaster._run_timer(event)
+        self.assertFalse(event.is_set())
+
+    def test_run_timer_idles_without_event(self):
+        clock = self.fake_clock()
+        self.roaster.apply(state='roasting', time_remaining=1)
+        clock[0] += 1.0
+        self.roaster._run_timer()
+        self.assertEqual('idle', self.roaster.get_roaster_state())
+
+    def test_run_timer_fires_when_started_at_zero(self):
+        clock = self.fake_clock()
+        event = utils.SelectableEvent(self.backend)
+        self.roaster.apply(state='roasting', time_remaining=0)
+        self.assertAlmostEqual(self.roaster._run_timer(event), 101.0)
+        clock[0] += 0.5
+        self.roaster._run_timer(event)
+        self.assertFalse(event.is_set())
+        clock[0] += 0.5
+        self.assertIsNone(self.roaster._run_timer(event))
+        self.assertTrue(event.is_set())
+        self.assertEqual('roasting', self.roaster.get_roaster_state())
+        # a countdown set in the meantime takes over
+        self.roaster.idle()
+        self.roaster.cool()
+        self.roaster.time_remaining = 5
+        clock[0] += 1.0
+        self.roaster._run_timer()
+        self.assertEqual('cooling', self.roaster.get_roaster_state())
+
+    def test_run_timer_idles_when_started_at_zero(self):
+        clock = self.fake_clock()
+        self.roaster.roast()
+        clock[0] += 1.0
+        self.roaster._run_timer()
+        self.assertEqual('idle', self.roaster.get_roaster_state())
+
+    def test_countdown_step_boundaries_do_not_drift(self):
+        clock = self.fake_clock()
+        event = utils.SelectableEvent(self.backend)
+        self.roaster.apply(state='roasting', time_remaining=60)
+        fired = []
+        # a 12 minute profile of 60 s steps, each started by the
+        # transition handler as soon as the previous one expires
+        while len(fired) < 12:
+            deadline = self.roaster._run_timer(event)
+            clock[0] = deadline
+            self.roaster._run_timer(event)
+            if event.is_set():
+                event.clear()
+                fired.append(clock[0])
+                self.roaster.time_remaining = 60
+        self.assertAlmostEqual(fired[-1], 100.0 + 12 * 60, places=3)
+
+    def test_construction_starts_no_engine(self):
+        self.assertIsNone(self.roaster.comm_process)
+
+    def test_start_comm_once(self):
+        self.roaster._start_comm()
+        comm_process = self.roaster.comm_process
+        self.assertTrue(comm_process.is_alive())
+        self.roaster._start_comm()
+        self.assertIs(self.roaster.comm_process, comm_process)
+        self.roaster.terminate()
+        self.assertFalse(comm_process.is_alive())
+
+    def test_connect_without_hardware(self):
+        self.roaster._connect = mock.Mock(
+            side_effect=exceptions.RoasterLookupError)
+        with self.assertRaises(exceptions.RoasterLookupError):
+            self.roaster.connect()
+        self.assertEqual(
+            self.roaster.connect_state, self.roaster.CS_NOT_CONNECTED)
+        self.assertTrue(self.roaster._connect_settled_event.is_set())
+
+    def test_terminate_ends_auto_connect(self):
+        self.roaster._connect = mock.Mock(
+            side_effect=exceptions.RoasterLookupError)
+        self.roaster.auto_connect()
+        self.roaster.terminate()
+        self.assertFalse(self.roaster.comm_process.is_alive())
+        self.assertEqual(
+            self.roaster.connect_state, self.roaster.CS_NOT_CONNECTED)
+
+    def test_connect_after_terminate(self):
+        self.roaster.terminate()
+        with self.assertRaises(exceptions.RoasterLookupError):
+            self.roaster.connect()
+
     def test_disconnect(self):
         self.roaster.disconnect()
-        self.assertTrue(self.roaster._disconnect.value)
+        self.assertTrue(self.roaster._state.block.disconnect)
 
     def test_get_roaster_state_roasting(self):
-        self.roaster._current_state.value = b'\x04\x02'
+        self.roaster._state.set(current_state=b'\x04\x02')
         self.assertEqual('roasting', self.roaster.get_roaster_state())
 
     def test_get_roaster_state_cooling(self):
-        self.roaster._current_state.value = b'\x04\x04'
+        self.roaster._state.set(current_state=b'\x04\x04')
         self.assertEqual('cooling', self.roaster.get_roaster_state())
 
     def test_get_roaster_state_idle(self):
-        self.roaster._current_state.value = b'\x02\x01'
+        self.roaster._state.set(current_state=b'\x02\x01')
         self.assertEqual('idle', self.roaster.get_roaster_state())
 
     def test_get_roaster_state_sleeping(self):
-        self.roaster._current_state.value = b'\x08\x01'
+        self.roaster._state.set(current_state=b'\x08\x01')
         self.assertEqual('sleeping', self.roaster.get_roaster_state())
 
     def test_get_roaster_state_connecting(self):
-        self.roaster._current_state.value = b'\x00\x00'
+        self.roaster._state.set(current_state=b'\x00\x00')
         self.assertEqual('connecting', self.roaster.get_roaster_state())
 
+    def test_get_roaster_state_cooling_for_pid_control(self):
+        self.roaster.cool(True)
+        self.assertEqual('roasting', self.roaster.get_roaster_state())
+
     def test_get_roaster_state_uknown(self):
-        self.roaster._current_state.value = b'\x13\x41'
+        self.roaster._state.set(current_state=b'\x13\x41')
         self.assertEqual('unknown', self.roaster.get_roaster_state())
 
     def test_heat_controller_4_segment_output(self):
@@ -177,3 +500,177 @@ class TestFreshroastsr700(unittest.TestCase):
         self.assertFalse(heater.about_to_rollover())
         self.assertTrue(heater.generate_bangbang_output())
         self.assertTrue(heater.about_to_rollover())
+
+
+class TestFreshroastsr700Threaded(TestFreshroastsr700):
+    backend = backend.THREAD
+
+    def test_engine_is_a_thread(self):
+        self.roaster._start_comm()
+        self.assertIsInstance(self.roaster.comm_process, threading.Thread)
+
+    def test_terminate_stops_engine(self):
+        self.roaster._start_comm()
+        self.roaster.terminate()
+        self.assertFalse(self.roaster.comm_process.is_alive())
+
+    def test_connect_to_first_packet(self):
+        def connect():
+            self.roaster._ser = FakeSerial()
+        self.roaster._connect = connect
+        self.roaster.connect()
+        self.assertTrue(self.roaster.connected)
+        deadline = time.monotonic() + 5
+        while not self.roaster.stats()['frames_decoded']:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+        latency = self.roaster.stats()['connect_to_first_packet']
+        self.assertEqual(latency['count'], 1)
+        self.assertGreater(latency['last'], 0)
+        ready = self.roaster.stats()['connect_to_ready']
+        self.assertEqual(ready['count'], 1)
+        self.assertLessEqual(ready['last'], latency['last'])
+        self.roaster.disconnect()
+        deadline = time.monotonic() + 5
+        while self.roaster.connected:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+
+    def test_auto_connect_waits_for_device(self):
+        monitor = mock.Mock(polling=False)
+        # plugged in after the first look
+        monitor.index.find.side_effect = [
+            exceptions.RoasterLookupError, '/dev/ttyUSB3']
+        # a hotplug event is pending
+        reader, writer = socket.socketpair()
+        self.addCleanup(reader.close)
+        self.addCleanup(writer.close)
+        writer.send(b'\x01')
+        monitor.fileno.return_value = reader.fileno()
+        ports = []
+
+        def connect(port=None):
+            ports.append(port)
+            self.roaster._ser = FakeSerial()
+        self.roaster._connect = connect
+        with mock.patch.object(discovery, 'DeviceMonitor',
+                               return_value=monitor) as DeviceMonitor:
+            self.roaster.auto_connect()
+            deadline = time.monotonic() + 5
+            while not self.roaster.connected:
+                self.assertLess(time.monotonic(), deadline)
+                time.sleep(0.01)
+        DeviceMonitor.assert_called_once_with(hotplug=True)
+        self.assertEqual(ports, ['/dev/ttyUSB3'])
+        monitor.refresh.assert_called_once_with()
+        monitor.close.assert_called_once_with()
+
+    def resume_roaster(self, resume_window, reopen_failures):
+        # a thermostat roaster, roasting, whose link can be cut with
+        # self.serial.failing, and which can reopen its port after
+        # reopen_failures failed attempts
+        self.queue = telemetry.TelemetryQueue(backend=self.backend)
+        roaster = freshroastsr700.freshroastsr700(
+            thermostat=True, backend=self.backend, comm_period=0.05,
+            telemetry_queue=self.queue, resume_window=resume_window)
+        self.addCleanup(roaster.terminate)
+        self.serial = FlakySerial()
+        self.reopens = []
+        self.monitor = mock.Mock(polling=False)
+        patcher = mock.patch.object(
+            discovery, 'DeviceMonitor', return_value=self.monitor)
+        self.DeviceMonitor = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        def connect():
+            roaster._ser = self.serial
+
+        def reopen(monitor):
+            self.assertIs(monitor, self.monitor)
+            self.reopens.append(time.monotonic())
+            if len(self.reopens) <= reopen_failures:
+                raise exceptions.RoasterLookupError
+            roaster._ser = FakeSerial()
+        roaster._connect = connect
+        roaster._reopen = reopen
+        roaster._initialize = mock.Mock()
+        roaster.apply(state='roasting', target_temp=400,
+                      time_remaining=600)
+        return roaster
+
+    def wait_for(self, condition):
+        deadline = time.monotonic() + 5
+        while not condition():
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+
+    def test_resume_after_link_drop(self):
+        with mock.patch.object(pid, 'PID', wraps=pid.PID) as PID:
+            roaster = self.resume_roaster(5, 2)
+            roaster.connect()
+            self.wait_for(lambda: roaster.stats()['frames_decoded'])
+            self.serial.failing = True
+            self.wait_for(
+                lambda: roaster.connect_state == roaster.CS_CONNECTING)
+            self.assertFalse(roaster.connected)
+            self.wait_for(lambda: roaster.stats()['link_gap']['count'])
+            self.wait_for(lambda: roaster.connected)
+        self.assertEqual(len(self.reopens), 3)
+        # one index for the whole resume, updated between attempts
+        self.DeviceMonitor.assert_called_once_with(hotplug=True)
+        self.assertEqual(self.monitor.refresh.call_count, 2)
+        self.monitor.close.assert_called_once_with()
+        # the roast carries on, with the same controller, and the roaster
+        # was not reinitialized
+        self.assertEqual(PID.call_count, 1)
+        roaster._initialize.assert_not_called()
+        self.assertEqual(roaster.get_roaster_state(), 'roasting')
+        self.assertEqual(roaster.target_temp, 400)
+        self.assertGreater(roaster.time_remaining, 590)
+        self.assertEqual(
+            roaster.stats()['connect_to_first_packet']['count'], 1)
+        gap = roaster.stats()['link_gap']['last']
+        self.assertGreater(gap, 0.15)
+        self.wait_for(lambda: roaster.stats()['frames_decoded'] > 5)
+        gaps = [r.link_gap for r in self.queue.get(timeout=0)]
+        self.assertEqual([g for g in gaps if g], [gap])
+
+    def test_resume_window_expires(self):
+        roaster = self.resume_roaster(0.3, 1000)
+        roaster.connect()
+        self.wait_for(lambda: roaster.stats()['frames_decoded'])
+        self.serial.failing = True
+        self.wait_for(
+            lambda: roaster.connect_state == roaster.CS_CONNECTING)
+        self.wait_for(
+            lambda: roaster.connect_state == roaster.CS_NOT_CONNECTED)
+        self.assertFalse(roaster.connected)
+        self.assertEqual(roaster.stats()['link_gap']['count'], 0)
+        self.assertGreater(self.reopens[-1] - self.reopens[0], 0.15)
+
+    def test_read_errors_are_retried_once_per_cycle(self):
+        roaster = self.resume_roaster(0, 0)
+        # a port that stays readable once it fails, as an unplugged one
+        reader, writer = socket.socketpair()
+        self.addCleanup(reader.close)
+        self.addCleanup(writer.close)
+        writer.send(b'\x01')
+        self.serial = ReadFailingSerial(reader.fileno())
+        roaster.connect()
+        self.wait_for(lambda: roaster.stats()['frames_decoded'])
+        self.serial.failing = True
+        self.wait_for(lambda: not roaster.connected)
+        self.assertEqual(len(self.serial.failures), 4)
+        # not within the same cycle
+        self.assertGreater(
+            self.serial.failures[-1] - self.serial.failures[0], 0.075)
+
+    def test_no_resume_by_default(self):
+        roaster = self.resume_roaster(0, 0)
+        roaster.connect()
+        self.wait_for(lambda: roaster.stats()['frames_decoded'])
+        self.serial.failing = True
+        self.wait_for(lambda: not roaster.connected)
+        self.wait_for(
+            lambda: roaster.connect_state == roaster.CS_NOT_CONNECTED)
+        self.assertEqual(self.reopens, [])
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015-2016 Mark Spicer
+# Made available under the MIT license.
+
+import unittest
+import multiprocessing as mp
+
+import freshroastsr700
+from freshroastsr700 import backend
+from freshroastsr700 import clock
+from freshroastsr700 import history
+from freshroastsr700 import telemetry
+from freshroastsr700 import exceptions
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def make_record(monotonic, current_temp):
+    return telemetry.TelemetryRecord(
+        0, 0.0, monotonic, current_temp, 400, 4, 3, 9,
+        telemetry.STATE_CODES['roasting'], 60)
+
+
+def fill(history_, count):
+    for i in range(count):
+        history_.append(make_record(100.0 + 0.25 * i, 150 + i))
+
+
+def fill_by_name(name, count):
+    # writes from another process, attached by name only
+    fill(history.TelemetryHistory.attach(name), count)
+
+
+@unittest.skipIf(numpy is None, 'numpy not installed')
+class TestTelemetryHistory(unittest.TestCase):
+    def setUp(self):
+        self.history = history.TelemetryHistory(capacity=16)
+
+    def tearDown(self):
+        self.history.close()
+
+    def test_latest_is_a_view(self):
+        fill(self.history, 5)
+        entries = self.history.latest()
+        self.assertEqual(list(entries['current_temp']),
+                         [150, 151, 152, 153, 154])
+        self.assertFalse(entries.flags['OWNDATA'])
+        del entries
+
+    def test_latest_wraps_around(self):
+        fill(self.history, 40)
+        entries = self.history.latest(10)
+        self.assertEqual(list(entries['current_temp']), list(range(180, 190)))
+        # never return the slot the writer fills next
+        self.assertEqual(len(self.history.latest()), 15)
+
+    def test_link_gap(self):
+        fill(self.history, 2)
+        self.history.append(make_record(101.0, 152)._replace(link_gap=1.5))
+        entries = self.history.latest()
+        self.assertEqual(list(entries['link_gap']), [0.0, 0.0, 1.5])
+        del entries
+
+    def test_last_seconds(self):
+        fill(self.history, 12)
+        entries = self.history.last(1.0, now=102.75)
+        self.assertEqual(list(entries['monotonic']),
+                         [101.75, 102.0, 102.25, 102.5, 102.75])
+        del entries
+
+    def test_last_on_the_history_clock(self):
+        fill(self.history, 12)
+        self.history.clock = clock.VirtualClock(
+            start=102.75, backend=backend.THREAD)
+        entries = self.history.last(0.5)
+        self.assertEqual(list(entries['monotonic']), [102.25, 102.5, 102.75])
+        del entries
+
+    def test_roaster_sets_its_clock(self):
+        roaster_clock = clock.VirtualClock(backend=backend.THREAD)
+        freshroastsr700.freshroastsr700(
+            backend=backend.THREAD, clock=roaster_clock,
+            telemetry_history=self.history)
+        self.assertIs(self.history.clock, roaster_clock)
+
+    def test_attach_from_another_process(self):
+        writer = mp.Process(
+            target=fill_by_name, args=(self.history.name, 8))
+        writer.start()
+        writer.join()
+        self.assertEqual(self.history.count, 8)
+        entries = self.history.latest(2)
+        self.assertEqual(list(entries['current_temp']), [156, 157])
+        del entries
+
+    def test_attach_rejects_other_segments(self):
+        from multiprocessing import shared_memory
+        other = shared_memory.SharedMemory(create=True, size=128)
+        try:
+            with self.assertRaises(exceptions.RoasterValueError):
+                history.TelemetryHistory.attach(other.name)
+        finally:
+            other.close()
+            other.unlink()
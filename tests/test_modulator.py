@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015-2016 Mark Spicer
+# Made available under the MIT license.
+
+import unittest
+
+from freshroastsr700 import exceptions
+from freshroastsr700 import modulator
+
+
+def pulses(heater, count):
+    return [heater.generate_bangbang_output() for _ in range(count)]
+
+
+class TestSigmaDeltaModulator(unittest.TestCase):
+    def test_whole_levels(self):
+        for segments in (4, 5, 6, 8, 10):
+            for level in range(segments + 1):
+                heater = modulator.SigmaDeltaModulator(segments)
+                heater.heat_level = level
+                train = pulses(heater, 4 * segments)
+                # as evenly spread as they can be: every window of any
+                # length holds the ideal number of on pulses, give or
+                # take one
+                for width in range(1, segments + 1):
+                    ideal = float(level) * width / segments
+                    for start in range(len(train) - width + 1):
+                        count = sum(train[start:start + width])
+                        self.assertLess(abs(count - ideal), 1,
+                                        (segments, level, width, start))
+
+    def test_half_level(self):
+        heater = modulator.SigmaDeltaModulator(8)
+        heater.heat_level = 4
+        self.assertEqual(pulses(heater, 4), [True, False, True, False])
+
+    def test_fractional_level(self):
+        heater = modulator.SigmaDeltaModulator(8)
+        heater.heat_level = 2.5
+        self.assertEqual(heater.heat_level, 2.5)
+        self.assertEqual(sum(pulses(heater, 160)), 50)
+
+    def test_new_level_picked_up_right_away(self):
+        heater = modulator.SigmaDeltaModulator(8)
+        heater.heat_level = 0
+        pulses(heater, 3)
+        self.assertTrue(heater.about_to_rollover())
+        heater.heat_level = 8
+        self.assertEqual(pulses(heater, 3), [True] * 3)
+        heater.heat_level = 0
+        self.assertEqual(pulses(heater, 3), [False] * 3)
+
+    def test_clamped(self):
+        heater = modulator.SigmaDeltaModulator(8)
+        heater.heat_level = 9.5
+        self.assertEqual(heater.heat_level, 8)
+        heater.heat_level = -1
+        self.assertEqual(heater.heat_level, 0)
+
+    def test_bad_segments(self):
+        with self.assertRaises(exceptions.RoasterValueError):
+            modulator.SigmaDeltaModulator(0)
+
+
+class TestControllerGains(unittest.TestCase):
+    def test_table(self):
+        self.assertEqual(
+            modulator.controller_gains(0.06, 0.0075, 0.01, 8),
+            (0.06, 0.0075, 0.01))
+
+    def test_sigma_delta(self):
+        kp, ki, kd = modulator.controller_gains(
+            0.06, 0.0075, 0.01, 8, modulator.SIGMA_DELTA)
+        self.assertEqual(kp, 0.06)
+        self.assertAlmostEqual(ki, 0.0075 / 8)
+        self.assertAlmostEqual(kd, 0.08)
+
+    def test_bad_modulation(self):
+        with self.assertRaises(exceptions.RoasterValueError):
+            modulator.controller_gains(0.06, 0.0075, 0.01, 8, 'pwm')
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015-2016 Mark Spicer
+# Made available under the MIT license.
+
+import ctypes
+import unittest
+
+from freshroastsr700 import protocol
+
+
+STATUS = b'\xAA\xAA\x61\x74\x00\x02\x01\x01\x32\x01\x01\x60\xAA\xFA'
+QUIRK = b'\xAA\xAA\x61\x74\x00\x04\x02\x09\x32\x03\x00\xFA'
+
+
+class TestPacketFramer(unittest.TestCase):
+    def setUp(self):
+        self.framer = protocol.PacketFramer()
+
+    def test_single_frame(self):
+        self.framer.feed(STATUS)
+        payload = self.framer.next_frame()
+        self.assertEqual(payload, STATUS[2:12])
+        self.assertEqual(protocol.payload_temp(payload), 352)
+        self.assertIsNone(self.framer.next_frame())
+        self.assertEqual(len(self.framer), 0)
+
+    def test_frame_split_across_reads(self):
+        for i in range(len(STATUS)):
+            self.framer.feed(STATUS[i:i + 1])
+            if i < len(STATUS) - 1:
+                self.assertIsNone(self.framer.next_frame())
+        self.assertEqual(self.framer.next_frame(), STATUS[2:12])
+
+    def test_missing_footer_at_250(self):
+        self.framer.feed(QUIRK + STATUS)
+        frames = list(self.framer.frames())
+        self.assertEqual(len(frames), 2)
+        self.assertEqual(protocol.payload_temp(frames[0]), 250)
+        self.assertEqual(protocol.payload_temp(frames[1]), 352)
+
+    def test_payload_containing_header_byte(self):
+        # 426degF is 0x01AA, which puts 0xAA right before the footer
+        packet = STATUS[:10] + b'\x01\xAA' + protocol.FOOTER
+        self.framer.feed(packet)
+        self.assertEqual(
+            protocol.payload_temp(self.framer.next_frame()), 426)
+
+    def test_resync_on_garbage(self):
+        self.framer.feed(b'\x01\xAA\x02' + STATUS[:9] + STATUS)
+        frames = list(self.framer.frames())
+        self.assertEqual(frames, [STATUS[2:12]])
+        self.assertEqual(self.framer.bad_frames, 1)
+
+    def test_overflow_keeps_newest_bytes(self):
+        framer = protocol.PacketFramer(capacity=32)
+        for _ in range(3):
+            framer.feed(STATUS)
+        self.assertLessEqual(len(framer), 32)
+        self.assertEqual(list(framer.frames()), [STATUS[2:12]] * 2)
+
+
+class TestPacketEncoder(unittest.TestCase):
+    def setUp(self):
+        self.encoder = protocol.PacketEncoder()
+
+    def test_encode(self):
+        packet = self.encoder.encode(protocol.HEADER, b'\x02\x01', 1, 354, 1)
+        self.assertEqual(
+            packet, b'\xAA\xAA\x61\x74\x63\x02\x01\x01\x3B\x01\x00\x00'
+                    b'\xAA\xFA')
+
+    def test_encode_reuses_buffer(self):
+        first = self.encoder.encode(protocol.HEADER, b'\x04\x02', 9, 60, 3)
+        second = self.encoder.encode(protocol.HEADER, b'\x04\x02', 9, 59, 3)
+        self.assertIs(first, second)
+        self.assertEqual(second[8], 0x0A)
+
+    def test_encode_state_buffer(self):
+        state = (ctypes.c_ubyte * 2)(0x04, 0x02)
+        self.encoder.encode(protocol.HEADER, state, 9, 60, 3)
+        state[1] = 0x04
+        packet = self.encoder.encode(protocol.HEADER, state, 9, 60, 3)
+        self.assertEqual(packet[5:7], b'\x04\x04')
+        packet = self.encoder.encode(protocol.HEADER, b'\x04\x04', 9, 60, 3)
+        self.assertEqual(packet[5:7], b'\x04\x04')
+        packet = self.encoder.encode(protocol.HEADER, b'\x02\x01', 9, 60, 3)
+        self.assertEqual(packet[5:7], b'\x02\x01')
+
+    def test_init_packet_state_padded(self):
+        packet = self.encoder.encode(protocol.INIT_HEADER, b'', 1, 0, 0)
+        self.assertEqual(len(packet), protocol.PACKET_LENGTH)
+        self.assertEqual(
+            packet, b'\xAA\x55\x61\x74\x63\x00\x00\x01\x00\x00\x00\x00'
+                    b'\xAA\xFA')
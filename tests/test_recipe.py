@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015-2016 Mark Spicer
+# Made available under the MIT license.
+
+import unittest
+
+from freshroastsr700 import backend
+from freshroastsr700 import recipe
+
+
+# the readback example of docs/communication_protocol.rst
+MANUAL = b'\x61\x74\xA0\x00\x00\x09\x3B\x02\x00\x00'
+FIRST = b'\x61\x74\xAA\x00\x00\x09\x03\x03\x00\x00'
+SECOND = b'\x61\x74\xAA\x00\x00\x09\x01\x02\x00\x00'
+LAST = b'\x61\x74\xAF\x00\x00\x09\x1C\x00\x00\x00'
+RESPONSE = b'\x61\x74\x00\x04\x02\x09\x32\x03\x01\x60'
+
+
+class TestRecipe(unittest.TestCase):
+    def test_parse(self):
+        parsed = recipe.parse([MANUAL, FIRST, SECOND, LAST])
+        self.assertEqual(parsed.manual, recipe.RecipeStep(9, 354, 2))
+        self.assertEqual(parsed.steps, [
+            recipe.RecipeStep(9, 18, 3),
+            recipe.RecipeStep(9, 6, 2),
+            recipe.RecipeStep(9, 168, 0)])
+        self.assertEqual(parsed.total_time, 192)
+
+    def test_reader_ends_on_last_line(self):
+        reader = recipe.RecipeReader()
+        for payload in (MANUAL, FIRST, SECOND):
+            self.assertFalse(reader.feed(payload))
+        self.assertTrue(reader.feed(LAST))
+        # anything after the readback is not part of it
+        self.assertTrue(reader.feed(RESPONSE))
+        self.assertEqual(reader.payloads, [MANUAL, FIRST, SECOND, LAST])
+        self.assertEqual(len(reader.recipe().steps), 3)
+
+    def test_reader_ends_on_response(self):
+        reader = recipe.RecipeReader()
+        self.assertTrue(reader.feed(RESPONSE))
+        self.assertEqual(reader.recipe(), recipe.Recipe(None, []))
+
+    def test_buffer(self):
+        buffer_ = recipe.create_recipe_buffer(backend.THREAD)
+        self.assertIsNone(recipe.read(buffer_))
+        recipe.publish(buffer_, [MANUAL, FIRST, LAST])
+        self.assertEqual(recipe.read(buffer_),
+                         recipe.parse([MANUAL, FIRST, LAST]))
+        self.assertEqual(buffer_.seq % 2, 0)
+        recipe.publish(buffer_, [])
+        self.assertEqual(recipe.read(buffer_), recipe.Recipe(None, []))
+
+    def test_buffer_drops_extra_lines(self):
+        buffer_ = recipe.create_recipe_buffer(backend.THREAD)
+        recipe.publish(buffer_, [FIRST] * (recipe.MAX_LINES + 4))
+        self.assertEqual(
+            len(recipe.read(buffer_).steps), recipe.MAX_LINES)
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015-2016 Mark Spicer
+# Made available under the MIT license.
+
+import unittest
+
+from freshroastsr700 import scheduler
+from freshroastsr700 import exceptions
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestCycleScheduler(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def make(self, policy=scheduler.SKIP):
+        cycle = scheduler.CycleScheduler(
+            0.25, policy, clock=self.clock)
+        cycle.start()
+        return cycle
+
+    def test_deadlines_do_not_drift(self):
+        cycle = self.make()
+        for i in range(100):
+            cycle.begin_cycle()
+            # a cycle doing 10ms of work, starting 3ms late
+            self.clock.now += 0.01
+            # the late start comes out of this cycle's sleep
+            self.assertAlmostEqual(
+                cycle.remaining(), 0.24 - (0.003 if i else 0.0))
+            self.clock.now = cycle.deadline + 0.003
+        self.assertAlmostEqual(cycle.deadline, 100.0 + 100 * 0.25)
+        self.assertEqual(cycle.stats.cycles, 100)
+        self.assertEqual(cycle.stats.overruns, 0)
+
+    def test_jitter_histogram(self):
+        cycle = self.make()
+        cycle.begin_cycle()
+        self.clock.now = cycle.deadline + 0.004
+        cycle.begin_cycle()
+        self.clock.now = cycle.deadline + 0.3
+        cycle.begin_cycle()
+        histogram = dict(scheduler.jitter_histogram(cycle.stats))
+        self.assertEqual(histogram[1], 1)
+        self.assertEqual(histogram[5], 1)
+        self.assertEqual(histogram[None], 1)
+        self.assertAlmostEqual(cycle.stats.max_jitter, 0.3)
+
+    def test_overrun_skip(self):
+        cycle = self.make()
+        cycle.begin_cycle()
+        # the cycle runs 0.6s, past two deadlines
+        self.clock.now += 0.6
+        self.assertIsNone(cycle.timeout())
+        self.assertIsNone(cycle.timeout())
+        self.assertEqual(cycle.stats.overruns, 1)
+        cycle.begin_cycle()
+        self.assertEqual(cycle.stats.skipped, 1)
+        # back on the original grid
+        self.assertAlmostEqual(cycle.deadline, 100.75)
+
+    def test_overrun_catch_up(self):
+        cycle = self.make(scheduler.CATCH_UP)
+        cycle.begin_cycle()
+        self.clock.now += 0.6
+        cycle.timeout()
+        cycle.begin_cycle()
+        self.assertAlmostEqual(cycle.deadline, 100.5)
+        self.assertTrue(cycle.remaining() < 0)
+        self.assertEqual(cycle.stats.skipped, 0)
+
+    def test_invalid_policy(self):
+        with self.assertRaises(exceptions.RoasterValueError):
+            scheduler.CycleScheduler(0.25, 'drift')
+
+    def test_timeout_ends_early_at_until(self):
+        cycle = self.make()
+        cycle.begin_cycle()
+        self.clock.now += 0.05
+        self.assertAlmostEqual(cycle.timeout(self.clock.now + 0.01), 0.01)
+        # until already passed
+        self.assertEqual(cycle.timeout(self.clock.now - 0.01), 0.0)
+        self.assertAlmostEqual(cycle.timeout(), 0.2)
+        self.assertEqual(cycle.stats.overruns, 0)
+
+    def test_timeout_ignores_until_after_the_cycle(self):
+        cycle = self.make()
+        cycle.begin_cycle()
+        self.assertAlmostEqual(cycle.timeout(self.clock.now + 60), 0.25)
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015-2016 Mark Spicer
+# Made available under the MIT license.
+
+import os
+import time
+import select
+import unittest
+
+import freshroastsr700
+from freshroastsr700 import backend
+from freshroastsr700 import protocol
+from freshroastsr700 import simulator
+
+
+def control_packet(state=b'\x04\x02', fan_speed=1, heat_setting=3):
+    return bytes(protocol.PacketEncoder().encode(
+        protocol.HEADER, state, fan_speed, 60, heat_setting))
+
+
+class TestThermalModel(unittest.TestCase):
+    def test_heats_up_to_steady_state(self):
+        model = simulator.ThermalModel()
+        temps = [model.step(10, simulator.ROASTING, 1, 3)
+                 for _ in range(100)]
+        self.assertEqual(temps, sorted(temps))
+        # ambient + power / loss
+        self.assertAlmostEqual(temps[-1], 70 + 9 * 60, delta=1)
+
+    def test_fan_cools(self):
+        slow = simulator.ThermalModel()
+        fast = simulator.ThermalModel()
+        slow.step(600, simulator.ROASTING, 1, 3)
+        fast.step(600, simulator.ROASTING, 9, 3)
+        self.assertGreater(slow.temp, fast.temp + 100)
+
+    def test_no_heat_unless_roasting(self):
+        for state in (simulator.COOLING, b'\x02\x01', b'\x08\x01'):
+            model = simulator.ThermalModel(temp=400)
+            model.step(30, state, 5, 3)
+            self.assertLess(model.temp, 400)
+            self.assertGreater(model.temp, 70)
+
+    def test_long_steps_are_stable(self):
+        model = simulator.ThermalModel(temp=400)
+        model.step(1e6, simulator.COOLING, 9, 0)
+        self.assertAlmostEqual(model.temp, 70)
+
+    def test_noise(self):
+        model = simulator.ThermalModel(temp=300, noise=2.0, seed=1)
+        readings = set(model.reading() for _ in range(50))
+        self.assertGreater(len(readings), 1)
+        self.assertLess(max(readings) - min(readings), 30)
+
+
+@unittest.skipIf(not hasattr(os, 'openpty'), 'no ptys')
+class TestSimulatedRoaster(unittest.TestCase):
+    def setUp(self):
+        self.roaster = simulator.SimulatedRoaster()
+        self.addCleanup(self.roaster.close)
+        self.host = os.open(self.roaster.port, os.O_RDWR | os.O_NOCTTY)
+        self.addCleanup(os.close, self.host)
+        self.framer = protocol.PacketFramer()
+
+    def exchange(self, data):
+        # sends data to the roaster, and returns the raw answer
+        os.write(self.host, data)
+        select.select([self.roaster], [], [], 5)
+        self.roaster.service()
+        select.select([self.host], [], [], 5)
+        return os.read(self.host, 4096)
+
+    def test_readback(self):
+        answer = self.exchange(
+            b'\xAA\x55\x61\x74\x63\x00\x00\x00\x00\x00\x00\x00\xAA\xFA')
+        self.framer.feed(answer)
+        flags = [payload[protocol.PAYLOAD_FLAGS]
+                 for payload in self.framer.frames()]
+        self.assertEqual(flags, [
+            protocol.FLAGS_MANUAL, protocol.FLAGS_RECIPE,
+            protocol.FLAGS_RECIPE, protocol.FLAGS_RECIPE_END])
+        self.assertEqual(self.roaster.inits, 1)
+
+    def test_answer(self):
+        # garbage before the packet is skipped
+        answer = self.exchange(b'\x00\xAA' + control_packet(fan_speed=4))
+        self.assertEqual(len(answer), protocol.PACKET_LENGTH)
+        self.framer.feed(answer)
+        payload = self.framer.next_frame()
+        self.assertEqual(payload[protocol.PAYLOAD_FLAGS],
+                         protocol.FLAGS_ROASTER)
+        self.assertEqual(payload[protocol.PAYLOAD_FAN], 4)
+        # below 150degF
+        self.assertEqual(protocol.payload_temp(payload), 0xFF00)
+        self.assertEqual(self.roaster.packets, 1)
+
+    def test_no_footer_at_250(self):
+        self.roaster.model.temp = 250
+        answer = self.exchange(control_packet(heat_setting=0))
+        self.assertEqual(answer[-2:], b'\x00\xFA')
+        self.assertEqual(len(answer), protocol.PACKET_LENGTH - 2)
+        self.framer.feed(answer)
+        self.assertEqual(
+            protocol.payload_temp(self.framer.next_frame()), 250)
+
+    def test_footer_above_255(self):
+        # 506degF ends with 0xFA too, but only 250degF loses the footer
+        self.roaster.model.temp = 506
+        answer = self.exchange(control_packet(heat_setting=0))
+        self.assertEqual(answer[-4:], b'\x01\xFA' + protocol.FOOTER)
+        self.assertEqual(len(answer), protocol.PACKET_LENGTH)
+        self.framer.feed(answer)
+        self.assertEqual(
+            protocol.payload_temp(self.framer.next_frame()), 506)
+
+    def test_model_follows_settings(self):
+        clock = [100.0]
+        self.roaster._clock = lambda: clock[0]
+        self.roaster.model.temp = 300
+        self.exchange(control_packet(heat_setting=3))
+        clock[0] += 10
+        self.exchange(control_packet(heat_setting=0))
+        self.assertGreater(self.roaster.model.temp, 330)
+
+
+@unittest.skipIf(not hasattr(os, 'openpty'), 'no ptys')
+class TestEndToEnd(unittest.TestCase):
+    def test_thermostat_roast(self):
+        sim = simulator.Simulator()
+        self.addCleanup(sim.close)
+        # a quick roaster, so the test does not take minutes
+        device = sim.add(model=simulator.ThermalModel(
+            temp=200, heater_power=(0, 50, 100, 150), loss=0.25))
+        roaster = freshroastsr700.freshroastsr700(
+            port=device.port, thermostat=True, backend=backend.THREAD,
+            comm_period=0.05)
+        self.addCleanup(roaster.terminate)
+        roaster.connect()
+        self.assertEqual(roaster.recipe, simulator.DEFAULT_RECIPE)
+        roaster.apply(state='roasting', fan_speed=1, target_temp=300,
+                      time_remaining=60)
+        heater_levels = set()
+        deadline = time.monotonic() + 10
+        while roaster.current_temp < 280:
+            self.assertLess(time.monotonic(), deadline)
+            heater_levels.add(roaster.heater_level)
+            time.sleep(0.01)
+        self.assertGreater(max(heater_levels), 0)
+        self.assertEqual(roaster.get_roaster_state(), 'roasting')
+        self.assertEqual(roaster.stats()['reinits'], 0)
+        self.assertEqual(device.inits, 1)
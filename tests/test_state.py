@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015-2016 Mark Spicer
+# Made available under the MIT license.
+
+import unittest
+
+from freshroastsr700 import backend
+from freshroastsr700 import state
+
+
+class TestSharedState(unittest.TestCase):
+    def setUp(self):
+        self.state = state.SharedState(
+            current_state=b'\x02\x01', fan_speed=1, heat_setting=0)
+
+    def test_initial_values(self):
+        snapshot = self.state.snapshot()
+        self.assertEqual(bytes(snapshot.current_state), b'\x02\x01')
+        self.assertEqual(snapshot.fan_speed, 1)
+        self.assertEqual(self.state.block.seq % 2, 0)
+
+    def test_set_publishes_fields_together(self):
+        seq = self.state.block.seq
+        self.state.set(current_state=b'\x04\x02', heat_setting=3)
+        self.assertEqual(self.state.block.seq, seq + 2)
+        snapshot = self.state.snapshot()
+        self.assertEqual(bytes(snapshot.current_state), b'\x04\x02')
+        self.assertEqual(snapshot.heat_setting, 3)
+
+    def test_short_bytes_padded(self):
+        self.state.set(current_state=b'')
+        self.assertEqual(
+            bytes(self.state.block.current_state), b'\x00\x00')
+
+    def test_snapshot_is_a_copy(self):
+        snapshot = self.state.snapshot()
+        self.state.set(fan_speed=9)
+        self.assertEqual(snapshot.fan_speed, 1)
+
+    def test_snapshot_into_buffer(self):
+        buf = state.SnapshotBuffer(self.state)
+        snapshot = self.state.snapshot(buf)
+        self.assertIs(snapshot, buf.block)
+        self.state.set(current_state=b'\x04\x02', fan_speed=9)
+        self.assertEqual(snapshot.fan_speed, 1)
+        self.assertIs(self.state.snapshot(buf), snapshot)
+        self.assertEqual(snapshot.fan_speed, 9)
+        self.assertEqual(bytes(buf.current_state), b'\x04\x02')
+
+    def test_seq_odd_during_update(self):
+        with self.state.update() as block:
+            block.fan_speed = 5
+            self.assertEqual(self.state.block.seq % 2, 1)
+        self.assertEqual(self.state.snapshot().fan_speed, 5)
+
+
+class TestSharedStateThreaded(TestSharedState):
+    def setUp(self):
+        self.state = state.SharedState(
+            backend.THREAD,
+            current_state=b'\x02\x01', fan_speed=1, heat_setting=0)
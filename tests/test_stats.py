@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015-2016 Mark Spicer
+# Made available under the MIT license.
+
+import unittest
+
+from freshroastsr700 import stats
+from freshroastsr700 import scheduler
+
+
+class TestLatencyStats(unittest.TestCase):
+    def test_empty_summary(self):
+        summary = stats.latency_summary(stats.create_latency_stats())
+        self.assertEqual(summary['count'], 0)
+        self.assertEqual(summary['mean'], 0.0)
+
+    def test_record_latency(self):
+        latency_stats = stats.create_latency_stats()
+        for latency in (0.002, 0.006, 0.004):
+            stats.record_latency(latency_stats, latency)
+        summary = stats.latency_summary(latency_stats)
+        self.assertEqual(summary['count'], 3)
+        self.assertAlmostEqual(summary['mean'], 0.004)
+        self.assertEqual(summary['max'], 0.006)
+        self.assertEqual(summary['last'], 0.004)
+
+    def test_latency_histogram(self):
+        latency_stats = stats.create_latency_stats()
+        stats.record_latency(latency_stats, 0.00005)
+        stats.record_latency(latency_stats, 0.003)
+        stats.record_latency(latency_stats, 1.0)
+        histogram = dict(stats.latency_summary(latency_stats)['histogram'])
+        self.assertEqual(histogram[0.1], 1)
+        self.assertEqual(histogram[5], 1)
+        self.assertEqual(histogram[None], 1)
+        self.assertEqual(sum(histogram.values()), 3)
+
+
+class TestCommStats(unittest.TestCase):
+    def test_drives_a_cycle_scheduler(self):
+        comm_stats = stats.create_comm_stats()
+        cycle = scheduler.CycleScheduler(0.25, stats=comm_stats)
+        cycle.start()
+        cycle.begin_cycle()
+        self.assertEqual(stats.comm_summary(comm_stats)['cycles'], 1)
+
+    def test_comm_summary(self):
+        comm_stats = stats.create_comm_stats()
+        comm_stats.bytes_received = 28
+        comm_stats.frames_decoded = 2
+        stats.record_latency(comm_stats.write_time, 0.001)
+        summary = stats.comm_summary(comm_stats)
+        self.assertEqual(summary['bytes_received'], 28)
+        self.assertEqual(summary['frames_decoded'], 2)
+        self.assertEqual(summary['write_time']['count'], 1)
+        self.assertEqual(summary['pid_time']['count'], 0)
+        self.assertEqual(len(summary['jitter_histogram']),
+                         len(scheduler.JITTER_BINS_MS) + 1)
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015-2016 Mark Spicer
+# Made available under the MIT license.
+
+import select
+import unittest
+import threading
+import multiprocessing as mp
+
+from freshroastsr700 import backend
+from freshroastsr700 import telemetry
+from freshroastsr700 import exceptions
+
+
+def make_record(current_temp):
+    return telemetry.TelemetryRecord(
+        0, 1000.0 + current_temp, 10.0 + current_temp, current_temp, 400,
+        4, 3, 9, telemetry.STATE_CODES['roasting'], 60)
+
+
+def produce(queue, count):
+    for i in range(count):
+        queue.put(make_record(150 + i))
+
+
+class TestTelemetryQueue(unittest.TestCase):
+    def test_put_get_in_order(self):
+        queue = telemetry.TelemetryQueue(capacity=8)
+        for temp in (300, 301, 302):
+            self.assertTrue(queue.put(make_record(temp)))
+        records = queue.get(timeout=0)
+        self.assertEqual([r.current_temp for r in records], [300, 301, 302])
+        self.assertEqual([r.seq for r in records], [0, 1, 2])
+        self.assertEqual(records[0].state_name, 'roasting')
+        self.assertEqual(records[0].timestamp, 1300.0)
+        self.assertEqual(len(queue), 0)
+
+    def test_link_gap(self):
+        queue = telemetry.TelemetryQueue(capacity=8)
+        queue.put(make_record(300)._replace(link_gap=1.5))
+        queue.put(make_record(301))
+        records = queue.get(timeout=0)
+        self.assertEqual([r.link_gap for r in records], [1.5, 0.0])
+
+    def test_get_batch_size(self):
+        queue = telemetry.TelemetryQueue(capacity=8)
+        produce(queue, 5)
+        self.assertEqual(len(queue.get(max_records=2, timeout=0)), 2)
+        self.assertEqual(len(queue.get(timeout=0)), 3)
+
+    def test_get_timeout_empty(self):
+        queue = telemetry.TelemetryQueue()
+        self.assertEqual(queue.get(timeout=0.01), [])
+
+    def test_drop_oldest(self):
+        queue = telemetry.TelemetryQueue(capacity=4)
+        produce(queue, 6)
+        records = queue.get(timeout=0)
+        self.assertEqual([r.seq for r in records], [2, 3, 4, 5])
+        self.assertEqual(queue.dropped, 2)
+
+    def test_block_drops_newest_after_timeout(self):
+        queue = telemetry.TelemetryQueue(
+            capacity=2, policy=telemetry.BLOCK, block_timeout=0.01)
+        produce(queue, 2)
+        self.assertFalse(queue.put(make_record(400)))
+        self.assertEqual(queue.dropped, 1)
+        records = queue.get(timeout=0)
+        self.assertEqual([r.current_temp for r in records], [150, 151])
+
+    def test_invalid_policy(self):
+        with self.assertRaises(exceptions.RoasterValueError):
+            telemetry.TelemetryQueue(policy='drop_newest')
+
+    def test_fileno_readable(self):
+        queue = telemetry.TelemetryQueue()
+        self.assertEqual(select.select([queue], [], [], 0)[0], [])
+        produce(queue, 1)
+        self.assertEqual(select.select([queue], [], [], 1)[0], [queue])
+
+    def test_records_from_another_process(self):
+        queue = telemetry.TelemetryQueue(capacity=64)
+        producer = mp.Process(target=produce, args=(queue, 40))
+        producer.start()
+        records = []
+        while len(records) < 40:
+            batch = queue.get(timeout=5)
+            self.assertTrue(batch)
+            records.extend(batch)
+        producer.join()
+        self.assertEqual([r.seq for r in records], list(range(40)))
+        self.assertEqual(queue.dropped, 0)
+
+    def test_records_from_another_thread(self):
+        queue = telemetry.TelemetryQueue(
+            capacity=64, backend=backend.THREAD)
+        producer = threading.Thread(target=produce, args=(queue, 40))
+        producer.start()
+        records = []
+        while len(records) < 40:
+            batch = queue.get(timeout=5)
+            self.assertTrue(batch)
+            records.extend(batch)
+        producer.join()
+        self.assertEqual([r.seq for r in records], list(range(40)))
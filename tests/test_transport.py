@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015-2016 Mark Spicer
+# Made available under the MIT license.
+
+import os
+import time
+import socket
+import unittest
+import threading
+
+import freshroastsr700
+from freshroastsr700 import backend
+from freshroastsr700 import protocol
+from freshroastsr700 import transport
+
+
+RESPONSE = b'\xAA\xAA\x61\x74\x00\x04\x02\x09\x32\x03\x01\x60\xAA\xFA'
+READBACK = (b'\xAA\xAA\x61\x74\xAA\x00\x00\x09\x03\x03\x00\x00\xAA\xFA'
+            b'\xAA\xAA\x61\x74\xAF\x00\x00\x09\x1C\x00\x00\x00\xAA\xFA')
+
+
+class StandIn(object):
+    """A TCP server standing in for a roaster behind a raw bridge: answers
+    the initialization packet with a recipe, and every other packet with
+    a response."""
+    def __init__(self):
+        self._server = socket.socket()
+        self._server.bind(('127.0.0.1', 0))
+        self._server.listen(1)
+        self.url = 'socket://127.0.0.1:%d' % self._server.getsockname()[1]
+        self._conn = None
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def _serve(self):
+        conn = self._conn = self._server.accept()[0]
+        framer = protocol.PacketFramer()
+        while True:
+            try:
+                data = conn.recv(4096)
+            except OSError:
+                return
+            if not data:
+                return
+            # the initialization packet has a header of its own, which
+            # the framer skips
+            if data.startswith(protocol.INIT_HEADER):
+                conn.sendall(READBACK)
+            framer.feed(data)
+            while framer.next_frame() is not None:
+                conn.sendall(RESPONSE)
+
+    def close(self):
+        if self._conn is not None:
+            # wakes the server thread up, which a close alone may not do
+            self._conn.shutdown(socket.SHUT_RDWR)
+            self._conn.close()
+            self._conn = None
+        self._server.close()
+
+
+class TestOpenPort(unittest.TestCase):
+    def test_is_url(self):
+        self.assertTrue(transport.is_url('socket://bridge:7000'))
+        self.assertTrue(transport.is_url('rfc2217://bridge:7000'))
+        self.assertFalse(transport.is_url('/dev/ttyUSB0'))
+        self.assertFalse(transport.is_url(None))
+
+    def test_unknown_scheme(self):
+        with self.assertRaises(IOError):
+            transport.open_port('carrier-pigeon://loft')
+
+    def test_bad_address(self):
+        with self.assertRaises(IOError):
+            transport.open_port('socket://localhost:port')
+
+    def test_nobody_listening(self):
+        listener = socket.socket()
+        listener.bind(('127.0.0.1', 0))
+        port = listener.getsockname()[1]
+        listener.close()
+        for scheme in (transport.SOCKET, transport.RFC2217):
+            with self.assertRaises(IOError):
+                transport.open_port('%s://127.0.0.1:%d' % (scheme, port))
+
+
+class TestSocketTransport(unittest.TestCase):
+    def setUp(self):
+        self.stand_in = StandIn()
+        self.addCleanup(self.stand_in.close)
+        self.transport = transport.open_port(self.stand_in.url)
+        self.addCleanup(self.transport.close)
+
+    def wait_for_bytes(self, count):
+        deadline = time.monotonic() + 5
+        while self.transport.in_waiting < count:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.001)
+
+    def test_round_trip(self):
+        self.assertIsInstance(self.transport, transport.SocketTransport)
+        self.assertEqual(self.transport.in_waiting, 0)
+        self.assertEqual(self.transport.read(10), b'')
+        self.transport.write(RESPONSE + RESPONSE)
+        self.wait_for_bytes(2 * len(RESPONSE))
+        self.assertEqual(self.transport.read(100), RESPONSE + RESPONSE)
+
+    def test_closed_by_peer(self):
+        self.transport.write(RESPONSE)
+        self.wait_for_bytes(len(RESPONSE))
+        self.stand_in.close()
+        time.sleep(0.05)
+        # what arrived before the close can still be read
+        self.assertEqual(self.transport.read(100), RESPONSE)
+        with self.assertRaises(IOError):
+            self.transport.in_waiting
+
+
+@unittest.skipIf(not hasattr(os, 'openpty'), 'no ptys')
+class TestPtyTransport(unittest.TestCase):
+    def setUp(self):
+        self.transport = transport.PtyTransport()
+        self.addCleanup(self.transport.close)
+        self.slave = os.open(self.transport.name, os.O_RDWR | os.O_NOCTTY)
+        self.addCleanup(os.close, self.slave)
+
+    def test_round_trip(self):
+        self.assertEqual(self.transport.read(10), b'')
+        # bytes the terminal would otherwise translate go through as they
+        # are
+        os.write(self.slave, b'\xAA\x0D\x0A\x03')
+        deadline = time.monotonic() + 5
+        while self.transport.in_waiting < 4:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.001)
+        self.assertEqual(self.transport.read(10), b'\xAA\x0D\x0A\x03')
+        self.transport.write(RESPONSE)
+        self.assertEqual(os.read(self.slave, 100), RESPONSE)
+
+
+class TestRoasterOverSocket(unittest.TestCase):
+    def test_connect(self):
+        stand_in = StandIn()
+        self.addCleanup(stand_in.close)
+        roaster = freshroastsr700.freshroastsr700(
+            port=stand_in.url, backend=backend.THREAD, comm_period=0.05)
+        self.addCleanup(roaster.terminate)
+        roaster.connect()
+        self.assertTrue(roaster.connected)
+        self.assertEqual(len(roaster.recipe.steps), 2)
+        deadline = time.monotonic() + 5
+        while roaster.stats()['frames_decoded'] < 3:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+        self.assertEqual(roaster.current_temp, 352)
+
+    def test_connect_without_bridge(self):
+        listener = socket.socket()
+        listener.bind(('127.0.0.1', 0))
+        url = 'socket://127.0.0.1:%d' % listener.getsockname()[1]
+        listener.close()
+        roaster = freshroastsr700.freshroastsr700(
+            port=url, backend=backend.THREAD)
+        self.addCleanup(roaster.terminate)
+        with self.assertRaises(freshroastsr700.exceptions.RoasterLookupError):
+            roaster.connect()
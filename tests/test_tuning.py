@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015-2016 Mark Spicer
+# Made available under the MIT license.
+
+import os
+import time
+import random
+import threading
+import unittest
+
+import freshroastsr700
+from freshroastsr700 import backend
+from freshroastsr700 import clock
+from freshroastsr700 import history
+from freshroastsr700 import modulator
+from freshroastsr700 import pid
+from freshroastsr700 import simulator
+from freshroastsr700 import telemetry
+from freshroastsr700 import exceptions
+try:
+    import numpy
+    from freshroastsr700 import tuning
+except ImportError:
+    numpy = None
+
+
+PROFILE = ((12, 300, 9), (12, 350, 5))
+
+
+def fast_model():
+    return simulator.ThermalModel(heater_power=(0, 15, 30, 45))
+
+
+def reference_roast(model, kp, ki, kd, profile, modulation=modulator.TABLE):
+    """The roast of tuning.simulate(), one cycle at a time, with the
+    classes the comm loop uses."""
+    controller = pid.PID(*modulator.controller_gains(kp, ki, kd, 8,
+                                                     modulation),
+                         Output_max=8, Output_min=0)
+    if modulation == modulator.SIGMA_DELTA:
+        heater = modulator.SigmaDeltaModulator(number_of_segments=8)
+    else:
+        heater = freshroastsr700.heat_controller(number_of_segments=8)
+    readings = []
+    levels = []
+    pulse = False
+    previous = None
+    for duration, target_temp, fan_speed in profile:
+        for _ in range(duration * 4):
+            if previous is not None:
+                on, previous_fan = previous
+                model.step(0.25, simulator.ROASTING if on else
+                           simulator.COOLING, previous_fan, 3 if on else 0)
+            previous = (pulse, fan_speed)
+            reading = max(model.reading(), 150)
+            if heater.about_to_rollover():
+                heater.heat_level = controller.update(reading, target_temp)
+            pulse = heater.generate_bangbang_output()
+            readings.append(reading)
+            levels.append(heater.heat_level)
+    return readings, levels
+
+
+@unittest.skipIf(numpy is None, 'numpy not installed')
+class TestSimulate(unittest.TestCase):
+    def test_same_as_the_comm_loop_classes(self):
+        profile = [tuning.ProfileStep(*step) for step in PROFILE]
+        kp, ki, kd = tuning.random_gains(8, seed=1)
+        readings, levels, targets = tuning.simulate(
+            fast_model(), kp, ki, kd, profile)
+        self.assertEqual(readings.shape, (96, 8))
+        self.assertEqual(list(targets), [300] * 48 + [350] * 48)
+        for i in range(8):
+            expected = reference_roast(fast_model(), kp[i], ki[i], kd[i],
+                                       PROFILE)
+            self.assertEqual(list(readings[:, i]), expected[0])
+            self.assertEqual(list(levels[:, i]), expected[1])
+
+    def test_sigma_delta_same_as_the_comm_loop_classes(self):
+        profile = [tuning.ProfileStep(*step) for step in PROFILE]
+        kp, ki, kd = tuning.random_gains(8, seed=2)
+        readings, levels, _ = tuning.simulate(
+            fast_model(), kp, ki, kd, profile,
+            modulation=modulator.SIGMA_DELTA)
+        for i in range(8):
+            expected = reference_roast(fast_model(), kp[i], ki[i], kd[i],
+                                       PROFILE, modulator.SIGMA_DELTA)
+            self.assertEqual(list(readings[:, i]), expected[0])
+            self.assertEqual(list(levels[:, i]), expected[1])
+
+    @unittest.skipIf(not hasattr(os, 'openpty'), 'no ptys')
+    def test_same_as_a_simulated_roaster(self):
+        self.check_simulated_roaster(modulator.TABLE)
+
+    @unittest.skipIf(not hasattr(os, 'openpty'), 'no ptys')
+    def test_sigma_delta_same_as_a_simulated_roaster(self):
+        self.check_simulated_roaster(modulator.SIGMA_DELTA)
+
+    def check_simulated_roaster(self, modulation):
+        kp, ki, kd = 0.1, 0.005, 0.02
+        virtual = clock.VirtualClock(grace=0.02, backend=backend.THREAD)
+        sim = simulator.Simulator()
+        self.addCleanup(sim.close)
+        device = sim.add(model=fast_model(), clock=virtual.monotonic)
+        records = []
+        done = threading.Event()
+        roaster = freshroastsr700.freshroastsr700(
+            port=device.port, thermostat=True, kp=kp, ki=ki, kd=kd,
+            backend=backend.THREAD, clock=virtual,
+            telemetry_func=records.extend, state_transition_func=done.set,
+            modulation=modulation)
+        self.addCleanup(roaster.terminate)
+        roaster.connect()
+        roaster.apply(state='roasting', fan_speed=5, target_temp=350,
+                      time_remaining=12)
+        self.assertTrue(done.wait(20))
+        time.sleep(0.05)
+        idle = telemetry.STATE_CODES['idle']
+        roast = [record for record in records if record.state != idle][:44]
+        readings, levels, _ = tuning.simulate(
+            fast_model(), kp, ki, kd, [tuning.ProfileStep(11, 350, 5)],
+            modulation=modulation)
+        self.assertEqual([record.current_temp for record in roast],
+                         list(readings[:, 0]))
+        # records are taken before the cycle's heater tick, and carry
+        # whole levels
+        self.assertEqual([record.heater_level for record in roast[1:]],
+                         list(numpy.round(levels[:-1, 0])))
+        self.assertGreater(max(levels[:, 0]), 0)
+
+
+@unittest.skipIf(numpy is None, 'numpy not installed')
+class TestSweep(unittest.TestCase):
+    def test_grid(self):
+        kp, ki, kd = tuning.grid([0.1, 0.2], [0.0, 0.01, 0.02], [0.0])
+        self.assertEqual(len(kp), 6)
+        self.assertEqual(sorted(zip(kp, ki, kd))[-1], (0.2, 0.02, 0.0))
+
+    def test_ranked(self):
+        profile = [tuning.ProfileStep(*step) for step in PROFILE]
+        gains = tuning.grid(numpy.linspace(0, 0.3, 7),
+                            numpy.linspace(0, 0.02, 5),
+                            numpy.linspace(0, 0.05, 3))
+        table = tuning.sweep(fast_model(), *gains, profile=profile,
+                             chunk_size=40)
+        self.assertEqual(table.dtype.names, tuning.RESULT_FIELDS)
+        self.assertEqual(len(table), 105)
+        self.assertEqual(list(table['cost']), sorted(table['cost']))
+        # no gain, no heat: the roaster stays below 150degF
+        (cold,) = table[(table['kp'] == 0) & (table['ki'] == 0) &
+                        (table['kd'] == 0)]
+        self.assertEqual(cold['overshoot'], 0)
+        self.assertEqual(cold['settling_time'], 12)
+        self.assertEqual(cold['iae'], (150 * 48 + 200 * 48) * 0.25)
+        best = table[0]
+        self.assertGreater(best['kp'], 0)
+        self.assertLess(best['iae'], cold['iae'] / 2)
+        pooled = tuning.sweep(fast_model(), *gains, profile=profile,
+                              chunk_size=40, processes=2)
+        numpy.testing.assert_array_equal(pooled, table)
+
+    def test_score(self):
+        targets = numpy.array([300.0] * 8 + [350.0] * 8)
+        readings = numpy.column_stack((
+            targets,
+            # 3 cycles to settle in each step, and 4degF over
+            [280, 290, 296, 300, 300, 304, 300, 300,
+             330, 340, 346, 350, 350, 350, 350, 350]))
+        profile = [tuning.ProfileStep(2, 300, 9),
+                   tuning.ProfileStep(2, 350, 9)]
+        overshoot, settling_time, iae, cost = tuning.score(
+            readings, targets, profile)
+        self.assertEqual(list(overshoot), [0, 4])
+        self.assertEqual(list(settling_time), [0, 0.5])
+        self.assertEqual(list(iae), [0, 72 * 0.25])
+        self.assertEqual(cost[0], 0)
+
+    def test_no_gains(self):
+        with self.assertRaises(exceptions.RoasterValueError):
+            tuning.sweep(fast_model(), [], [], [])
+
+
+@unittest.skipIf(numpy is None, 'numpy not installed')
+class TestIdentify(unittest.TestCase):
+    def test_recovers_model(self):
+        model = simulator.ThermalModel(
+            heater_power=(0, 4, 8, 12), loss=0.02, fan_loss=0.003,
+            temp=250)
+        rng = random.Random(5)
+        entries = numpy.zeros(2000, dtype=history.entry_dtype())
+        for i in range(len(entries)):
+            if i % 200 == 0:
+                fan_speed = rng.randint(2, 9)
+            heat_setting = 3 if model.temp < 420 and rng.random() < 0.7 \
+                else 0
+            entries[i]['monotonic'] = i * 0.25
+            entries[i]['current_temp'] = model.reading()
+            entries[i]['heat_setting'] = heat_setting
+            entries[i]['fan_speed'] = fan_speed
+            entries[i]['state'] = telemetry.STATE_CODES['roasting']
+            model.step(0.25, simulator.ROASTING, fan_speed, heat_setting)
+        fitted = tuning.identify(entries)
+        self.assertAlmostEqual(fitted.heater_power[3], 12, delta=0.6)
+        self.assertAlmostEqual(fitted.loss, 0.02, delta=0.002)
+        self.assertAlmostEqual(fitted.fan_loss, 0.003, delta=0.0005)
+
+    def test_not_enough_samples(self):
+        entries = numpy.zeros(10, dtype=history.entry_dtype())
+        with self.assertRaises(exceptions.RoasterValueError):
+            tuning.identify(entries)
@@ -3,12 +3,7 @@
 # Made available under the MIT license.
 
 import unittest
-try:
-    from unittest import mock
-except ImportError:
-    import mock
 from freshroastsr700 import utils
-from freshroastsr700 import exceptions
 
 
 class TestUtils(unittest.TestCase):
@@ -18,24 +13,6 @@ class TestUtils(unittest.TestCase):
 
         self.assertEqual(accepted_range, generated_range)
 
-    @mock.patch(
-        'freshroastsr700.utils.list_ports.comports',
-        return_value=[
-            ['/dev/tty1', 'test_element', '1AB5:5555'],
-            ['/dev/tty2', 'test_element', '1A86:5523']])
-    def test_find_device_with_device_available(self, mock_comports):
-        device_path = utils.find_device('1A86:5523')
-        self.assertEqual(device_path, '/dev/tty2')
-
-    @mock.patch(
-        'freshroastsr700.utils.list_ports.comports',
-        return_value=[
-            ['/dev/tty1', 'test_element', '1AB5:5555'],
-            ['/dev/tty2', 'test_element', '1A86:5523']])
-    def test_find_device_with_device_unavailable(self, mock_comports):
-        with self.assertRaises(exceptions.RoasterLookupError):
-            utils.find_device('1234:5678')
-
     def test_seconds_to_float(self):
         self.assertEqual(6.6, utils.seconds_to_float(394))
 
@@ -44,3 +21,17 @@ class TestUtils(unittest.TestCase):
 
     def test_seconds_to_float_exact(self):
         self.assertEqual(9.9, utils.seconds_to_float(594))
+
+
+class TestSelectableEvent(unittest.TestCase):
+    def test_set_and_clear(self):
+        event = utils.SelectableEvent()
+        self.assertFalse(event.is_set())
+        self.assertFalse(event.wait(0))
+        event.set()
+        event.set()
+        self.assertTrue(event.is_set())
+        self.assertTrue(event.wait(0))
+        event.clear()
+        self.assertFalse(event.is_set())
+        self.assertFalse(event.wait(0))